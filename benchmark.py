@@ -0,0 +1,921 @@
+#!/usr/bin/env python3
+"""服务器模拟性能基准测试
+
+用法:
+    python benchmark.py collision [--bullets 100,500,1000,2000] [--players 8]
+    python benchmark.py numpy [--ticks 2000] [--seed 1] [--tick-rate 50]
+    python benchmark.py protocol [--bullets 0,100,1000]
+    python benchmark.py login [--logins 50] [--rooms 20]
+    python benchmark.py leaderboard [--users 1000,10000,100000]
+    python benchmark.py interest [--players 8,32,64] [--bullets 200]
+    python benchmark.py idle [--rooms 200]
+    python benchmark.py memory [--bullets 1000,5000,20000]
+    python benchmark.py lag [--latency 0,50,100,150,200]
+    python benchmark.py tickrate [--rates 50,30,25,20]
+    python benchmark.py snapshot [--rooms 10,100,500]
+    python benchmark.py spectators [--spectators 0,10,100,1000]
+    python benchmark.py matchmaking [--arrivals 0.5,2,10]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import marshal
+import math
+import random
+import sys
+import time
+import tracemalloc
+import zlib
+
+from game_engine import (
+    Room, new_room, restore_room, MAP_WIDTH, MAP_HEIGHT, HIT_RADIUS, HIT_RADIUS_SQ, BULLET_DAMAGE, MAX_HP,
+    BULLET_SPEED, PLAYER_SPEED, TICK_RATE, REFERENCE_TICK_RATE, MAX_STEP_DT
+)
+from protocol import decode_input, encode_input, encode_state, decode_state
+
+
+def make_room(num_players: int, num_bullets: int, seed: int = 1, backend: str = "dict") -> Room:
+    """构造一个满员、子弹密集的房间"""
+    rng = random.Random(seed)
+    room = new_room("bench", "bench", "p0", max_players=num_players, backend=backend)
+    for i in range(num_players):
+        room.add_player(f"p{i}", None)
+        room.players[f"p{i}"]["hp"] = 10 ** 9  # 避免玩家死亡影响计时
+
+    now = time.time()
+    for _ in range(num_bullets):
+        room.add_bullet({
+            "x": rng.uniform(50, MAP_WIDTH - 50), "y": rng.uniform(50, MAP_HEIGHT - 50),
+            "dx": rng.uniform(-1, 1), "dy": rng.uniform(-1, 1),
+            "owner": f"p{rng.randrange(num_players)}",
+            "hit_set": set(),
+            "start_x": MAP_WIDTH / 2, "start_y": MAP_HEIGHT / 2,
+            "max_dist": 10 ** 6,
+            "created_at": now
+        })
+    return room
+
+
+def naive_collide(room: Room, now: float):
+    """优化前的碰撞检测：玩家 x 子弹全量遍历"""
+    for username, player in room.players.items():
+        for bullet in room.bullets:
+            if bullet.owner != username and username not in (bullet.hit_set or ()):
+                dist = ((player["x"] - bullet.x) ** 2 + (player["y"] - bullet.y) ** 2) ** 0.5
+                if dist < HIT_RADIUS:
+                    player["hp"] -= BULLET_DAMAGE
+                    player["last_hit"] = now
+                    bullet.hit_set = (bullet.hit_set or set()) | {username}
+
+
+def time_ticks(fn, ticks: int) -> float:
+    """返回每帧平均耗时（毫秒）"""
+    start = time.perf_counter()
+    for _ in range(ticks):
+        fn(time.time())
+    return (time.perf_counter() - start) / ticks * 1000
+
+
+def bench_collision(args):
+    print(f"碰撞检测基准: {args.players} 名玩家, 每组 {args.ticks} 帧")
+    print(f"{'子弹数':>8} {'全量遍历(ms)':>14} {'网格索引(ms)':>14} {'整帧step(ms)':>14}")
+    for count in args.bullets:
+        naive_room = make_room(args.players, count)
+        grid_room = make_room(args.players, count)
+        step_room = make_room(args.players, count)
+
+        def grid_collide(now, room=grid_room):
+            bullets = room.bullets
+            room.grid.rebuild_points([b.x for b in bullets], [b.y for b in bullets])
+            for username, player in room.players.items():
+                for i in room.grid.query(player["x"], player["y"], HIT_RADIUS):
+                    bullet = bullets[i]
+                    if bullet.owner != username and username not in (bullet.hit_set or ()):
+                        ddx = player["x"] - bullet.x
+                        ddy = player["y"] - bullet.y
+                        if ddx * ddx + ddy * ddy < HIT_RADIUS * HIT_RADIUS:
+                            bullet.hit_set = (bullet.hit_set or set()) | {username}
+
+        naive_ms = time_ticks(lambda now: naive_collide(naive_room, now), args.ticks)
+        grid_ms = time_ticks(grid_collide, args.ticks)
+        step_ms = time_ticks(step_room.step, args.ticks)
+        print(f"{count:>8} {naive_ms:>14.3f} {grid_ms:>14.3f} {step_ms:>14.3f}")
+
+
+def run_scenario(room: Room, ticks: int, seed: int, players: int = 8, start: float = 1000.0,
+                 tick_rate: int = TICK_RATE, hitch_every: int = 0):
+    """用固定随机种子驱动房间，逐帧产出 (命中事件, 状态)
+
+    时间由参数推进而不是读系统时钟，因此同一种子下不同后端
+    收到的输入完全相同。hitch_every 不为 0 时每隔这么多帧模拟一次卡顿，
+    这一帧推进 MAX_STEP_DT 秒。
+    """
+    rng = random.Random(seed)
+    names = [f"p{i}" for i in range(players)]
+    for name in names:
+        room.add_player(name, None)
+        room.players[name].update({
+            "x": rng.randint(100, MAP_WIDTH-100),
+            "y": rng.randint(100, MAP_HEIGHT-100),
+            "last_hit": start
+        })
+
+    now = start
+    for tick in range(ticks):
+        now += MAX_STEP_DT if hitch_every and tick % hitch_every == hitch_every - 1 else 1 / tick_rate
+        for name in names:
+            player = room.players[name]
+            roll = rng.random()
+            if roll < 0.05:
+                player["dx"] = rng.choice([-6, 0, 6, 4.242640687119285, -4.242640687119285])
+                player["dy"] = rng.choice([-6, 0, 6, 4.242640687119285, -4.242640687119285])
+            elif roll < 0.15 and player["hp"] > 0:
+                angle = rng.uniform(0, 2 * math.pi)
+                speed = rng.uniform(5, 25)
+                room.add_bullet({
+                    "x": player["x"], "y": player["y"],
+                    "dx": speed * math.cos(angle),
+                    "dy": speed * math.sin(angle),
+                    "owner": name,
+                    "hit_set": set(),
+                    "start_x": player["x"], "start_y": player["y"],
+                    "max_dist": rng.choice([200, 800, 1500]),
+                    "created_at": now - rng.choice([0, 0, 9.9]),
+                    "rewind": rng.choice([0, 0, 0, 3, 10])
+                })
+            elif player["hp"] <= 0 and roll < 0.3:
+                player.update({
+                    "x": rng.randint(100, MAP_WIDTH-100),
+                    "y": rng.randint(100, MAP_HEIGHT-100),
+                    "hp": MAX_HP,
+                    "last_hit": now
+                })
+        hits = room.step(now)
+        yield hits, room.get_state()
+
+
+def bench_numpy(args):
+    try:
+        import numpy
+    except ImportError:
+        print("❌ 错误: 未安装 numpy")
+        print("请运行: pip install numpy")
+        sys.exit(1)
+
+    # 差分校验：两个后端逐帧比较命中事件和完整状态
+    dict_room = new_room("diff", "diff", "p0", backend="dict", tick_rate=args.tick_rate)
+    numpy_room = new_room("diff", "diff", "p0", backend="numpy", tick_rate=args.tick_rate)
+    frames = zip(run_scenario(dict_room, args.ticks, args.seed, tick_rate=args.tick_rate),
+                 run_scenario(numpy_room, args.ticks, args.seed, tick_rate=args.tick_rate))
+    total_hits = 0
+    for tick, ((dict_hits, dict_state), (numpy_hits, numpy_state)) in enumerate(frames):
+        total_hits += len(dict_hits)
+        if dict_hits != numpy_hits or dict_state != numpy_state:
+            print(f"❌ 第 {tick} 帧结果不一致")
+            print(f"dict : {dict_hits} {dict_state}")
+            print(f"numpy: {numpy_hits} {numpy_state}")
+            sys.exit(1)
+    print(f"✅ 差分校验通过: {args.ticks} 帧, {total_hits} 次命中, 两个后端结果一致")
+
+    print(f"\n{'子弹数':>8} {'dict(ms)':>10} {'numpy(ms)':>10}")
+    for count in args.bullets:
+        timings = []
+        for backend in ("dict", "numpy"):
+            room = make_room(args.players, count, backend=backend)
+            timings.append(time_ticks(room.step, 100))
+        print(f"{count:>8} {timings[0]:>10.3f} {timings[1]:>10.3f}")
+
+
+def time_calls(fn, repeat: int) -> float:
+    """返回单次调用平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def bench_protocol(args):
+    print("输入消息解码（每条消息）")
+    print(f"{'消息':>8} {'JSON(us)':>10} {'二进制(us)':>12} {'JSON字节':>10} {'二进制字节':>12}")
+    inputs = [
+        {"type": "move", "dx": 4.242640687119285, "dy": -4.242640687119285},
+        {"type": "shoot", "dx": 12.5, "dy": -15.6, "max_dist": 800},
+        {"type": "respawn"}
+    ]
+    for msg in inputs:
+        text = json.dumps(msg)
+        data = encode_input(msg)
+        json_us = time_calls(lambda: json.loads(text), args.repeat)
+        binary_us = time_calls(lambda: decode_input(data), args.repeat)
+        print(f"{msg['type']:>8} {json_us:>10.3f} {binary_us:>12.3f} {len(text):>10} {len(data):>12}")
+
+    print(f"\n状态帧编码（{args.players} 名玩家，每帧）")
+    print(f"{'子弹数':>8} {'JSON(us)':>10} {'二进制(us)':>12} {'JSON字节':>10} {'二进制字节':>12}")
+    for count in args.bullets:
+        room = make_room(args.players, count)
+        room.step(time.time())
+        json_us = time_calls(lambda: json.dumps(room.get_state()), max(args.repeat // 100, 10))
+        binary_us = time_calls(lambda: encode_state(room), max(args.repeat // 100, 10))
+        json_size = len(json.dumps(room.get_state()))
+        binary = encode_state(room)
+        assert len(decode_state(binary)["bullets"]) == len(room.bullets)
+        print(f"{count:>8} {json_us:>10.1f} {binary_us:>12.1f} {json_size:>10} {len(binary):>12}")
+
+
+async def measure_tick_rate(scheduler, rooms, work):
+    """返回 (work 执行期间所有房间的平均实际帧率, 耗时)"""
+    before = sum(scheduler.stats[room.room_id].ticks for room in rooms)
+    start = time.monotonic()
+    await work()
+    elapsed = time.monotonic() - start
+    after = sum(scheduler.stats[room.room_id].ticks for room in rooms)
+    return (after - before) / elapsed / len(rooms), elapsed
+
+
+def bench_login(args):
+    from passwords import PasswordHasher, hash_password, verify_password
+    from scheduler import RoomScheduler
+
+    stored = hash_password("password")
+
+    async def tick(room, now):
+        room.step(now)
+
+    async def run():
+        scheduler = RoomScheduler(tick)
+        rooms = []
+        for i in range(args.rooms):
+            room = make_room(8, 50, seed=i)
+            room.room_id = f"bench{i}"
+            rooms.append(room)
+            scheduler.start(room)
+        await asyncio.sleep(0.5)
+
+        hasher = PasswordHasher(max_pending=args.logins)
+
+        async def idle():
+            await asyncio.sleep(2)
+
+        async def pooled_burst():
+            await asyncio.gather(*(hasher.verify("password", stored) for _ in range(args.logins)))
+
+        async def inline_burst():
+            for _ in range(args.logins):
+                verify_password("password", stored)
+                await asyncio.sleep(0)
+
+        print(f"登录压测: {args.rooms} 个房间, {args.logins} 次并发登录, 线程池 {hasher.workers} 个线程")
+        print(f"{'场景':<16} {'耗时(s)':>8} {'平均帧率(Hz)':>14}")
+        for name, work in (("无登录", idle), ("线程池哈希", pooled_burst), ("事件循环内哈希", inline_burst)):
+            rate, elapsed = await measure_tick_rate(scheduler, rooms, work)
+            print(f"{name:<16} {elapsed:>8.2f} {rate:>14.1f}")
+
+        scheduler.stop_all()
+        hasher.shutdown()
+
+    asyncio.run(run())
+
+
+def bench_leaderboard(args):
+    from leaderboard import LeaderboardIndex, SORT_KEYS, leaderboard_entry
+    from storage import empty_stats
+
+    def full_sort(users, key):
+        score = SORT_KEYS[key]
+        ranked = sorted(users, key=lambda u: (-score(users[u]), u))
+        return [leaderboard_entry(u, users[u]) for u in ranked[:50]]
+
+    rng = random.Random(args.seed)
+    print(f"{'用户数':>8} {'全量排序(us)':>14} {'索引分页(us)':>14} {'索引更新(us)':>14} {'排名查询(us)':>14}")
+    for count in args.users:
+        users = {}
+        index = LeaderboardIndex()
+        for i in range(count):
+            stats = empty_stats()
+            stats["games_played"] = rng.randint(0, 200)
+            stats["wins"] = rng.randint(0, stats["games_played"])
+            stats["kills"] = rng.randint(0, 500)
+            stats["deaths"] = rng.randint(0, 500)
+            users[f"user{i}"] = stats
+            index.update(f"user{i}", stats)
+
+        for key in SORT_KEYS:
+            assert index.page(key) == full_sort(users, key)
+
+        names = list(users)
+        repeat = args.repeat
+
+        def update():
+            name = names[rng.randrange(count)]
+            users[name]["kills"] += 1
+            index.update(name, users[name])
+
+        sort_us = time_calls(lambda: full_sort(users, "kills"), max(repeat // count, 3))
+        page_us = time_calls(lambda: index.page("kills"), repeat)
+        update_us = time_calls(update, repeat)
+        rank_us = time_calls(lambda: index.rank(names[rng.randrange(count)], "kd_ratio"), repeat)
+        print(f"{count:>8} {sort_us:>14.1f} {page_us:>14.1f} {update_us:>14.1f} {rank_us:>14.1f}")
+
+
+def bench_interest(args):
+    """每帧向房间内所有客户端发送的总字节数和编码耗时：完整状态 vs 兴趣区域裁剪"""
+    print(f"每帧广播（{args.bullets} 颗子弹，连续 {args.ticks} 帧取平均）")
+    print(f"{'玩家数':>8} {'完整(KB)':>10} {'兴趣(KB)':>10} {'节省':>8} {'完整(us)':>10} {'兴趣(us)':>10}")
+    for count in args.players:
+        room = make_room(count, args.bullets)
+        now = time.time()
+        full_bytes = interest_bytes = 0
+        full_time = interest_time = 0.0
+        for _ in range(args.ticks):
+            room.step(now)
+            start = time.perf_counter()
+            message = json.dumps(room.get_state())
+            full_time += time.perf_counter() - start
+            full_bytes += len(message) * count
+
+            start = time.perf_counter()
+            room.interest.capture(room)
+            messages = [room.interest.encode_for(username) for username in room.players]
+            interest_time += time.perf_counter() - start
+            interest_bytes += sum(len(m) for m in messages)
+        full_kb = full_bytes / args.ticks / 1024
+        interest_kb = interest_bytes / args.ticks / 1024
+        print(f"{count:>8} {full_kb:>10.1f} {interest_kb:>10.1f} {1 - interest_kb / full_kb:>8.0%} "
+              f"{full_time / args.ticks * 1e6:>10.0f} {interest_time / args.ticks * 1e6:>10.0f}")
+
+
+def bench_idle(args):
+    """大量空闲房间（玩家都没连接或都没动）占用的 CPU：始终全速 vs 降频/休眠"""
+    from scheduler import RoomScheduler
+
+    async def tick(room, now):
+        room.step(now)
+        json.dumps(room.get_state())
+
+    async def run(**options):
+        scheduler = RoomScheduler(tick, **options)
+        for i in range(args.rooms):
+            room = Room(f"idle{i}", "idle", "p0")
+            for j in range(4):
+                room.add_player(f"p{j}", None)
+            scheduler.start(room)
+        await asyncio.sleep(args.warmup)
+        start_cpu, start = time.process_time(), time.monotonic()
+        ticks = sum(stats.ticks for stats in scheduler.stats.values())
+        await asyncio.sleep(args.duration)
+        cpu = (time.process_time() - start_cpu) / (time.monotonic() - start)
+        ticks = sum(stats.ticks for stats in scheduler.stats.values()) - ticks
+        scheduler.stop_all()
+        return cpu, ticks / args.duration
+
+    print(f"{args.rooms} 个空闲房间（每个 4 名未连接的玩家），测量 {args.duration} 秒")
+    print(f"{'调度':<12} {'CPU':>8} {'帧/秒':>10}")
+    for name, options in (("始终全速", {"idle_after": float("inf")}),
+                          ("降频/休眠", {})):
+        cpu, rate = asyncio.run(run(**options))
+        print(f"{name:<12} {cpu:>8.1%} {rate:>10.0f}")
+
+
+def legacy_tick(room: Room, bullets: list, now: float) -> list:
+    """优化前的子弹表示：每颗子弹一个字典（带 hit_set），每帧新建存活列表，
+    get_state 复制每个玩家字典；返回新的子弹列表"""
+    new_bullets = []
+    for bullet in bullets:
+        bullet["x"] += bullet["dx"]
+        bullet["y"] += bullet["dy"]
+        dist_sq = (bullet["x"] - bullet["start_x"]) ** 2 + (bullet["y"] - bullet["start_y"]) ** 2
+        if (0 < bullet["x"] < MAP_WIDTH and 0 < bullet["y"] < MAP_HEIGHT and
+                dist_sq < bullet["max_dist"] ** 2):
+            new_bullets.append(bullet)
+    room._prune_spawns({bullet["id"] for bullet in new_bullets})
+    room.grid.rebuild(new_bullets)
+    for username, player in room.players.items():
+        for i in room.grid.query(player["x"], player["y"], HIT_RADIUS):
+            bullet = new_bullets[i]
+            if bullet["owner"] != username and username not in bullet["hit_set"]:
+                ddx = player["x"] - bullet["x"]
+                ddy = player["y"] - bullet["y"]
+                if ddx * ddx + ddy * ddy < HIT_RADIUS_SQ:
+                    bullet["hit_set"].add(username)
+    state_players = {}
+    for username, player in room.players.items():
+        player_copy = player.copy()
+        player_copy["status"] = "dead" if player_copy["hp"] <= 0 else "alive"
+        state_players[username] = player_copy
+    [{"id": b["id"], "x": b["x"], "y": b["y"], "dx": b["dx"], "dy": b["dy"], "owner": b["owner"]}
+     for b in new_bullets]
+    return new_bullets
+
+
+def bench_memory(args):
+    """子弹持续发射和消失时的内存与 GC 压力：字典子弹 vs __slots__ + 对象池"""
+    print(f"{args.players} 名玩家，子弹存活约 {args.lifetime} 帧，保持数量不变，连续 {args.ticks} 帧")
+    print(f"{'子弹数':>8} {'表示':<14} {'每帧(us)':>10} {'每颗子弹(B)':>12} {'帧内峰值(KB)':>12} "
+          f"{'GC0/千帧':>10} {'GC2':>6}")
+    speed = 10.0
+    for count in args.bullets:
+        per_tick = max(count // args.lifetime, 1)
+        for name in ("字典+复制", "slots+对象池"):
+            room = make_room(args.players, 0)
+            rng = random.Random(args.seed)
+            bullets = []
+
+            def shoot(now):
+                owner = f"p{rng.randrange(args.players)}"
+                x, y = rng.uniform(300, MAP_WIDTH - 300), rng.uniform(300, MAP_HEIGHT - 300)
+                angle = rng.uniform(0, 2 * math.pi)
+                dx, dy = speed * math.cos(angle), speed * math.sin(angle)
+                max_dist = speed * rng.uniform(args.lifetime * 0.5, args.lifetime * 1.5)
+                if name == "slots+对象池":
+                    room.spawn_bullet(owner, x, y, dx, dy, max_dist, now)
+                else:
+                    bullet_id = room._register_bullet(owner, x, y, dx, dy)
+                    bullets.append({
+                        "id": bullet_id, "x": x, "y": y, "dx": dx, "dy": dy, "owner": owner,
+                        "hit_set": set(), "start_x": x, "start_y": y,
+                        "max_dist": max_dist, "created_at": now
+                    })
+
+            def tick(now):
+                nonlocal bullets
+                for _ in range(per_tick):
+                    shoot(now)
+                if name == "slots+对象池":
+                    room.step(now)
+                    room.get_state()
+                else:
+                    bullets = legacy_tick(room, bullets, now)
+
+            # 每颗子弹的内存：一次性发射 count 颗，统计新增的字节数
+            gc.collect()
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            for _ in range(count):
+                shoot(0.0)
+            per_bullet = (tracemalloc.get_traced_memory()[0] - before) / count
+            tracemalloc.stop()
+
+            # 预热到稳定状态后计时，再统计分配块数和 GC 次数
+            now = 1000.0
+            for _ in range(args.lifetime * 2):
+                now += 0.02
+                tick(now)
+            gc.collect()
+            stats_before = gc.get_stats()
+            start = time.perf_counter()
+            for _ in range(args.ticks):
+                now += 0.02
+                tick(now)
+            elapsed = time.perf_counter() - start
+            stats_after = gc.get_stats()
+            gen0 = stats_after[0]["collections"] - stats_before[0]["collections"]
+            gen2 = stats_after[2]["collections"] - stats_before[2]["collections"]
+
+            # 每帧临时分配的峰值：帧内最高占用减去帧开始时的占用
+            tracemalloc.start()
+            transient = 0
+            samples = max(args.ticks // 10, 1)
+            for _ in range(samples):
+                now += 0.02
+                tracemalloc.reset_peak()
+                current = tracemalloc.get_traced_memory()[0]
+                tick(now)
+                transient += tracemalloc.get_traced_memory()[1] - current
+            tracemalloc.stop()
+
+            print(f"{count:>8} {name:<14} {elapsed / args.ticks * 1e6:>10.0f} {per_bullet:>12.0f} "
+                  f"{transient / samples / 1024:>12.0f} {gen0 / args.ticks * 1000:>10.1f} {gen2:>6}")
+
+
+def bench_lag(args):
+    """高延迟射手的命中率：不补偿 vs 按射手看到的帧回溯判定，以及回溯的每帧开销"""
+    print(f"射手向 {args.distance} 像素外上下往返移动的目标提前量射击，每 {args.interval} 帧一发，共 {args.shots} 发")
+    print(f"{'往返延迟(ms)':>12} {'回溯帧数':>8} {'不补偿命中率':>12} {'补偿命中率':>10}")
+    for latency in args.latency:
+        lag = round(latency / 1000 * TICK_RATE)
+        rates = []
+        for compensate in (False, True):
+            room = Room("lag", "lag", "shooter", max_players=2, seed=args.seed)
+            room.add_player("shooter", None)
+            room.add_player("target", None)
+            shooter, target = room.players["shooter"], room.players["target"]
+            shooter.update(x=MAP_WIDTH / 2 - args.distance / 2, y=MAP_HEIGHT / 2, hp=10 ** 9)
+            target.update(x=MAP_WIDTH / 2 + args.distance / 2, y=MAP_HEIGHT / 2, dy=PLAYER_SPEED, hp=10 ** 9)
+            seen = []  # 每帧目标的 (x, y, dy)，射手只能看到 lag 帧之前的
+            hits = 0
+            now = 1000.0
+            for tick in range(args.shots * args.interval):
+                now += 1 / TICK_RATE
+                if abs(target["y"] - MAP_HEIGHT / 2) > 200:
+                    target["dy"] = -PLAYER_SPEED if target["y"] > MAP_HEIGHT / 2 else PLAYER_SPEED
+                if tick % args.interval == 0 and len(seen) > lag:
+                    # 按看到的位置和速度计算提前量
+                    x, y, dy = seen[-1 - lag]
+                    flight = math.hypot(x - shooter["x"], y - shooter["y"]) / BULLET_SPEED
+                    aim_x, aim_y = x - shooter["x"], y + dy * flight - shooter["y"]
+                    scale = BULLET_SPEED / math.hypot(aim_x, aim_y)
+                    room.inputs["shooter"].shots.append(
+                        (aim_x * scale, aim_y * scale, args.distance * 2, lag if compensate else 0))
+                room.apply_inputs(now)
+                hits += len(room.step(now))
+                seen.append((target["x"], target["y"], target["dy"]))
+            rates.append(hits / args.shots)
+        print(f"{latency:>12} {lag:>8} {rates[0]:>12.0%} {rates[1]:>10.0%}")
+
+    print(f"\n每帧 step 耗时（{args.players} 名玩家）")
+    print(f"{'子弹数':>8} {'无回溯(ms)':>12} {'全部回溯(ms)':>14}")
+    for count in args.bullets:
+        timings = []
+        for rewind in (0, 1):
+            room = make_room(args.players, 0)
+            rng = random.Random(args.seed)
+            for _ in range(count):
+                room.spawn_bullet(f"p{rng.randrange(args.players)}", rng.uniform(50, MAP_WIDTH - 50),
+                                  rng.uniform(50, MAP_HEIGHT - 50), rng.uniform(-1, 1), rng.uniform(-1, 1),
+                                  10 ** 6, time.time(), rewind=rng.randint(1, room.max_rewind) * rewind)
+            timings.append(time_ticks(room.step, 100))
+        print(f"{count:>8} {timings[0]:>12.3f} {timings[1]:>14.3f}")
+
+
+def bench_tickrate(args):
+    """降低模拟帧率：子弹穿透（终点检测 vs 服务器实际的判定）和每个房间的 CPU 占用"""
+    print(f"向 {args.distance} 像素外静止的目标射击 {args.shots} 发，横向偏移在命中半径以内（理应全部命中）")
+    print(f"一帧推进超过一个 {REFERENCE_TICK_RATE} Hz 帧时服务器按扫掠检测判定，否则仍按终点判定（与原来的结果一致）")
+    print(f"{'帧率':>6} {'每帧飞行(px)':>12} {'判定方式':>8} {'终点检测命中率':>14} {'服务器命中率':>12}")
+    for rate in args.rates:
+        room = Room("tick", "tick", "shooter", max_players=2, seed=args.seed, tick_rate=rate)
+        room.add_player("shooter", None)
+        room.add_player("target", None)
+        sx, tx, y = MAP_WIDTH / 2 - args.distance / 2, MAP_WIDTH / 2 + args.distance / 2, MAP_HEIGHT / 2
+        room.players["shooter"].update(x=sx, y=y)
+        room.players["target"].update(x=tx, y=y, hp=10 ** 9)
+        rng = random.Random(args.seed)
+        point_hits = set()  # 某一帧终点落在命中半径内的子弹（终点检测）
+        server_hits = 0
+        now = 1000.0
+        flight = BULLET_SPEED * TICK_RATE / rate  # 子弹每帧飞行的距离
+        interval = round(args.distance / flight) + 2  # 上一发飞过目标后再射下一发
+        for tick in range(args.shots * interval):
+            now += 1 / rate
+            if tick % interval == 0:
+                # 出发点前后错开，子弹每帧的终点相对目标的位置随机
+                room.spawn_bullet("shooter", sx + rng.uniform(0, flight),
+                                  y + rng.uniform(-HIT_RADIUS, HIT_RADIUS) * 0.99,
+                                  BULLET_SPEED, 0, args.distance * 2, now)
+            server_hits += len(room.step(now))
+            for bullet in room.bullets:
+                if (bullet.x - tx) ** 2 + (bullet.y - y) ** 2 < HIT_RADIUS_SQ:
+                    point_hits.add(bullet.id)
+        mode = "扫掠" if rate < REFERENCE_TICK_RATE else "终点"
+        print(f"{rate:>6} {flight:>12.0f} {mode:>8} {len(point_hits) / args.shots:>14.0%} "
+              f"{server_hits / args.shots:>12.0%}")
+
+    print(f"\n每个房间每秒游戏时间的 CPU 耗时（{args.players} 名玩家，step + 序列化完整状态）")
+    print(f"{'帧率':>6} " + " ".join(f"{f'{count}颗子弹(ms)':>14}" for count in args.bullets) + f" {'相对50Hz':>10}")
+    baseline = None
+    for rate in args.rates:
+        costs = []
+        for count in args.bullets:
+            room = make_room(args.players, 0)
+            room.tick_rate = rate
+            rng = random.Random(args.seed)
+            for _ in range(count):
+                room.spawn_bullet(f"p{rng.randrange(args.players)}", rng.uniform(50, MAP_WIDTH - 50),
+                                  rng.uniform(50, MAP_HEIGHT - 50), rng.uniform(-1, 1), rng.uniform(-1, 1),
+                                  10 ** 6, 1000.0)
+            for player in room.players.values():
+                player["dx"], player["dy"] = rng.choice([-PLAYER_SPEED, 0, PLAYER_SPEED]), PLAYER_SPEED
+            now = 1000.0
+            ticks = int(args.seconds * rate)
+            start = time.perf_counter()
+            for _ in range(ticks):
+                now += 1 / rate
+                room.apply_inputs(now)
+                room.step(now)
+                room.state_json()
+            costs.append((time.perf_counter() - start) / args.seconds * 1000)
+        if baseline is None:
+            baseline = costs
+        relative = sum(costs) / sum(baseline)
+        print(f"{rate:>6} " + " ".join(f"{cost:>14.1f}" for cost in costs) + f" {relative:>10.0%}")
+
+
+def bench_snapshot(args):
+    """运行状态快照：采集（占用事件循环）、编码写入与读取恢复的耗时，marshal vs JSON"""
+    import snapshot
+    from session_store import SessionStore
+    print(f"每个房间 {args.players} 名玩家、{args.bullets} 颗子弹，每个房间 {args.players} 个会话")
+    print("采集和 marshal 编码在事件循环中执行，压缩和写盘在线程池中执行")
+    print(f"{'房间数':>6} {'采集(ms)':>9} {'marshal编码(ms)':>15} {'压缩(ms)':>9} {'JSON编码(ms)':>13} {'大小(KB)':>9} "
+          f"{'JSON大小(KB)':>12} {'解码+恢复(ms)':>13}")
+    for count in args.rooms:
+        rooms, sessions, user_rooms = {}, SessionStore(), {}
+        for i in range(count):
+            room = make_room(args.players, args.bullets, seed=i)
+            room.room_id = f"room{i}"
+            rooms[room.room_id] = room
+            for name in room.players:
+                sessions.add(f"token-{i}-{name}", f"{name}@{i}")
+                user_rooms[f"{name}@{i}"] = room.room_id
+
+        start = time.perf_counter()
+        state = asyncio.run(snapshot.capture(rooms, sessions, user_rooms))
+        capture_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        raw = marshal.dumps(state)
+        encode_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        data = snapshot.pack(raw, time.time())
+        pack_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        json_data = zlib.compress(json.dumps(state).encode(), 1)
+        json_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        _, loaded = snapshot.decode(data)
+        for room_state in loaded["rooms"]:
+            restore_room(room_state)
+        restore_ms = (time.perf_counter() - start) * 1000
+        print(f"{count:>6} {capture_ms:>9.1f} {encode_ms:>15.1f} {pack_ms:>9.1f} {json_ms:>13.1f} {len(data) / 1024:>9.0f} "
+              f"{len(json_data) / 1024:>12.0f} {restore_ms:>13.1f}")
+
+
+class NullWebSocket:
+    async def send_text(self, payload):
+        pass
+
+    async def send_bytes(self, payload):
+        pass
+
+
+def bench_spectators(args):
+    """观战者的开销：每人按玩家连接逐帧发送 vs 共享的低帧率观战广播"""
+    from outbox import Outbox
+    from spectators import SpectatorStream
+
+    async def run(count: int, shared: bool):
+        room = make_room(args.players, args.bullets)
+        stream = SpectatorStream(room, args.rate)
+        outboxes = [Outbox(NullWebSocket(), rate=args.rate) for _ in range(count)]
+        every = max(round(TICK_RATE / args.rate), 1)
+        now = 1000.0
+        step_time = broadcast_time = 0.0
+        ticks = int(TICK_RATE * args.seconds)
+        for t in range(ticks):
+            now += 1 / TICK_RATE
+            start = time.perf_counter()
+            room.step(now)
+            step_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            message = None
+            if not shared:
+                message = room.state_json()
+            elif t % every == 0:
+                stream._capture(now)
+                message = stream._due(now)
+            if message is not None and outboxes:
+                for outbox in outboxes:
+                    outbox.push_state(message)
+                await asyncio.sleep(0)  # 让写任务发出队列中的消息
+            broadcast_time += time.perf_counter() - start
+        for outbox in outboxes:
+            await outbox.close()
+        return step_time / args.seconds * 1000, broadcast_time / args.seconds * 1000
+
+    print(f"{args.players} 名玩家、{args.bullets} 颗子弹的房间，观战广播 {args.rate:g} Hz，"
+          f"每秒 CPU 耗时（ms/s），测量 {args.seconds:g} 秒模拟时间")
+    print(f"{'观战人数':>8} {'模拟':>8} {'逐帧发送':>10} {'共享观战':>10} {'节省':>8}")
+    for count in args.spectators:
+        sim, per_player = asyncio.run(run(count, shared=False))
+        _, shared = asyncio.run(run(count, shared=True))
+        saved = 1 - shared / per_player if per_player else 0.0
+        print(f"{count:>8} {sim:>8.1f} {per_player:>10.1f} {shared:>10.1f} {saved:>8.0%}")
+
+
+def room_tick_costs(room_size: int, rooms: int, seconds: float) -> list:
+    """k 名玩家的房间每帧的 CPU 耗时（毫秒，包括调度器的开销），下标为玩家数
+
+    用 RoomScheduler 同时运行 rooms 个房间，按进程 CPU 时间除以总帧数计算。
+    """
+    from scheduler import RoomScheduler
+
+    async def tick(room, now):
+        room.step(now)
+        room.state_json()
+
+    async def measure(count: int) -> float:
+        scheduler = RoomScheduler(tick, idle_after=float("inf"))
+        for i in range(rooms):
+            room = make_room(count, count * 5, seed=i)
+            room.room_id = f"room{i}"
+            scheduler.start(room)
+        await asyncio.sleep(0.5)
+        ticks = sum(stats.ticks for stats in scheduler.stats.values())
+        start_cpu = time.process_time()
+        await asyncio.sleep(seconds)
+        cpu = time.process_time() - start_cpu
+        ticks = sum(stats.ticks for stats in scheduler.stats.values()) - ticks
+        scheduler.stop_all()
+        return cpu / ticks * 1000 if ticks else 0.0
+
+    return [0.0] + [asyncio.run(measure(count)) for count in range(1, room_size + 1)]
+
+
+def bench_matchmaking(args):
+    """手动选房 vs 自动匹配：房间的平均人数、每名玩家分摊的模拟 CPU 与排队时间"""
+    from matchmaking import Matchmaker, OpenRoom, MATCH_INTERVAL, percentile
+
+    costs = room_tick_costs(args.room_size, args.rooms, args.measure)
+
+    async def simulate(rate: float, auto: bool):
+        rng = random.Random(args.seed)
+        rooms = {}  # {room_id: 玩家数}
+        leaving = []  # [(离开时间, room_id)]
+        matchmaker = Matchmaker(args.room_size)
+        next_room = 0
+        room_seconds = player_seconds = cpu = 0.0
+        next_arrival = rng.expovariate(rate)
+        now = 0.0
+        while now < args.seconds:
+            now += MATCH_INTERVAL
+            for left in [entry for entry in leaving if entry[0] <= now]:
+                leaving.remove(left)
+                rooms[left[1]] -= 1
+                if not rooms[left[1]]:
+                    del rooms[left[1]]
+
+            arrivals = 0
+            while next_arrival <= now:
+                arrivals += 1
+                next_arrival += rng.expovariate(rate)
+
+            placed = []  # 本轮放进房间的玩家所在的房间
+            if auto:
+                for _ in range(arrivals):
+                    matchmaker.enqueue(f"p{rng.random()}", 0.0).enqueued_at = now
+                open_rooms = [OpenRoom(room_id, args.room_size - count, None)
+                              for room_id, count in rooms.items() if count < args.room_size]
+                fills, groups = matchmaker.plan(open_rooms, now)
+                for room_id, tickets in fills:
+                    for ticket in tickets:
+                        matchmaker.complete(ticket, room_id, now, new_room=False)
+                        placed.append(room_id)
+                for tickets in groups:
+                    room_id, next_room = next_room, next_room + 1
+                    rooms[room_id] = 0
+                    matchmaker.rooms_opened += 1
+                    for ticket in tickets:
+                        matchmaker.complete(ticket, room_id, now, new_room=True)
+                        placed.append(room_id)
+            else:
+                # 手动：一部分玩家自己开房间，其余随机加入列表中未满的房间
+                for _ in range(arrivals):
+                    open_rooms = [room_id for room_id, count in rooms.items() if count < args.room_size]
+                    if not open_rooms or rng.random() < args.create:
+                        room_id, next_room = next_room, next_room + 1
+                        rooms[room_id] = 0
+                    else:
+                        room_id = rng.choice(open_rooms)
+                    rooms[room_id] += 1
+                    leaving.append((now + rng.expovariate(1 / args.session), room_id))
+            for room_id in placed:
+                rooms[room_id] += 1
+                leaving.append((now + rng.expovariate(1 / args.session), room_id))
+
+            room_seconds += len(rooms) * MATCH_INTERVAL
+            player_seconds += sum(rooms.values()) * MATCH_INTERVAL
+            cpu += sum(costs[count] for count in rooms.values()) * TICK_RATE * MATCH_INTERVAL
+        waits = sorted(matchmaker.waits)
+        return (player_seconds / room_seconds if room_seconds else 0.0,
+                cpu / player_seconds if player_seconds else 0.0,
+                percentile(waits, 0.5), percentile(waits, 0.9), percentile(waits, 0.99))
+
+    print(f"房间人数上限 {args.room_size}，平均每局 {args.session:g} 秒，模拟 {args.seconds:g} 秒；"
+          f"手动选房时 {args.create:.0%} 的玩家自己开房间")
+    print(f"每帧耗时(ms)，按玩家数: {' '.join(f'{cost:.3f}' for cost in costs[1:])}")
+    print(f"{'到达(人/秒)':>10} {'方式':<8} {'每房间人数':>10} {'每人CPU(ms/s)':>14} "
+          f"{'排队p50(s)':>11} {'p90(s)':>8} {'p99(s)':>8}")
+    for rate in args.arrivals:
+        for name, auto in (("手动选房", False), ("自动匹配", True)):
+            per_room, per_player, p50, p90, p99 = asyncio.run(simulate(rate, auto))
+            print(f"{rate:>10g} {name:<8} {per_room:>10.2f} {per_player:>14.2f} "
+                  f"{p50:>11.2f} {p90:>8.2f} {p99:>8.2f}")
+
+
+def parse_counts(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PixelWarzone 服务器基准测试")
+    sub = parser.add_subparsers(dest="command")
+
+    p = sub.add_parser("collision", help="碰撞检测耗时 vs 子弹数量")
+    p.add_argument("--bullets", type=parse_counts, default=[100, 500, 1000, 2000, 5000])
+    p.add_argument("--players", type=int, default=8)
+    p.add_argument("--ticks", type=int, default=200)
+    p.set_defaults(func=bench_collision)
+
+    p = sub.add_parser("numpy", help="dict/numpy 后端差分校验与耗时对比")
+    p.add_argument("--ticks", type=int, default=2000)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--bullets", type=parse_counts, default=[100, 1000, 5000])
+    p.add_argument("--players", type=int, default=8)
+    p.add_argument("--tick-rate", type=int, default=TICK_RATE, help="差分校验使用的模拟帧率")
+    p.set_defaults(func=bench_numpy)
+
+    p = sub.add_parser("protocol", help="JSON 与二进制协议编解码对比")
+    p.add_argument("--bullets", type=parse_counts, default=[0, 100, 1000])
+    p.add_argument("--players", type=int, default=8)
+    p.add_argument("--repeat", type=int, default=20000)
+    p.set_defaults(func=bench_protocol)
+
+    p = sub.add_parser("login", help="登录洪峰期间的模拟帧率")
+    p.add_argument("--logins", type=int, default=50)
+    p.add_argument("--rooms", type=int, default=20)
+    p.set_defaults(func=bench_login)
+
+    p = sub.add_parser("leaderboard", help="排行榜全量排序 vs 增量索引")
+    p.add_argument("--users", type=parse_counts, default=[1000, 10000, 100000])
+    p.add_argument("--repeat", type=int, default=2000)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_leaderboard)
+
+    p = sub.add_parser("interest", help="完整状态广播 vs 兴趣区域裁剪的出口流量")
+    p.add_argument("--players", type=parse_counts, default=[8, 32, 64, 128])
+    p.add_argument("--bullets", type=int, default=200)
+    p.add_argument("--ticks", type=int, default=50)
+    p.set_defaults(func=bench_interest)
+
+    p = sub.add_parser("idle", help="空闲房间的 CPU 占用：始终全速 vs 降频/休眠")
+    p.add_argument("--rooms", type=int, default=200)
+    p.add_argument("--warmup", type=float, default=1.5)
+    p.add_argument("--duration", type=float, default=3.0)
+    p.set_defaults(func=bench_idle)
+
+    p = sub.add_parser("memory", help="子弹表示的内存占用与 GC 压力")
+    p.add_argument("--bullets", type=parse_counts, default=[1000, 5000, 20000])
+    p.add_argument("--players", type=int, default=8)
+    p.add_argument("--lifetime", type=int, default=40)
+    p.add_argument("--ticks", type=int, default=500)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_memory)
+
+    p = sub.add_parser("lag", help="延迟补偿对高延迟玩家命中率的影响")
+    p.add_argument("--latency", type=parse_counts, default=[0, 50, 100, 150, 200, 300])
+    p.add_argument("--distance", type=int, default=500)
+    p.add_argument("--interval", type=int, default=25)
+    p.add_argument("--shots", type=int, default=200)
+    p.add_argument("--bullets", type=parse_counts, default=[100, 1000, 5000])
+    p.add_argument("--players", type=int, default=8)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_lag)
+
+    p = sub.add_parser("tickrate", help="降低模拟帧率时的子弹穿透与 CPU 占用")
+    p.add_argument("--rates", type=parse_counts, default=[50, 30, 25, 20])
+    p.add_argument("--distance", type=int, default=500)
+    p.add_argument("--shots", type=int, default=500)
+    p.add_argument("--bullets", type=parse_counts, default=[100, 1000])
+    p.add_argument("--players", type=int, default=8)
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_tickrate)
+
+    p = sub.add_parser("snapshot", help="运行状态快照的采集、编码与恢复耗时")
+    p.add_argument("--rooms", type=parse_counts, default=[10, 100, 500])
+    p.add_argument("--players", type=int, default=8)
+    p.add_argument("--bullets", type=int, default=50)
+    p.set_defaults(func=bench_snapshot)
+
+    p = sub.add_parser("spectators", help="观战者的广播开销：逐帧发送 vs 共享观战广播")
+    p.add_argument("--spectators", type=parse_counts, default=[0, 10, 100, 1000])
+    p.add_argument("--rate", type=float, default=10, help="观战广播的帧率")
+    p.add_argument("--players", type=int, default=8)
+    p.add_argument("--bullets", type=int, default=50)
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.set_defaults(func=bench_spectators)
+
+    p = sub.add_parser("matchmaking", help="手动选房 vs 自动匹配的房间人数、每人 CPU 与排队时间")
+    p.add_argument("--arrivals", type=lambda v: [float(x) for x in v.split(",") if x], default=[0.5, 2, 10],
+                   help="每秒到达的玩家数")
+    p.add_argument("--room-size", type=int, default=8)
+    p.add_argument("--session", type=float, default=120.0, help="平均每局时长（秒）")
+    p.add_argument("--create", type=float, default=0.3, help="手动选房时自己开房间的玩家比例")
+    p.add_argument("--seconds", type=float, default=1800.0)
+    p.add_argument("--rooms", type=int, default=20, help="测量每帧耗时时同时运行的房间数")
+    p.add_argument("--measure", type=float, default=1.0, help="测量每种人数的房间的时长（秒）")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_matchmaking)
+
+    args = parser.parse_args()
+    if not getattr(args, "func", None):
+        parser.print_help()
+        sys.exit(1)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,36 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import uvicorn
 import asyncio
-import random
 import json
 import time
-import hashlib
+import os
 import uuid
+from time import perf_counter
 from typing import Optional, Dict, List
 import logging
 
+from game_engine import TICK_RATE, MAX_ROOM_PLAYERS, Room, new_room, restore_room
+from inputs import TokenBucket, MESSAGE_BURST, MAX_DROPPED_PER_SECOND, message_rate
+from scheduler import RoomScheduler
+from protocol import BINARY_SUBPROTOCOL, decode_input, encode_state
+from outbox import Outbox
+from storage import open_storage, empty_stats, StatsWriteBehind
+from passwords import PasswordHasher, HasherBusy
+from session_store import SessionStore
+from leaderboard import LeaderboardIndex, SORT_KEYS, PAGE_SIZE
+from metrics import metrics
+from cluster import open_cluster, ROLES, BROKER_ADDRESS, BROKER_TOKEN_ENV, SHARD_HEARTBEAT, STATS_SYNC_INTERVAL
+from replay import ReplayRecorder
+from snapshot import SnapshotWriter, RESUME_GRACE, capture as capture_snapshot, read_file as read_snapshot
+from handoff import HandoffListener, request_handoff
+from spectators import SpectatorStream, SPECTATOR_RATE, SPECTATOR_DELAY
+from matchmaking import Matchmaker, OpenRoom, skill_rating, MATCH_INTERVAL, ROOM_SIZE as MATCH_ROOM_SIZE_DEFAULT, POLL_TIMEOUT
+from room_directory import RoomDirectory, PAGE_SIZE as ROOM_PAGE_SIZE, MAX_PAGE_SIZE as ROOM_MAX_PAGE_SIZE
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -42,7 +61,7 @@ class LoginRequest(BaseModel):
 
 class CreateRoomRequest(BaseModel):
     room_name: str
-    max_players: int = 8
+    max_players: int = Field(8, ge=2, le=MAX_ROOM_PLAYERS)
     password: Optional[str] = None
 
 class JoinRoomRequest(BaseModel):
@@ -54,87 +73,195 @@ class AdminRequest(BaseModel):
 
 # 全局数据存储
 users_db: Dict = {}  # {username: {password_hash, email, stats, created_at}}
-sessions: Dict = {}  # {session_token: {username, created_at}}
+sessions = SessionStore()  # {session_token: {username, created_at}}，带过期堆和在线集合
 rooms: Dict = {}  # {room_id: Room}
 user_rooms: Dict = {}  # {username: room_id}
+leaderboard = LeaderboardIndex()  # 随统计变化增量更新的排行榜
+room_directory = RoomDirectory()  # 大厅房间列表索引，随房间变化增量更新
+lobby_clients = set()  # 订阅大厅推送的连接（Outbox）
+spectator_streams: Dict = {}  # {room_id: SpectatorStream}，有观战者的房间才有
 
-MAP_WIDTH = 1920
-MAP_HEIGHT = 1080
-
-class Room:
-    def __init__(self, room_id: str, name: str, creator: str, max_players: int = 8, password: str = None):
-        self.room_id = room_id
-        self.name = name
-        self.creator = creator
-        self.max_players = max_players
-        self.password = password
-        self.players = {}  # {username: player_data}
-        self.bullets = []
-        self.connections = {}  # {username: websocket}
-        self.game_running = False
-        self.created_at = time.time()
-        
-    def add_player(self, username: str, websocket: WebSocket):
-        if len(self.players) >= self.max_players:
-            return False
-            
-        self.players[username] = {
-            "x": random.randint(100, MAP_WIDTH-100),
-            "y": random.randint(100, MAP_HEIGHT-100),
-            "dx": 0,
-            "dy": 0,
-            "hp": 1000,
-            "last_hit": time.time(),
-            "kills": 0,
-            "deaths": 0
-        }
-        self.connections[username] = websocket
-        return True
-        
-    def remove_player(self, username: str):
-        self.players.pop(username, None)
-        self.connections.pop(username, None)
-        
-        # 如果房间空了，标记为待删除
-        if not self.players and self.game_running:
-            self.game_running = False
-            
-    def get_state(self):
-        # 增加 status 字段
-        state_players = {}
-        for username, player in self.players.items():
-            player_copy = player.copy()
-            player_copy["status"] = "dead" if player_copy["hp"] <= 0 else "alive"
-            # 保证 hp 字段始终存在
-            player_copy["hp"] = max(0, int(player_copy.get("hp", 0)))
-            state_players[username] = player_copy
-        return {
-            "players": state_players,
-            "bullets": self.bullets,
-            "room_info": {
-                "name": self.name,
-                "player_count": len(self.players),
-                "max_players": self.max_players
-            }
-        }
+LOBBY_PUSH_INTERVAL = 0.5  # 大厅变化合并推送的间隔（秒）
+LOBBY_MAX_BACKLOG = 16  # 大厅连接积压这么多条未发送的消息则断开，客户端重连后拿到完整列表
 
-# 辅助函数
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+# 没有任何 WebSocket 连接超过这么久（秒）的房间会被删除，例如创建后从未连接的房间
+ROOM_GC_AFTER = float(os.environ.get("PW_ROOM_GC_SECONDS", 300))
+ROOM_GC_INTERVAL = 10
+
+# 持久化：sqlite（默认，WAL 模式）或 memory（不落盘）
+STORAGE_BACKEND = os.environ.get("PW_STORAGE", "sqlite")
+DB_PATH = os.environ.get("PW_DB_PATH", "pixelwarzone.db")
+
+# 部署角色：standalone（单进程，默认）、router（只负责登录、大厅和排行榜，不运行房间）、
+# shard（运行路由进程分配给自己的房间）或 node（对等节点，运行在自己上面创建的房间）。
+# 集群模式下用户、会话、统计、房间归属和玩家所在房间都通过集群后端共享
+CLUSTER_ROLE = os.environ.get("PW_ROLE", "standalone")
+CLUSTER_BACKEND = os.environ.get("PW_CLUSTER_BACKEND", "sqlite")
+SHARD_ID = os.environ.get("PW_SHARD_ID", f"shard-{os.getpid()}")
+SHARD_HOST = os.environ.get("PW_SHARD_HOST")  # 客户端连接本分片/节点使用的 host:port
+if CLUSTER_ROLE not in ROLES:
+    raise RuntimeError(f"未知的 PW_ROLE: {CLUSTER_ROLE}")
+RUNS_ROOMS = CLUSTER_ROLE in ("shard", "node")  # 本进程运行集群中的房间
+SERVES_LOBBY = CLUSTER_ROLE in ("router", "node")  # 本进程提供集群的大厅和排行榜
+cluster = None
+if CLUSTER_ROLE != "standalone":
+    if CLUSTER_BACKEND == "sqlite" and STORAGE_BACKEND != "sqlite":
+        raise RuntimeError("sqlite 集群后端需要 PW_STORAGE=sqlite")
+    if RUNS_ROOMS and not SHARD_HOST:
+        raise RuntimeError("分片和节点进程需要设置 PW_SHARD_HOST")
+    cluster = open_cluster(CLUSTER_BACKEND, DB_PATH, os.environ.get("PW_BROKER_ADDR", BROKER_ADDRESS),
+                           os.environ.get(BROKER_TOKEN_ENV))
+    STORAGE_BACKEND = f"cluster:{CLUSTER_BACKEND}"
+
+# 集群模式下集群后端同时就是持久化存储
+storage = cluster or open_storage(STORAGE_BACKEND, DB_PATH)
+stats_buffer = StatsWriteBehind(storage)
+
+# 密码哈希在独立线程池中执行，不阻塞游戏循环
+hasher = PasswordHasher()
 
+# 模拟后端：dict（默认）或 numpy，按部署通过环境变量切换
+SIM_BACKEND = os.environ.get("PW_SIM_BACKEND", "dict")
+if SIM_BACKEND == "numpy":
+    try:
+        import numpy_backend
+    except ImportError:
+        logger.warning("numpy 未安装，回退到 dict 模拟后端")
+        SIM_BACKEND = "dict"
+
+# 模拟帧率：默认 50 Hz。子弹按扫掠检测、移动按真实经过的时间缩放，
+# 调低到 20-30 Hz 不改变游戏速度，也不会让子弹穿过玩家，每个房间的 CPU 占用随之减少
+SIM_TICK_RATE = int(os.environ.get("PW_TICK_RATE", TICK_RATE))
+if not 10 <= SIM_TICK_RATE <= 120:
+    raise RuntimeError(f"PW_TICK_RATE 应在 10 到 120 之间: {SIM_TICK_RATE}")
+
+# 观战：每个房间的观战者共享一路广播，帧率和延迟（秒）可以按部署调整
+SPECTATOR_STREAM_RATE = float(os.environ.get("PW_SPECTATOR_RATE", SPECTATOR_RATE))
+SPECTATOR_STREAM_DELAY = float(os.environ.get("PW_SPECTATOR_DELAY", SPECTATOR_DELAY))
+if not 0 < SPECTATOR_STREAM_RATE <= SIM_TICK_RATE:
+    raise RuntimeError(f"PW_SPECTATOR_RATE 应在 0 到模拟帧率之间: {SPECTATOR_STREAM_RATE}")
+if SPECTATOR_STREAM_DELAY < 0:
+    raise RuntimeError(f"PW_SPECTATOR_DELAY 不能为负数: {SPECTATOR_STREAM_DELAY}")
+
+# 自动匹配：PW_MATCH_ROOM_SIZE 为匹配创建的房间的人数上限，PW_MATCH_SKILL=1 时按水平匹配
+MATCH_ROOM_SIZE = int(os.environ.get("PW_MATCH_ROOM_SIZE", MATCH_ROOM_SIZE_DEFAULT))
+if not 2 <= MATCH_ROOM_SIZE <= MAX_ROOM_PLAYERS:
+    raise RuntimeError(f"PW_MATCH_ROOM_SIZE 应在 2 到 {MAX_ROOM_PLAYERS} 之间: {MATCH_ROOM_SIZE}")
+MATCH_SKILL = os.environ.get("PW_MATCH_SKILL", "0") == "1"
+MATCH_CONNECT_TIMEOUT = 30  # 匹配成功后这么久（秒）仍未连接的玩家离开房间
+matchmaker = Matchmaker(MATCH_ROOM_SIZE, MATCH_SKILL)
+match_pending: Dict = {}  # {username: (room_id, 放入房间的时间)}，匹配成功、等待连接的玩家
+
+# 对局录像：设置 PW_REPLAY_DIR 后每个房间的输入写入该目录，可用 replay.py 回放
+REPLAY_DIR = os.environ.get("PW_REPLAY_DIR")
+recorder = ReplayRecorder(REPLAY_DIR) if REPLAY_DIR else None
+
+# 运行状态快照：设置 PW_SNAPSHOT_PATH 后定时保存房间、会话和玩家所在房间，重启后恢复；
+# 再设置 PW_HANDOFF_SOCKET 后新进程可以直接接管旧进程的监听 socket（见 handoff.py）
+SNAPSHOT_PATH = os.environ.get("PW_SNAPSHOT_PATH")
+HANDOFF_SOCKET = os.environ.get("PW_HANDOFF_SOCKET")
+if (SNAPSHOT_PATH or HANDOFF_SOCKET) and cluster:
+    raise RuntimeError("快照和进程交接只支持单进程部署（PW_ROLE=standalone）")
+if HANDOFF_SOCKET and not SNAPSHOT_PATH:
+    raise RuntimeError("进程交接需要设置 PW_SNAPSHOT_PATH")
+preserving_rooms = False  # 已写入最终快照，之后断开的连接不再把玩家移出房间
+listen_socket = None  # 通过 python bs_server.py 启动时的监听 socket，交接时发给新进程
+game_server = None
+handoff_listener = None
+
+async def capture_state() -> Dict:
+    # 用户保存在持久化存储中时不需要放进快照
+    users = users_db if STORAGE_BACKEND == "memory" else None
+    return await capture_snapshot(rooms, sessions, user_rooms, users)
+
+snapshots = SnapshotWriter(SNAPSHOT_PATH, capture_state) if SNAPSHOT_PATH else None
+
+# 辅助函数
 def generate_token() -> str:
     return str(uuid.uuid4())
 
 def get_user_by_session(session_token: str) -> Optional[str]:
-    session = sessions.get(session_token)
-    if session and time.time() - session["created_at"] < 86400:  # 24小时过期
-        return session["username"]
-    return None
+    username = sessions.get_username(session_token)  # 24小时过期
+    if username:
+        sessions.touch(username)
+    return username
+
+async def resolve_session(session_token: str) -> Optional[str]:
+    """同 get_user_by_session，集群模式下本地没有的会话从集群后端读取"""
+    username = get_user_by_session(session_token)
+    if username or not cluster:
+        return username
+    session = await asyncio.to_thread(storage.get_session, session_token)
+    if not session:
+        return None
+    sessions.add(session_token, session["username"], session["created_at"])
+    return get_user_by_session(session_token)
+
+async def find_user(username: str) -> Optional[Dict]:
+    """查找用户，集群模式下本地没有的用户（在其他进程上注册）从集群后端读取并缓存"""
+    user = users_db.get(username)
+    if user or not cluster:
+        return user
+    user = await asyncio.to_thread(storage.get_user, username)
+    if not user:
+        return None
+    user = users_db.setdefault(username, user)
+    leaderboard.update(username, user["stats"])
+    return user
+
+async def get_user_room(username: str) -> Optional[str]:
+    if cluster:
+        return await asyncio.to_thread(cluster.get_user_room, username)
+    return user_rooms.get(username)
+
+async def set_user_room(username: str, room_id: str):
+    if cluster:
+        await asyncio.to_thread(cluster.set_user_room, username, room_id)
+    else:
+        user_rooms[username] = room_id
+
+async def pop_user_room(username: str):
+    if cluster:
+        await asyncio.to_thread(cluster.pop_user_room, username)
+    else:
+        user_rooms.pop(username, None)
+
+async def room_changed(room: Room):
+    """房间人数变化后唤醒房间（可能已降频或休眠）并更新大厅目录，
+    集群模式下写入集群后端，由各个提供大厅的进程同步"""
+    scheduler.wake(room.room_id)
+    if cluster:
+        await asyncio.to_thread(cluster.set_room_players, room.room_id, len(room.players))
+    else:
+        room_directory.update(room)
+
+async def create_session(username: str) -> str:
+    session_token = generate_token()
+    session = sessions.add(session_token, username)
+    sessions.touch(username)
+    await asyncio.to_thread(storage.add_session, session_token, session)
+    return session_token
+
+def record_stats(username: str, **deltas):
+    """更新内存中的统计，并交给写回缓冲异步落盘
+
+    集群模式下本进程不一定加载了该用户，此时只写集群后端，由提供排行榜的进程同步。
+    """
+    user = users_db.get(username)
+    if user:
+        stats = user["stats"]
+        for field, amount in deltas.items():
+            stats[field] += amount
+        if deltas.keys() - {"total_damage"}:
+            leaderboard.update(username, stats)
+    elif not cluster:
+        return
+    stats_buffer.add(username, deltas)
 
 async def verify_session(session_token: str = None) -> str:
     if not session_token:
         raise HTTPException(status_code=401, detail="Session token required")
-    username = get_user_by_session(session_token)
+    username = await resolve_session(session_token)
     if not username:
         raise HTTPException(status_code=401, detail="Invalid or expired session")
     return username
@@ -142,32 +269,33 @@ async def verify_session(session_token: str = None) -> str:
 # 认证API
 @app.post("/api/register")
 async def register(request: RegisterRequest):
-    if request.username in users_db:
+    if await find_user(request.username):
         return {"success": False, "error": "用户名已存在"}
     
     if len(request.username) > 16:
         return {"success": False, "error": "用户名过长"}
     
+    try:
+        password_hash = await hasher.hash(request.password)
+    except HasherBusy:
+        return {"success": False, "error": "服务器繁忙，请稍后再试"}
+
+    # 哈希期间可能已有同名用户注册
+    if await find_user(request.username):
+        return {"success": False, "error": "用户名已存在"}
+
     # 创建用户
     users_db[request.username] = {
-        "password_hash": hash_password(request.password),
+        "password_hash": password_hash,
         "email": request.email,
-        "stats": {
-            "games_played": 0,
-            "wins": 0,
-            "kills": 0,
-            "deaths": 0,
-            "total_damage": 0
-        },
+        "stats": empty_stats(),
         "created_at": time.time()
     }
+    leaderboard.update(request.username, users_db[request.username]["stats"])
+    await asyncio.to_thread(storage.add_user, request.username, users_db[request.username])
     
     # 创建会话
-    session_token = generate_token()
-    sessions[session_token] = {
-        "username": request.username,
-        "created_at": time.time()
-    }
+    session_token = await create_session(request.username)
     
     logger.info(f"User registered: {request.username}")
     return {
@@ -179,16 +307,27 @@ async def register(request: RegisterRequest):
 
 @app.post("/api/login")
 async def login(request: LoginRequest):
-    user = users_db.get(request.username)
-    if not user or user["password_hash"] != hash_password(request.password):
-        return {"success": False, "error": "用户名或密码错误"}
+    user = await find_user(request.username)
+
+    try:
+        if not user:
+            # 用户不存在时同样执行一次校验，响应时间不暴露用户名是否已注册
+            await hasher.verify_missing(request.password)
+            return {"success": False, "error": "用户名或密码错误"}
+        ok, needs_rehash = await hasher.verify(request.password, user["password_hash"])
+        if not ok:
+            return {"success": False, "error": "用户名或密码错误"}
+
+        # 旧版 SHA-256 或参数过时的哈希在登录成功时透明升级
+        if needs_rehash:
+            user["password_hash"] = await hasher.hash(request.password)
+            await asyncio.to_thread(storage.update_password, request.username, user["password_hash"])
+            logger.info(f"Upgraded password hash for {request.username}")
+    except HasherBusy:
+        return {"success": False, "error": "服务器繁忙，请稍后再试"}
     
     # 创建会话
-    session_token = generate_token()
-    sessions[session_token] = {
-        "username": request.username,
-        "created_at": time.time()
-    }
+    session_token = await create_session(request.username)
     
     logger.info(f"User logged in: {request.username}")
     return {
@@ -202,11 +341,11 @@ async def login(request: LoginRequest):
 async def get_user_info_by_path(session_token: str):
     """通过路径参数获取用户信息 - 兼容前端调用"""
     try:
-        username = get_user_by_session(session_token)
+        username = await resolve_session(session_token)
         if not username:
             return {"success": False, "error": "Invalid or expired session"}
         
-        user = users_db.get(username)
+        user = await find_user(username)
         if not user:
             return {"success": False, "error": "User not found"}
         
@@ -215,7 +354,7 @@ async def get_user_info_by_path(session_token: str):
             "username": username,
             "email": user["email"],
             "stats": user["stats"],
-            "current_room": user_rooms.get(username),
+            "current_room": await get_user_room(username),
             "created_at": user.get("created_at", time.time()),
             "last_login": user.get("last_login", time.time())
         }
@@ -229,22 +368,19 @@ async def create_room(request: CreateRoomRequest, session_token: str = Query(...
     username = await verify_session(session_token)
     
     # 检查用户是否已在房间中
-    if username in user_rooms:
+    if await get_user_room(username):
         return {"success": False, "error": "你已经在一个房间中"}
     
     room_id = generate_token()[:8]
-    room = Room(
-        room_id=room_id,
-        name=request.room_name,
-        creator=username,
-        max_players=request.max_players,
-        password=request.password
-    )
-    rooms[room_id] = room
+    if cluster:
+        return await create_cluster_room(room_id, request, username)
+
+    room = start_room(room_id, request.room_name, username, request.max_players, request.password)
     user_rooms[username] = room_id
 
     # 自动把玩家加入房间（但不传websocket，先用None占位）
     room.add_player(username, None)
+    room_directory.update(room)
 
     logger.info(f"Room created: {room_id} by {username}")
     return {
@@ -260,24 +396,72 @@ async def create_room(request: CreateRoomRequest, session_token: str = Query(...
         }
     }
 
+def start_room(room_id: str, name: str, creator: str, max_players: int, password: Optional[str] = None) -> Room:
+    """创建本进程运行的房间并开始模拟"""
+    room = new_room(
+        room_id=room_id,
+        name=name,
+        creator=creator,
+        max_players=max_players,
+        password=password,
+        backend=SIM_BACKEND,
+        tick_rate=SIM_TICK_RATE
+    )
+    rooms[room_id] = room
+    if recorder:
+        recorder.start(room)
+    scheduler.start(room)
+    return room
+
+async def create_cluster_room(room_id: str, request: CreateRoomRequest, username: str):
+    """集群模式：路由进程把房间分配给负载最低的分片，节点把房间放在自己上面，
+    房间在第一个玩家连接时才真正创建"""
+    if CLUSTER_ROLE == "node":
+        shard = {"shard_id": SHARD_ID, "host": SHARD_HOST}
+    else:
+        shard = await asyncio.to_thread(cluster.pick_shard)
+    if not shard:
+        return {"success": False, "error": "没有可用的游戏服务器"}
+
+    room = {
+        "room_id": room_id,
+        "name": request.room_name,
+        "creator": username,
+        "max_players": request.max_players,
+        "password": request.password,
+        "shard_id": shard["shard_id"],
+        "created_at": time.time()
+    }
+    await asyncio.to_thread(cluster.add_room, room)
+    await set_user_room(username, room_id)
+
+    logger.info(f"Room created: {room_id} by {username} on {shard['shard_id']}")
+    return {
+        "success": True,
+        "room_id": room_id,
+        "ws_host": shard["host"],
+        "room": {
+            "id": room_id,
+            "name": room["name"],
+            "creator": username,
+            "player_count": 0,
+            "max_players": room["max_players"],
+            "has_password": bool(room["password"])
+        }
+    }
+
 @app.get("/api/rooms")
-async def get_rooms():
-    room_list = []
-    for room in rooms.values():
-        room_list.append({
-            "id": room.room_id,
-            "name": room.name,
-            "creator": room.creator,
-            "player_count": len(room.players),
-            "max_players": room.max_players,
-            "has_password": bool(room.password),
-            "created_at": room.created_at
-        })
-    
-    # 按创建时间排序
-    room_list.sort(key=lambda x: x["created_at"], reverse=True)
-    # 返回rooms数组
-    return {"rooms": room_list}  
+async def get_rooms(request: Request, response: Response,
+                    cursor: Optional[str] = None,
+                    limit: int = Query(ROOM_PAGE_SIZE, ge=1, le=ROOM_MAX_PAGE_SIZE),
+                    has_password: Optional[bool] = None,
+                    not_full: bool = False):
+    """按创建时间从新到旧分页返回房间列表，列表未变化时返回 304"""
+    etag = room_directory.etag(cursor, limit, has_password, not_full)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return room_directory.query(cursor, limit, has_password, not_full)
 
 @app.post("/api/rooms/{room_id}/join")
 async def join_room_by_path(room_id: str, request: JoinRoomRequest, session_token: str = Query(..., description="用户会话令牌")):
@@ -288,87 +472,217 @@ async def join_room_by_path(room_id: str, request: JoinRoomRequest, session_toke
     # if username in user_rooms:
     #     return {"success": False, "error": "你已经在一个房间中"}
     
-    room = rooms.get(room_id)
+    if cluster:
+        room = await asyncio.to_thread(cluster.get_room, room_id)
+    else:
+        room = rooms.get(room_id)
+        if room:
+            room = {"player_count": len(room.players), "max_players": room.max_players,
+                    "password": room.password}
     if not room:
         return {"success": False, "error": "房间不存在"}
+
+    if CLUSTER_ROLE == "node" and room["shard_id"] != SHARD_ID:
+        # 房间在其他节点上：重定向到该节点，由它检查人数和密码
+        return await redirect_join(room_id, room["shard_id"], session_token)
     
-    if len(room.players) >= room.max_players:
+    if room["player_count"] >= room["max_players"]:
         return {"success": False, "error": "房间已满"}
     
-    if room.password and room.password != request.password:
+    if room["password"] and room["password"] != request.password:
         return {"success": False, "error": "房间密码错误"}
     
-    user_rooms[username] = room_id
+    await set_user_room(username, room_id)
     
     logger.info(f"User {username} joined room {room_id}")
-    return {
+    result = {
         "success": True,
         "room_id": room_id,
         "username": username
     }
+    if cluster:
+        # 客户端应连接房间所在分片/节点的 /ws/{room_id}
+        result["ws_host"] = await asyncio.to_thread(cluster.shard_host, room["shard_id"])
+    return result
+
+async def redirect_join(room_id: str, shard_id: str, session_token: str):
+    """307 重定向保留方法和请求体（房间密码），浏览器的 fetch 会自动跟随"""
+    host = await asyncio.to_thread(cluster.shard_host, shard_id)
+    if not host:
+        return {"success": False, "error": "房间所在的服务器不可用"}
+    location = f"http://{host}/api/rooms/{room_id}/join?session_token={session_token}"
+    return JSONResponse(
+        status_code=307,
+        headers={"Location": location},
+        content={"success": False, "error": "房间在其他服务器上", "redirect": location, "ws_host": host}
+    )
+
+# 自动匹配：请求最多等待 POLL_TIMEOUT 秒，还没有分配到房间时返回 queued，客户端再次请求即可，
+# 排队时间从第一次请求算起。分配到房间后和加入房间一样连接 /ws/{room_id}
+@app.post("/api/matchmaking/join")
+async def matchmaking_join(session_token: str = Query(..., description="用户会话令牌")):
+    username = await verify_session(session_token)
+    if cluster:
+        return {"success": False, "error": "集群模式暂不支持自动匹配"}
+    if await get_user_room(username):
+        return {"success": False, "error": "你已经在一个房间中"}
+
+    user = await find_user(username)
+    ticket = matchmaker.enqueue(username, skill_rating(user.get("stats", empty_stats())) if user else 0.0)
+    done, room_id = await matchmaker.wait(ticket, POLL_TIMEOUT)
+    if not done:
+        return {"success": False, "queued": True, "queue_size": len(matchmaker),
+                "waited": round(time.monotonic() - ticket.enqueued_at, 1)}
+    if not room_id:
+        return {"success": False, "error": "已取消匹配"}
+    return {"success": True, "room_id": room_id, "username": username}
+
+@app.post("/api/matchmaking/cancel")
+async def matchmaking_cancel(session_token: str = Query(..., description="用户会话令牌")):
+    username = await verify_session(session_token)
+    if not matchmaker.cancel(username):
+        return {"success": False, "error": "你不在匹配队列中"}
+    return {"success": True}
+
+def room_rating(room: Room) -> Optional[float]:
+    """房间内玩家的平均水平"""
+    ratings = [skill_rating(users_db[username].get("stats", empty_stats()))
+               for username in room.players if username in users_db]
+    return sum(ratings) / len(ratings) if ratings else None
+
+async def run_matchmaking():
+    """处理一批排队的玩家：补满已有的公开房间，再为剩下的玩家开新房间"""
+    now = time.monotonic()
+    await release_unconnected_matches(now)
+    if not matchmaker.tickets:
+        return
+
+    open_rooms = [
+        OpenRoom(room.room_id, room.max_players - len(room.players),
+                 room_rating(room) if MATCH_SKILL else None)
+        for room in rooms.values()
+        if not room.password and len(room.players) < room.max_players
+    ]
+    fills, groups = matchmaker.plan(open_rooms, now)
+    for room_id, tickets in fills:
+        room = rooms.get(room_id)
+        if room:
+            await place_matched(room, tickets, now, new_room=False)
+    for tickets in groups:
+        room_id = generate_token()[:8]
+        room = start_room(room_id, f"匹配房间 {room_id}", tickets[0].username, MATCH_ROOM_SIZE)
+        matchmaker.rooms_opened += 1
+        await place_matched(room, tickets, now, new_room=True)
+        logger.info(f"Matchmaking opened room {room_id} for {len(tickets)} players")
+
+async def place_matched(room: Room, tickets: List, now: float, new_room: bool):
+    placed = False
+    for ticket in tickets:
+        if user_rooms.get(ticket.username):
+            matchmaker.cancel(ticket.username)  # 排队期间自己加入了其他房间
+            continue
+        if not room.add_player(ticket.username, None):
+            break  # 排队期间房间已满，剩下的玩家留在队列中
+        user_rooms[ticket.username] = room.room_id
+        match_pending[ticket.username] = (room.room_id, now)
+        matchmaker.complete(ticket, room.room_id, now, new_room)
+        placed = True
+    if placed:
+        await room_changed(room)
+    elif new_room:
+        await delete_room(room.room_id)
+
+async def release_unconnected_matches(now: float):
+    """匹配成功后 MATCH_CONNECT_TIMEOUT 秒仍未连接的玩家离开房间，空出名额"""
+    for username, (room_id, placed_at) in list(match_pending.items()):
+        room = rooms.get(room_id)
+        if not room or username not in room.players or room.connections.get(username) is not None:
+            del match_pending[username]
+        elif now - placed_at > MATCH_CONNECT_TIMEOUT:
+            del match_pending[username]
+            await release_player(room, username)
+            logger.info(f"Player {username} did not connect to matched room {room_id}")
+
+async def matchmaking_loop():
+    while True:
+        await asyncio.sleep(MATCH_INTERVAL)
+        try:
+            await run_matchmaking()
+        except Exception as e:
+            logger.error(f"Matchmaking error: {e}")
 
 @app.post("/api/rooms/leave")
 async def leave_room(session_token: str = Query(..., description="用户会话令牌")):
     username = await verify_session(session_token)
     
-    room_id = user_rooms.get(username)
+    room_id = await get_user_room(username)
     if not room_id:
         return {"success": False, "error": "你不在任何房间中"}
     
     room = rooms.get(room_id)
     if room:
         room.remove_player(username)
+        await room_changed(room)
         
         # 如果房间空了，删除房间
         if not room.players:
-            rooms.pop(room_id, None)
+            await delete_room(room_id)
             logger.info(f"Room {room_id} deleted (empty)")
     
-    user_rooms.pop(username, None)
+    await pop_user_room(username)
+    if cluster and not room:
+        # 房间在其他分片/节点上：没有人连接也没有人加入时删除
+        info = await asyncio.to_thread(cluster.get_room, room_id)
+        if info and info["player_count"] == 0 and not await asyncio.to_thread(cluster.room_members, room_id):
+            await asyncio.to_thread(cluster.remove_room, room_id)
+            logger.info(f"Room {room_id} deleted (empty)")
     logger.info(f"User {username} left room {room_id}")
     return {"success": True}
 
 @app.get("/api/leaderboard")
-async def get_leaderboard():
-    """获取排行榜"""
-    leaderboard = []
-    for username, user_data in users_db.items():
-        stats = user_data["stats"]
-        leaderboard.append({
-            "username": username,
-            "kills": stats["kills"],
-            "deaths": stats["deaths"],
-            "wins": stats["wins"],
-            "games_played": stats["games_played"],
-            "kd_ratio": round(stats["kills"] / max(stats["deaths"], 1), 2),
-            "win_rate": round(stats["wins"] / max(stats["games_played"], 1) * 100, 1)
-        })
-    
-    # 按击杀数排序
-    leaderboard.sort(key=lambda x: x["kills"], reverse=True)
-    return {"success": True, "leaderboard": leaderboard[:50]}  # 前50名
+async def get_leaderboard(sort: str = "kills", offset: int = Query(0, ge=0),
+                          limit: int = Query(PAGE_SIZE, ge=1, le=100)):
+    """获取排行榜（默认按击杀数排序的前50名）"""
+    if sort not in SORT_KEYS:
+        return {"success": False, "error": f"不支持的排序方式: {sort}"}
+    return {
+        "success": True,
+        "sort": sort,
+        "offset": offset,
+        "total": len(leaderboard),
+        "leaderboard": leaderboard.page(sort, offset, limit)
+    }
+
+@app.get("/api/leaderboard/rank")
+async def get_leaderboard_rank(session_token: str = Query(..., description="用户会话令牌"),
+                               sort: str = "kills"):
+    """查询自己的排名"""
+    username = await verify_session(session_token)
+    if sort not in SORT_KEYS:
+        return {"success": False, "error": f"不支持的排序方式: {sort}"}
+    return {
+        "success": True,
+        "username": username,
+        "sort": sort,
+        "rank": leaderboard.rank(username, sort),
+        "total": len(leaderboard)
+    }
 
 @app.get("/api/online-players")
 async def get_online_players():
     """获取在线玩家"""
     online_players = []
-    current_time = time.time()
+    online = sessions.online_users()
+    in_rooms = await asyncio.to_thread(cluster.user_room_map, online) if cluster else user_rooms
     
-    for session_token, session in sessions.items():
-        if current_time - session["created_at"] < 300:  # 5分钟内活跃
-            username = session["username"]
-            user_data = users_db.get(username, {})
-            online_players.append({
-                "username": username,
-                "in_game": username in user_rooms,
-                "stats": user_data.get("stats", {
-                    "games_played": 0,
-                    "wins": 0,
-                    "kills": 0,
-                    "deaths": 0,
-                    "total_damage": 0
-                })
-            })
+    # 只遍历5分钟内有活动的用户
+    for username in online:
+        user_data = users_db.get(username, {})
+        online_players.append({
+            "username": username,
+            "in_game": username in in_rooms,
+            "stats": user_data.get("stats", empty_stats())
+        })
     
     return {"success": True, "online_players": online_players, "count": len(online_players)}
 
@@ -385,7 +699,7 @@ async def clear_database(request: AdminRequest):
         "users": len(users_db),
         "sessions": len(sessions),
         "rooms": len(rooms),
-        "user_rooms": len(user_rooms),
+        "user_rooms": await asyncio.to_thread(cluster.count_user_rooms) if cluster else len(user_rooms),
         "total_players": sum(len(room.players) for room in rooms.values())
     }
     
@@ -396,12 +710,27 @@ async def clear_database(request: AdminRequest):
                 await ws.close(code=4200, reason="Database clearing")
             except:
                 pass
+    for stream in spectator_streams.values():
+        await stream.close(code=4200, reason="Database clearing")
+    spectator_streams.clear()
+    for username in list(matchmaker.tickets):
+        matchmaker.cancel(username)
+    match_pending.clear()
     
     # 清空所有数据
+    scheduler.stop_all()
+    for room_id in rooms:
+        metrics.forget_room(room_id)
+    if recorder:
+        await recorder.close()
     users_db.clear()
+    leaderboard.clear()
     sessions.clear()
     rooms.clear()
+    room_directory.clear()
     user_rooms.clear()
+    stats_buffer.discard()
+    await asyncio.to_thread(storage.clear)
     
     logger.info(f"Database cleared - Stats before: {stats_before}")
     return {
@@ -420,209 +749,614 @@ async def get_database_stats(request: AdminRequest):
         "users_count": len(users_db),
         "active_sessions": len(sessions),
         "active_rooms": len(rooms),
-        "users_in_rooms": len(user_rooms),
+        "users_in_rooms": await asyncio.to_thread(cluster.count_user_rooms) if cluster else len(user_rooms),
         "total_players_online": sum(len(room.players) for room in rooms.values()),
+        "cluster": {
+            "role": CLUSTER_ROLE,
+            "backend": CLUSTER_BACKEND if cluster else None,
+            "shard_id": SHARD_ID if RUNS_ROOMS else None,
+            "shards": await asyncio.to_thread(cluster.shards) if cluster else []
+        },
+        "storage": {
+            "backend": STORAGE_BACKEND,
+            "pending_stats": len(stats_buffer.pending),
+            "flushes": stats_buffer.flushes,
+            "last_flush": stats_buffer.last_flush
+        },
+        "replay": {
+            "directory": REPLAY_DIR,
+            "recording_rooms": len(recorder.recordings),
+            "bytes_written": recorder.bytes_written,
+            "flushes": recorder.flushes
+        } if recorder else None,
+        "snapshot": snapshots.stats() if snapshots else None,
+        "matchmaking": matchmaker.stats(),
         "room_details": [
             {
                 "id": room.room_id,
                 "name": room.name,
                 "players": len(room.players),
-                "creator": room.creator
+                "creator": room.creator,
+                "tick": scheduler.get_stats(room.room_id),
+                "spectators": spectator_streams[room.room_id].stats() if room.room_id in spectator_streams else None,
+                "connections": {
+                    username: outbox.stats() for username, outbox in room.outboxes.items()
+                }
             } for room in rooms.values()
         ]
     }
 
 # WebSocket游戏逻辑
+# 大厅推送：连接后先收到完整房间列表，之后只收到合并后的变化
+@app.websocket("/ws/lobby")
+async def lobby_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    outbox = Outbox(websocket)
+    outbox.push_event(json.dumps({
+        "type": "rooms",
+        "version": room_directory.version,
+        "rooms": room_directory.snapshot()
+    }))
+    lobby_clients.add(outbox)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    except Exception:
+        pass
+    finally:
+        lobby_clients.discard(outbox)
+        await outbox.close()
+
+async def lobby_push_loop():
+    while True:
+        await asyncio.sleep(LOBBY_PUSH_INTERVAL)
+        changes = room_directory.drain_changes()
+        if not changes or not lobby_clients:
+            continue
+        payload = json.dumps({"type": "rooms_changed", **changes})
+        for outbox in list(lobby_clients):
+            if len(outbox.queue) >= LOBBY_MAX_BACKLOG:
+                lobby_clients.discard(outbox)
+                asyncio.create_task(outbox.close(code=4008, reason="Connection too slow"))
+            else:
+                outbox.push_event(payload)
+
 @app.websocket("/ws/{room_id}")
-async def websocket_endpoint(websocket: WebSocket, room_id: str, session_token: str = Query(...)):
+async def websocket_endpoint(websocket: WebSocket, room_id: str, session_token: str = Query(...),
+                             protocol: str = Query("json", description="json（完整状态）、delta（增量）、binary（二进制）或 interest（按兴趣区域裁剪）")):
     try:
-        username = get_user_by_session(session_token)
+        username = await resolve_session(session_token)
         if not username:
             await websocket.close(code=4001, reason="Invalid session")
             return
 
         # 检查用户是否在该房间
-        if user_rooms.get(username) != room_id:
+        if await get_user_room(username) != room_id:
             await websocket.close(code=4002, reason="Not in this room")
             return
 
         room = rooms.get(room_id)
+        if not room and RUNS_ROOMS:
+            room = await load_shard_room(room_id)
         if not room:
             await websocket.close(code=4003, reason="Room not found")
             return
 
-        await websocket.accept()
+        # 二进制协议可通过 protocol 参数或 WebSocket 子协议协商
+        subprotocols = websocket.scope.get("subprotocols", [])
+        if BINARY_SUBPROTOCOL in subprotocols:
+            protocol = "binary"
+            await websocket.accept(subprotocol=BINARY_SUBPROTOCOL)
+        else:
+            await websocket.accept()
 
-        # 添加玩家到房间
-        if not room.add_player(username, websocket):
+        # 添加玩家到房间；从快照恢复的房间里，重新连接的玩家回到原来的位置
+        resumed = room.resume_player(username, websocket)
+        if not resumed and not room.add_player(username, websocket):
             await websocket.close(code=4004, reason="Room is full")
             return
+        await room_changed(room)
+        room.protocols[username] = protocol if protocol in ("json", "delta", "binary", "interest") else "json"
+        outbox = Outbox(websocket, rate=room.tick_rate)
+        room.outboxes[username] = outbox
+
+        logger.info(f"Player {username} {'resumed' if resumed else 'connected to'} room {room_id}")
 
-        logger.info(f"Player {username} connected to room {room_id}")
+        # 每个连接的消息速率限制，在解析之前检查，超出的消息直接丢弃
+        message_bucket = TokenBucket(message_rate(room.tick_rate), MESSAGE_BURST, time.monotonic())
+        dropped = 0
+        dropped_since = 0.0
 
         try:
             while True:
-                data = await websocket.receive_text()
-                try:
-                    msg = json.loads(data)
-                except:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+
+                received_at = time.monotonic()
+                if message.get("bytes") is not None:
+                    metrics.record_in(len(message["bytes"]))
+                else:
+                    metrics.record_in(len(message.get("text") or ""))
+                if not message_bucket.take(received_at):
+                    metrics.messages_dropped += 1
+                    if received_at - dropped_since >= 1:
+                        dropped_since, dropped = received_at, 0
+                    dropped += 1
+                    if dropped > MAX_DROPPED_PER_SECOND:
+                        logger.warning(f"Player {username} flooding room {room_id}, disconnecting")
+                        await websocket.close(code=1008, reason="Too many messages")
+                        raise WebSocketDisconnect(1008)
                     continue
 
-                if msg.get("type") == "move":
-                    dx, dy = msg.get("dx", 0), msg.get("dy", 0)
-                    if username in room.players:
-                        room.players[username]["dx"] = dx
-                        room.players[username]["dy"] = dy
-
-                elif msg.get("type") == "shoot":
-                    if username in room.players:
-                        player = room.players[username]
-                        dx = msg.get("dx", player["dx"] or 10)
-                        dy = msg.get("dy", player["dy"] or 0)
-                        max_dist = msg.get("max_dist", 800)
-
-                        room.bullets.append({
-                            "x": player["x"], "y": player["y"],
-                            "dx": dx, "dy": dy,
-                            "owner": username,
-                            "hit_set": [],
-                            "start_x": player["x"], "start_y": player["y"],
-                            "max_dist": max_dist,
-                            "created_at": time.time()
-                        })
-                        player["last_hit"] = time.time()
-
-                elif msg.get("type") == "respawn":
-                    if username in room.players and room.players[username]["hp"] <= 0:
-                        room.players[username].update({
-                            "x": random.randint(100, MAP_WIDTH-100),
-                            "y": random.randint(100, MAP_HEIGHT-100),
-                            "hp": 1000,
-                            "last_hit": time.time()
-                        })
+                if message.get("bytes") is not None:
+                    msg = decode_input(message["bytes"])
+                else:
+                    try:
+                        msg = json.loads(message.get("text") or "")
+                    except:
+                        continue
+                if not isinstance(msg, dict):
+                    continue
+                sessions.touch(username)
+                if msg.get("type") != "ack":
+                    # 玩家输入立即唤醒降频或休眠的房间；ack 每帧都有，不算输入
+                    scheduler.wake(room_id)
+
+                if msg.get("type") == "ack":
+                    room.delta.ack(username, msg.get("tick"))
+
+                elif not room.handle_input(username, msg):
+                    # move/shoot/respawn 先校验并缓冲，下一帧开始时统一生效
+                    metrics.inputs_rejected += 1
 
         except WebSocketDisconnect:
             pass
         finally:
-            # 清理连接
-            if username in room.players:
-                player_data = room.players[username]
-                if username in users_db:
-                    user_stats = users_db[username]["stats"]
-                    user_stats["games_played"] += 1
-                    user_stats["kills"] += player_data["kills"]
-                    user_stats["deaths"] += player_data["deaths"]
-                    if len(room.players) <= 1 or player_data["kills"] > 0:
-                        user_stats["wins"] += 1
-
-            room.remove_player(username)
-            logger.info(f"Player {username} disconnected from room {room_id}")
-
-            if not room.players:
-                rooms.pop(room_id, None)
-                logger.info(f"Room {room_id} deleted (empty)")
-
-            user_rooms.pop(username, None)
+            # 清理连接；已写入最终快照时玩家留在房间里，由恢复后的进程接着运行
+            await outbox.close()
+            if preserving_rooms:
+                room.connections.pop(username, None)
+                room.outboxes.pop(username, None)
+            else:
+                await release_player(room, username)
+                logger.info(f"Player {username} disconnected from room {room_id}")
 
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
         await websocket.close(code=4500, reason="Server error")
 
+# 观战：不占玩家名额，不参与模拟，同一房间的观战者共享一路序列化好的状态广播
+@app.websocket("/ws/{room_id}/spectate")
+async def spectate_endpoint(websocket: WebSocket, room_id: str, session_token: str = Query(...),
+                            password: Optional[str] = Query(None)):
+    username = await resolve_session(session_token)
+    if not username:
+        await websocket.close(code=4001, reason="Invalid session")
+        return
+
+    room = rooms.get(room_id)
+    if not room and RUNS_ROOMS:
+        room = await load_shard_room(room_id)
+    if not room:
+        await websocket.close(code=4003, reason="Room not found")
+        return
+    if room.password and room.password != password:
+        await websocket.close(code=4005, reason="Wrong password")
+        return
+
+    stream = spectator_streams.get(room_id)
+    if stream is None:
+        stream = spectator_streams[room_id] = SpectatorStream(
+            room, SPECTATOR_STREAM_RATE, SPECTATOR_STREAM_DELAY)
+    if stream.full():
+        await websocket.close(code=4004, reason="Too many spectators")
+        return
+
+    await websocket.accept()
+    outbox = Outbox(websocket, rate=SPECTATOR_STREAM_RATE)
+    stream.add(outbox)
+    logger.info(f"{username} spectating room {room_id}")
+    try:
+        # 观战者发来的消息一律忽略，只等待断开
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    except Exception:
+        pass
+    finally:
+        stream.remove(outbox)
+        await outbox.close()
+        if not stream and spectator_streams.get(room_id) is stream:
+            del spectator_streams[room_id]
+
+async def release_player(room: Room, username: str):
+    """玩家离开房间：结算本局统计、移出房间，房间空了就删除"""
+    if username in room.players:
+        player_data = room.players[username]
+        won = len(room.players) <= 1 or player_data["kills"] > 0
+        record_stats(
+            username,
+            games_played=1,
+            kills=player_data["kills"],
+            deaths=player_data["deaths"],
+            wins=1 if won else 0
+        )
+
+    room.remove_player(username)
+    if not room.outboxes:
+        room.empty_since = time.time()
+    await room_changed(room)
+
+    if not room.players:
+        await delete_room(room.room_id)
+        logger.info(f"Room {room.room_id} deleted (empty)")
+
+    await pop_user_room(username)
+
 # 游戏主循环
-async def game_loop():
+async def room_tick(room: Room, now: float):
+    """单个房间的一帧：模拟、结算统计、广播状态"""
+    if not room.players:
+        return
+
+    start = perf_counter()
+    room.apply_inputs(now)
+    hits = room.step(now)
+    stats_start = perf_counter()
+
+    # 更新伤害和击杀统计
+    dead_players = set()
+    for hit in hits:
+        owner = hit["owner"]
+        record_stats(owner, total_damage=hit["damage"])
+        if hit["killed"]:
+            dead_players.add(hit["target"])
+            record_stats(owner, kills=1)
+
+    # 处理死亡玩家 - 不立即踢出，而是通知死亡
+    for username in dead_players:
+        outbox = room.outboxes.get(username)
+        if outbox:
+            outbox.push_event(json.dumps({"type": "death", "message": "你已死亡！按R重生"}))
+
+    broadcast_start = perf_counter()
+    serialize = 0.0
+
+    # 广播游戏状态：旧客户端收完整状态，delta 客户端收关键帧/增量，
+    # binary 客户端收二进制状态帧，interest 客户端只收附近的玩家和子弹；
+    # 同一种消息（或消息片段）每帧只序列化一次。
+    # 消息只放入各连接的发送队列，慢连接不会阻塞模拟帧
+    if room.outboxes:
+        binary_message = None
+        protocols = set(room.protocols.values())
+        t = perf_counter()
+        if "delta" in protocols:
+            room.delta.capture(room)
+        if "interest" in protocols:
+            room.interest.capture(room)
+        serialize += perf_counter() - t
+
+        for username, outbox in list(room.outboxes.items()):
+            protocol = room.protocols.get(username)
+            t = perf_counter()
+            if protocol == "binary":
+                if binary_message is None:
+                    binary_message = encode_state(room)
+                message = binary_message
+            elif protocol == "delta":
+                message = room.delta.encode_for(username)
+            elif protocol == "interest":
+                message = room.interest.encode_for(username)
+            else:
+                message = room.state_json()
+            serialize += perf_counter() - t
+            outbox.push_state(message)
+
+    end = perf_counter()
+    metrics.observe_tick(
+        room.room_id,
+        room.phase_times + (broadcast_start - stats_start, serialize, end - broadcast_start - serialize),
+        end - start,
+        room.bullet_count()
+    )
+
+scheduler = RoomScheduler(room_tick, tick_rate=SIM_TICK_RATE)
+
+async def delete_room(room_id: str):
+    """删除房间并停止其模拟任务"""
+    room = rooms.pop(room_id, None)
+    room_directory.remove(room_id)
+    scheduler.stop(room_id)
+    metrics.forget_room(room_id)
+    stream = spectator_streams.pop(room_id, None)
+    if stream:
+        await stream.close()
+    if recorder and room:
+        await recorder.stop(room)
+    if cluster:
+        await asyncio.to_thread(cluster.remove_room, room_id)
+
+async def load_shard_room(room_id: str) -> Optional[Room]:
+    """分片/节点在第一个玩家连接时创建分配给自己的房间"""
+    info = await asyncio.to_thread(cluster.get_room, room_id)
+    if not info or info["shard_id"] != SHARD_ID:
+        return None
+    # 读取共享存储期间可能已有其他连接创建了该房间
+    room = rooms.get(room_id)
+    if room:
+        return room
+
+    room = new_room(
+        room_id=room_id,
+        name=info["name"],
+        creator=info["creator"],
+        max_players=info["max_players"],
+        password=info["password"],
+        backend=SIM_BACKEND,
+        tick_rate=SIM_TICK_RATE
+    )
+    room.created_at = info["created_at"]
+    rooms[room_id] = room
+    if recorder:
+        recorder.start(room)
+    scheduler.start(room)
+    logger.info(f"Room {room_id} started on {SHARD_ID}")
+    return room
+
+async def shard_heartbeat_loop():
+    """分片/节点：定时上报心跳，并关闭已从集群后端删除的房间（例如管理员清库后）"""
     while True:
         try:
-            now = time.time()
-            
-            for room in list(rooms.values()):
-                if not room.players:
-                    continue
-                    
-                # 移动玩家
-                for player in room.players.values():
-                    player["x"] = max(20, min(MAP_WIDTH-20, player["x"] + player["dx"]))
-                    player["y"] = max(20, min(MAP_HEIGHT-20, player["y"] + player["dy"]))
-                
-                # 移动子弹
-                new_bullets = []
-                for bullet in room.bullets:
-                    bullet["x"] += bullet["dx"]
-                    bullet["y"] += bullet["dy"]
-                    
-                    # 检查子弹边界和距离
-                    dist = ((bullet["x"] - bullet["start_x"]) ** 2 + (bullet["y"] - bullet["start_y"]) ** 2) ** 0.5
-                    if (0 < bullet["x"] < MAP_WIDTH and 
-                        0 < bullet["y"] < MAP_HEIGHT and 
-                        dist < bullet["max_dist"] and
-                        now - bullet["created_at"] < 10):  # 10秒后自动清除
-                        new_bullets.append(bullet)
-                
-                room.bullets = new_bullets
-                
-                # 碰撞检测
-                dead_players = set()
-                for username, player in room.players.items():
-                    for bullet in room.bullets:
-                        if (bullet["owner"] != username and 
-                            username not in bullet.get("hit_set", [])):
-                            
-                            dist = ((player["x"] - bullet["x"]) ** 2 + (player["y"] - bullet["y"]) ** 2) ** 0.5
-                            if dist < 30:
-                                player["hp"] -= 300
-                                player["last_hit"] = now
-                                bullet.setdefault("hit_set", []).append(username)
-                                
-                                # 更新伤害统计
-                                if bullet["owner"] in users_db:
-                                    users_db[bullet["owner"]]["stats"]["total_damage"] += 300
-                                
-                                if player["hp"] <= 0:
-                                    dead_players.add(username)
-                                    player["deaths"] += 1
-                                    
-                                    # 更新击杀统计
-                                    if bullet["owner"] in room.players:
-                                        room.players[bullet["owner"]]["kills"] += 1
-                                    if bullet["owner"] in users_db:
-                                        users_db[bullet["owner"]]["stats"]["kills"] += 1
-                
-                # 回血逻辑
-                for player in room.players.values():
-                    if now - player["last_hit"] > 5 and player["hp"] < 1000:
-                        player["hp"] += 10  # 每帧回10血
-                        if player["hp"] > 1000:
-                            player["hp"] = 1000
-                
-                # 处理死亡玩家 - 不立即踢出，而是通知死亡
-                for username in dead_players:
-                    ws = room.connections.get(username)
-                    if ws:
-                        try:
-                            await ws.send_text(json.dumps({"type": "death", "message": "你已死亡！按R重生"}))
-                        except:
-                            pass
-                
-                # 广播游戏状态
-                if room.connections:
-                    state = room.get_state()
-                    message = json.dumps(state)
-                    
-                    for ws in list(room.connections.values()):
-                        try:
-                            await ws.send_text(message)
-                        except:
-                            pass
-            
-            await asyncio.sleep(0.02)  # 50 FPS
-            
+            await asyncio.to_thread(cluster.heartbeat, SHARD_ID, SHARD_HOST)
+            owned = await asyncio.to_thread(cluster.room_ids, SHARD_ID)
+            for room_id in [room_id for room_id in rooms if room_id not in owned]:
+                for ws in list(rooms[room_id].connections.values()):
+                    try:
+                        await ws.close(code=4200, reason="Room closed")
+                    except:
+                        pass
+                await delete_room(room_id)
+                logger.info(f"Room {room_id} closed (removed from cluster)")
+        except Exception as e:
+            logger.error(f"Shard heartbeat error: {e}")
+        await asyncio.sleep(SHARD_HEARTBEAT)
+
+def merge_cluster_stats(totals: Dict[str, Dict[str, int]]):
+    """用集群后端的累计统计刷新内存中的用户和排行榜
+
+    本进程还没写回的增量不在后端的数值里，要加回去，否则排行榜会短暂回退。
+    本进程没有加载的用户（在其他进程上注册）只进排行榜。
+    """
+    for username, stats in totals.items():
+        pending = stats_buffer.pending.get(username)
+        if pending:
+            stats = {field: value + pending.get(field, 0) for field, value in stats.items()}
+        user = users_db.get(username)
+        current = user["stats"] if user else leaderboard.stats.get(username)
+        if current is None:
+            leaderboard.update(username, stats)
+        elif current != stats:
+            current.update(stats)
+            leaderboard.update(username, current)
+
+def apply_cluster_event(event: Dict):
+    """处理集群后端推送的变化（在事件循环中执行）"""
+    kind = event.get("type")
+    if kind == "room":
+        room_directory.update_summary(event["room"])
+    elif kind == "room_removed":
+        room_directory.remove(event["room_id"])
+    elif kind == "stats":
+        merge_cluster_stats(event["stats"])
+    elif kind == "reset":
+        # 其他进程清空了数据库
+        users_db.clear()
+        leaderboard.clear()
+        sessions.clear()
+        room_directory.clear()
+        stats_buffer.discard()
+
+async def sync_cluster_stats():
+    merge_cluster_stats(await asyncio.to_thread(storage.load_stats))
+
+async def cluster_sync_loop():
+    """路由进程/节点：同步大厅房间列表，并定期刷新统计
+
+    后端不能推送时每 0.5 秒轮询房间列表；能推送时变化已经实时到达，
+    这里只做低频的全量同步，兜底错过的事件。
+    """
+    interval = STATS_SYNC_INTERVAL if cluster.supports_push else LOBBY_PUSH_INTERVAL
+    last_stats = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            room_directory.sync(await asyncio.to_thread(cluster.list_rooms))
+            if time.monotonic() - last_stats >= STATS_SYNC_INTERVAL:
+                last_stats = time.monotonic()
+                await sync_cluster_stats()
+        except Exception as e:
+            logger.error(f"Cluster sync error: {e}")
+
+async def collect_rooms():
+    """删除超过 ROOM_GC_AFTER 秒没有任何连接的房间，以及本分片/节点上从未被连接过的集群房间"""
+    deadline = time.time() - ROOM_GC_AFTER
+    for room_id, room in list(rooms.items()):
+        if room.outboxes or room.empty_since > deadline:
+            continue
+        for username in list(room.players):
+            if await get_user_room(username) == room_id:
+                await pop_user_room(username)
+        await delete_room(room_id)
+        logger.info(f"Room {room_id} deleted (no connections for {ROOM_GC_AFTER:.0f}s)")
+
+    if RUNS_ROOMS:
+        for room_id in await asyncio.to_thread(cluster.room_ids, SHARD_ID):
+            if room_id in rooms:
+                continue
+            info = await asyncio.to_thread(cluster.get_room, room_id)
+            if info and info["created_at"] <= deadline:
+                await asyncio.to_thread(cluster.remove_room, room_id)
+                logger.info(f"Room {room_id} deleted (never connected)")
+
+async def room_gc_loop():
+    while True:
+        await asyncio.sleep(ROOM_GC_INTERVAL)
+        try:
+            await collect_rooms()
+        except Exception as e:
+            logger.error(f"Room GC error: {e}")
+
+async def expire_sessions():
+    """淘汰过期会话并从持久化存储中删除"""
+    expired = sessions.expire()
+    if expired:
+        await asyncio.to_thread(storage.delete_sessions, expired)
+        logger.info(f"Expired {len(expired)} sessions")
+
+async def session_gc_loop():
+    while True:
+        await asyncio.sleep(60)
+        try:
+            await expire_sessions()
         except Exception as e:
-            logger.error(f"Game loop error: {e}")
-            await asyncio.sleep(1)
+            logger.error(f"Session GC error: {e}")
+
+def restore_state(state: Dict) -> List[str]:
+    """载入快照：房间接着上次的帧继续运行，返回恢复的房间 id"""
+    for username, user in state.get("users", {}).items():
+        if username not in users_db:
+            users_db[username] = user
+            leaderboard.update(username, user["stats"])
+    for token, username, created_at in state["sessions"]:
+        if token not in sessions:
+            sessions.add(token, username, created_at)
+    user_rooms.update(state["user_rooms"])
+    now = time.time()
+    for room_state in state["rooms"]:
+        room = restore_room(room_state, SIM_BACKEND, SIM_TICK_RATE)
+        room.empty_since = now
+        rooms[room.room_id] = room
+        room_directory.update(room)
+    return [room_state["room_id"] for room_state in state["rooms"]]
+
+async def release_unresumed(room_ids: List[str]):
+    """恢复 RESUME_GRACE 秒后仍没有重新连接的玩家离开房间"""
+    await asyncio.sleep(RESUME_GRACE)
+    for room_id in room_ids:
+        room = rooms.get(room_id)
+        if not room:
+            continue
+        for username in [username for username in room.players if username not in room.connections]:
+            await release_player(room, username)
+            logger.info(f"Player {username} did not resume room {room_id}")
+
+async def preserve_rooms() -> bool:
+    """停止所有房间的模拟并写入最终快照，之后断开的连接不再把玩家移出房间
+
+    写入失败时恢复模拟并返回 False。
+    """
+    global preserving_rooms
+    if preserving_rooms:
+        return True
+    preserving_rooms = True
+    scheduler.stop_all()
+    await stats_buffer.flush()
+    if await snapshots.save():
+        logger.info(f"Snapshot saved: {len(rooms)} rooms")
+        return True
+    preserving_rooms = False
+    for room in rooms.values():
+        scheduler.start(room)
+    return False
+
+def start_handoff_listener(loop: asyncio.AbstractEventLoop):
+    """在控制 socket 上等待新进程的交接请求（在后台线程中处理）"""
+    global handoff_listener
+
+    def prepare():
+        if not asyncio.run_coroutine_threadsafe(preserve_rooms(), loop).result():
+            raise RuntimeError("快照写入失败")
+
+    def finish():
+        logger.info("监听 socket 已交给新进程，退出")
+        loop.call_soon_threadsafe(setattr, game_server, "should_exit", True)
+
+    handoff_listener = HandoffListener(HANDOFF_SOCKET, listen_socket, prepare, finish)
+    handoff_listener.start()
+
+background_tasks = []
 
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting game server...")
-    asyncio.create_task(game_loop())
+
+    # 从持久化存储加载用户和未过期的会话
+    users_db.update(await asyncio.to_thread(storage.load_users))
+    for username, user in users_db.items():
+        leaderboard.update(username, user["stats"])
+    for token, session in (await asyncio.to_thread(storage.load_sessions)).items():
+        sessions.add(token, session["username"], session["created_at"])
+    await expire_sessions()
+    logger.info(f"Loaded {len(users_db)} users and {len(sessions)} sessions from {STORAGE_BACKEND} storage")
+
+    if snapshots:
+        state = await asyncio.to_thread(read_snapshot, SNAPSHOT_PATH)
+        if state:
+            restored = restore_state(state)
+            background_tasks.append(asyncio.create_task(release_unresumed(restored)))
+            logger.info(f"Restored {len(restored)} rooms and {len(state['sessions'])} sessions from snapshot")
+        background_tasks.append(asyncio.create_task(snapshots.run()))
+    if HANDOFF_SOCKET:
+        if listen_socket is None:
+            logger.warning("进程交接需要通过 python bs_server.py 启动，未开启")
+        else:
+            start_handoff_listener(asyncio.get_running_loop())
+
+    background_tasks.append(asyncio.create_task(stats_buffer.run()))
+    background_tasks.append(asyncio.create_task(session_gc_loop()))
+    background_tasks.append(asyncio.create_task(room_gc_loop()))
+    background_tasks.append(asyncio.create_task(lobby_push_loop()))
+    if not cluster:
+        background_tasks.append(asyncio.create_task(matchmaking_loop()))
+    background_tasks.append(asyncio.create_task(metrics.sample_loop_lag()))
+    if recorder:
+        background_tasks.append(asyncio.create_task(recorder.run()))
+    if cluster and cluster.supports_push:
+        loop = asyncio.get_running_loop()
+        await asyncio.to_thread(cluster.subscribe,
+                                lambda event: loop.call_soon_threadsafe(apply_cluster_event, event))
+    if SERVES_LOBBY:
+        room_directory.sync(await asyncio.to_thread(cluster.list_rooms))
+        background_tasks.append(asyncio.create_task(cluster_sync_loop()))
+    if RUNS_ROOMS:
+        background_tasks.append(asyncio.create_task(shard_heartbeat_loop()))
+    for room in rooms.values():
+        scheduler.start(room)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if snapshots:
+        # 通过 python bs_server.py 启动时已在断开连接前写入（见 GameServer）
+        await preserve_rooms()
+    if handoff_listener:
+        handoff_listener.close()
+    scheduler.stop_all()
+    for task in background_tasks:
+        task.cancel()
+    await stats_buffer.flush()
+    if recorder:
+        await recorder.close()
+    if RUNS_ROOMS:
+        # 本分片/节点的房间随进程一起结束
+        for room_id in list(rooms):
+            cluster.remove_room(room_id)
+        cluster.remove_shard(SHARD_ID)
+    storage.close()
+    hasher.shutdown()
 
 @app.get("/")
 async def root():
@@ -633,6 +1367,7 @@ async def root():
 async def health_check():
     return {
         "status": "healthy",
+        "role": CLUSTER_ROLE,
         "timestamp": time.time(),
         "users_count": len(users_db),
         "active_sessions": len(sessions),
@@ -640,5 +1375,42 @@ async def health_check():
         "total_players": sum(len(room.players) for room in rooms.values())
     }
 
+# Prometheus 文本格式指标
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render({
+        "pw_rooms": (len(rooms), "Active rooms"),
+        "pw_players": (sum(len(room.players) for room in rooms.values()), "Players in rooms"),
+        "pw_sessions": (len(sessions), "Active sessions"),
+        "pw_lobby_clients": (len(lobby_clients), "Clients subscribed to lobby updates"),
+        "pw_spectators": (sum(len(stream) for stream in spectator_streams.values()), "Spectator connections"),
+        "pw_rooms_hibernating": (scheduler.hibernating(), "Rooms whose simulation is stopped until input arrives"),
+        "pw_pending_stats": (len(stats_buffer.pending), "Users with stats waiting to be flushed"),
+        "pw_matchmaking_queued": (len(matchmaker), "Players waiting in the matchmaking queue"),
+        **{
+            f"pw_matchmaking_wait_{name}_seconds": (value, f"Matchmaking queue wait time, {name} of recent matches")
+            for name, value in matchmaker.wait_percentiles().items()
+        },
+        "pw_players_per_room": (
+            round(sum(len(room.players) for room in rooms.values()) / len(rooms), 2) if rooms else 0,
+            "Average players per active room"
+        )
+    }), media_type="text/plain; version=0.0.4")
+
+class GameServer(uvicorn.Server):
+    """关闭时先停止模拟并写入最终快照，再断开连接，断开的玩家因此留在快照里"""
+
+    async def shutdown(self, sockets=None):
+        if snapshots:
+            await preserve_rooms()
+        await super().shutdown(sockets)
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=3000, log_level="info")
\ No newline at end of file
+    config = uvicorn.Config(app, host="0.0.0.0", port=3000, log_level="info")
+    listen_socket = request_handoff(HANDOFF_SOCKET) if HANDOFF_SOCKET else None
+    if listen_socket:
+        logger.info("已接管旧进程的监听 socket")
+    else:
+        listen_socket = config.bind_socket()
+    game_server = GameServer(config)
+    game_server.run(sockets=[listen_socket])
\ No newline at end of file
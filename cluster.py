@@ -0,0 +1,830 @@
+#!/usr/bin/env python3
+"""集群模式：多个 bs_server.py 进程共用一个大厅
+
+两种部署方式：
+- 分片：一个路由进程（PW_ROLE=router）负责注册登录、大厅和排行榜，不运行任何房间；
+  多个分片进程（PW_ROLE=shard）运行分配给它的房间，客户端直接连接分片的 /ws/{room_id}。
+- 节点：多个对等的节点进程（PW_ROLE=node），每个节点都提供完整的接口并运行在自己
+  上面创建的房间；在节点 A 上加入节点 B 的房间会被重定向到节点 B。
+
+用户、会话、统计、房间归属、玩家所在房间和进程心跳都通过可替换的集群后端共享
+（PW_CLUSTER_BACKEND）：
+- sqlite（默认）：共享的 SQLite 数据库文件，只能在同一台机器上使用，房间变化靠轮询；
+- broker：本文件内置的 TCP 代理进程（python cluster.py --broker-only），数据保存在
+  代理进程内存中，房间和统计变化实时推送给所有订阅的进程，用于跨机器测试。
+  代理没有其他访问控制，每条连接都必须先用共享密钥 PW_BROKER_TOKEN 认证；
+  默认只监听本机，跨机器使用时请放在内网或隧道之后；
+- memory：进程内的替身，只在单个进程内共享，用于在不启动其他进程的情况下测试集群代码路径。
+
+用法:
+    python cluster.py --shards 4 --port 3000 --public-host 47.86.22.26
+    python cluster.py --nodes 3 --port 3000 --backend broker
+    PW_BROKER_TOKEN=... python cluster.py --broker-only --broker 127.0.0.1:3900
+"""
+import argparse
+import asyncio
+import copy
+import hmac
+import json
+import os
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod, update_abstractmethods
+from typing import Callable, Dict, Iterable, List, Optional
+
+from storage import Storage, SQLiteStorage, STAT_FIELDS
+
+SHARD_HEARTBEAT = 2.0  # 分片心跳间隔（秒）
+SHARD_TIMEOUT = 10.0  # 超过这么久没有心跳的分片不再分配新房间
+STATS_SYNC_INTERVAL = 5.0  # 从集群后端全量刷新统计（后端能推送时还有房间列表）的间隔（秒）
+
+ROLES = ("standalone", "router", "shard", "node")
+BROKER_ADDRESS = "127.0.0.1:3900"
+BROKER_TOKEN_ENV = "PW_BROKER_TOKEN"  # 代理和各进程共用的认证密钥
+MAX_SUBSCRIBER_BUFFER = 1 << 20  # 订阅连接积压未发出的字节数超过这么多时代理断开它
+SUBSCRIBE_RETRY = 1.0  # 订阅连接断开后重新订阅的间隔（秒）
+
+ROOM_FIELDS = ("room_id", "name", "creator", "max_players", "password", "shard_id",
+               "player_count", "created_at")
+
+
+def room_summary(room: Dict) -> Dict:
+    """共享存储中的房间 -> 大厅摘要，结构与 room_directory.room_summary 一致"""
+    return {
+        "id": room["room_id"],
+        "name": room["name"],
+        "creator": room["creator"],
+        "player_count": room["player_count"],
+        "max_players": room["max_players"],
+        "has_password": bool(room["password"]),
+        "created_at": room["created_at"]
+    }
+
+
+class ClusterBackend(Storage, ABC):
+    """集群后端接口：在持久化接口之上增加跨进程共享的房间归属和变化通知
+
+    所有方法都是同步的，由调用方放到线程池中执行。supports_push 为 True 的后端
+    在房间或统计变化时调用 subscribe() 注册的回调（可能在任意线程中），事件为：
+        {"type": "room", "room": 摘要}
+        {"type": "room_removed", "room_id": ...}
+        {"type": "stats", "stats": {username: 累计统计}}
+        {"type": "reset"}
+    不能推送的后端由调用方定期全量同步。缺少任何一个抽象方法的后端在创建时就会报错。
+    """
+
+    supports_push = False
+
+    def subscribe(self, callback: Callable[[Dict], None]):
+        pass
+
+    # 分片/节点
+    @abstractmethod
+    def heartbeat(self, shard_id: str, host: str):
+        """记录分片/节点的心跳和对外地址"""
+
+    @abstractmethod
+    def remove_shard(self, shard_id: str):
+        """分片/节点退出时注销"""
+
+    @abstractmethod
+    def pick_shard(self) -> Optional[Dict]:
+        """选出房间最少（其次玩家最少）的存活分片"""
+
+    @abstractmethod
+    def shard_host(self, shard_id: str) -> Optional[str]:
+        """分片/节点的对外地址，不存在时为 None"""
+
+    @abstractmethod
+    def shards(self) -> List[Dict]:
+        """所有分片/节点及其心跳、房间数和玩家数"""
+
+    # 房间
+    @abstractmethod
+    def add_room(self, room: Dict):
+        """登记新房间（字段见 ROOM_FIELDS）"""
+
+    @abstractmethod
+    def get_room(self, room_id: str) -> Optional[Dict]:
+        """按 id 读取房间，不存在时为 None"""
+
+    @abstractmethod
+    def list_rooms(self) -> List[Dict]:
+        """所有房间的大厅摘要"""
+
+    @abstractmethod
+    def room_ids(self, shard_id: str) -> set:
+        """分配给该分片/节点的所有房间 id"""
+
+    @abstractmethod
+    def set_room_players(self, room_id: str, count: int):
+        """更新房间的人数"""
+
+    @abstractmethod
+    def remove_room(self, room_id: str):
+        """删除房间"""
+
+    @abstractmethod
+    def room_members(self, room_id: str) -> int:
+        """记录为在该房间中（见 set_user_room）的玩家数"""
+
+    # 玩家所在房间
+    @abstractmethod
+    def get_user_room(self, username: str) -> Optional[str]:
+        """玩家所在的房间 id，不在任何房间中时为 None"""
+
+    @abstractmethod
+    def user_room_map(self, usernames: Iterable[str]) -> Dict[str, str]:
+        """一批玩家所在的房间 {username: room_id}，不在房间中的玩家省略"""
+
+    @abstractmethod
+    def set_user_room(self, username: str, room_id: str):
+        """记录玩家进入了房间"""
+
+    @abstractmethod
+    def pop_user_room(self, username: str):
+        """清除玩家所在的房间"""
+
+    @abstractmethod
+    def count_user_rooms(self) -> int:
+        """在房间中的玩家总数"""
+
+
+class SQLiteBackend(SQLiteStorage, ClusterBackend):
+    """在 SQLiteStorage 的数据库文件中增加集群表，同一台机器上的进程共享"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cluster_shards (
+                shard_id TEXT PRIMARY KEY,
+                host TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cluster_rooms (
+                room_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                creator TEXT NOT NULL,
+                max_players INTEGER NOT NULL,
+                password TEXT,
+                shard_id TEXT NOT NULL,
+                player_count INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS cluster_rooms_shard ON cluster_rooms (shard_id);
+            CREATE TABLE IF NOT EXISTS cluster_user_rooms (
+                username TEXT PRIMARY KEY,
+                room_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS cluster_user_rooms_room ON cluster_user_rooms (room_id);
+        """)
+        self.conn.commit()
+
+    # 分片
+    def heartbeat(self, shard_id: str, host: str):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cluster_shards (shard_id, host, updated_at) VALUES (?, ?, ?)",
+                (shard_id, host, time.time())
+            )
+
+    def remove_shard(self, shard_id: str):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM cluster_shards WHERE shard_id = ?", (shard_id,))
+
+    def pick_shard(self) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute("""
+                SELECT s.shard_id, s.host FROM cluster_shards s
+                LEFT JOIN cluster_rooms r ON r.shard_id = s.shard_id
+                WHERE s.updated_at > ?
+                GROUP BY s.shard_id
+                ORDER BY COUNT(r.room_id), COALESCE(SUM(r.player_count), 0)
+                LIMIT 1
+            """, (time.time() - SHARD_TIMEOUT,)).fetchone()
+        return {"shard_id": row[0], "host": row[1]} if row else None
+
+    def shard_host(self, shard_id: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT host FROM cluster_shards WHERE shard_id = ?",
+                                    (shard_id,)).fetchone()
+        return row[0] if row else None
+
+    def shards(self) -> List[Dict]:
+        with self.lock:
+            rows = self.conn.execute("""
+                SELECT s.shard_id, s.host, s.updated_at, COUNT(r.room_id), COALESCE(SUM(r.player_count), 0)
+                FROM cluster_shards s LEFT JOIN cluster_rooms r ON r.shard_id = s.shard_id
+                GROUP BY s.shard_id
+            """).fetchall()
+        return [{"shard_id": shard_id, "host": host, "updated_at": updated_at,
+                 "rooms": room_count, "players": players}
+                for shard_id, host, updated_at, room_count, players in rows]
+
+    # 房间
+    def add_room(self, room: Dict):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO cluster_rooms (room_id, name, creator, max_players, password, shard_id, "
+                "player_count, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (room["room_id"], room["name"], room["creator"], room["max_players"],
+                 room["password"], room["shard_id"], room.get("player_count", 0), room["created_at"])
+            )
+
+    def get_room(self, room_id: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT " + ", ".join(ROOM_FIELDS) + " FROM cluster_rooms WHERE room_id = ?", (room_id,)
+            ).fetchone()
+        return dict(zip(ROOM_FIELDS, row)) if row else None
+
+    def list_rooms(self) -> List[Dict]:
+        with self.lock:
+            rows = self.conn.execute("SELECT " + ", ".join(ROOM_FIELDS) + " FROM cluster_rooms").fetchall()
+        return [room_summary(dict(zip(ROOM_FIELDS, row))) for row in rows]
+
+    def room_ids(self, shard_id: str) -> set:
+        with self.lock:
+            rows = self.conn.execute("SELECT room_id FROM cluster_rooms WHERE shard_id = ?",
+                                     (shard_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    def set_room_players(self, room_id: str, count: int):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE cluster_rooms SET player_count = ? WHERE room_id = ?",
+                              (count, room_id))
+
+    def remove_room(self, room_id: str):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM cluster_rooms WHERE room_id = ?", (room_id,))
+            self.conn.execute("DELETE FROM cluster_user_rooms WHERE room_id = ?", (room_id,))
+
+    def room_members(self, room_id: str) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM cluster_user_rooms WHERE room_id = ?",
+                                     (room_id,)).fetchone()[0]
+
+    # 玩家所在房间
+    def get_user_room(self, username: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT room_id FROM cluster_user_rooms WHERE username = ?",
+                                    (username,)).fetchone()
+        return row[0] if row else None
+
+    def user_room_map(self, usernames: Iterable[str]) -> Dict[str, str]:
+        usernames = list(usernames)
+        if not usernames:
+            return {}
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT username, room_id FROM cluster_user_rooms WHERE username IN ("
+                + ", ".join("?" * len(usernames)) + ")", usernames
+            ).fetchall()
+        return dict(rows)
+
+    def set_user_room(self, username: str, room_id: str):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cluster_user_rooms (username, room_id) VALUES (?, ?)",
+                (username, room_id)
+            )
+
+    def pop_user_room(self, username: str):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM cluster_user_rooms WHERE username = ?", (username,))
+
+    def count_user_rooms(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM cluster_user_rooms").fetchone()[0]
+
+    def clear(self):
+        super().clear()
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM cluster_rooms")
+            self.conn.execute("DELETE FROM cluster_user_rooms")
+
+
+class MemoryBackend(ClusterBackend):
+    """进程内的集群后端，也是代理进程保存数据的地方
+
+    返回值都是副本，调用方修改不会影响后端里的数据（与跨进程后端的行为一致）。
+    变化通知在调用线程中同步发出。
+    """
+
+    supports_push = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users: Dict[str, Dict] = {}
+        self.sessions: Dict[str, Dict] = {}
+        self.shard_hosts: Dict[str, Dict] = {}  # {shard_id: {host, updated_at}}
+        self.rooms: Dict[str, Dict] = {}
+        self.user_rooms: Dict[str, str] = {}
+        self.subscribers: List[Callable[[Dict], None]] = []
+
+    def subscribe(self, callback: Callable[[Dict], None]):
+        self.subscribers.append(callback)
+
+    def _publish(self, event: Dict):
+        for callback in self.subscribers:
+            callback(event)
+
+    # 持久化接口
+    def load_users(self) -> Dict:
+        with self.lock:
+            return copy.deepcopy(self.users)
+
+    def load_sessions(self) -> Dict:
+        with self.lock:
+            return copy.deepcopy(self.sessions)
+
+    def get_session(self, token: str) -> Optional[Dict]:
+        with self.lock:
+            session = self.sessions.get(token)
+            return dict(session) if session else None
+
+    def load_stats(self) -> Dict[str, Dict[str, int]]:
+        with self.lock:
+            return {username: dict(user["stats"]) for username, user in self.users.items()}
+
+    def get_user(self, username: str) -> Optional[Dict]:
+        with self.lock:
+            return copy.deepcopy(self.users.get(username))
+
+    def add_user(self, username: str, user: Dict):
+        user = copy.deepcopy(user)
+        with self.lock:
+            self.users[username] = user
+        self._publish({"type": "stats", "stats": {username: dict(user["stats"])}})
+
+    def update_password(self, username: str, password_hash: str):
+        with self.lock:
+            if username in self.users:
+                self.users[username]["password_hash"] = password_hash
+
+    def add_session(self, token: str, session: Dict):
+        with self.lock:
+            self.sessions[token] = {"username": session["username"], "created_at": session["created_at"]}
+
+    def delete_sessions(self, tokens):
+        with self.lock:
+            for token in tokens:
+                self.sessions.pop(token, None)
+
+    def apply_stats(self, deltas: Dict[str, Dict[str, int]]):
+        totals = {}
+        with self.lock:
+            for username, delta in deltas.items():
+                user = self.users.get(username)
+                if not user:
+                    continue
+                stats = user["stats"]
+                for field in STAT_FIELDS:
+                    stats[field] += delta.get(field, 0)
+                totals[username] = dict(stats)
+        if totals:
+            self._publish({"type": "stats", "stats": totals})
+
+    def clear(self):
+        with self.lock:
+            self.users.clear()
+            self.sessions.clear()
+            self.rooms.clear()
+            self.user_rooms.clear()
+        self._publish({"type": "reset"})
+
+    # 分片
+    def heartbeat(self, shard_id: str, host: str):
+        with self.lock:
+            self.shard_hosts[shard_id] = {"host": host, "updated_at": time.time()}
+
+    def remove_shard(self, shard_id: str):
+        with self.lock:
+            self.shard_hosts.pop(shard_id, None)
+
+    def _shard_load(self) -> Dict[str, List[int]]:
+        load = {shard_id: [0, 0] for shard_id in self.shard_hosts}
+        for room in self.rooms.values():
+            if room["shard_id"] in load:
+                load[room["shard_id"]][0] += 1
+                load[room["shard_id"]][1] += room["player_count"]
+        return load
+
+    def pick_shard(self) -> Optional[Dict]:
+        deadline = time.time() - SHARD_TIMEOUT
+        with self.lock:
+            load = self._shard_load()
+            alive = [shard_id for shard_id, shard in self.shard_hosts.items() if shard["updated_at"] > deadline]
+            if not alive:
+                return None
+            shard_id = min(alive, key=lambda shard_id: load[shard_id])
+            return {"shard_id": shard_id, "host": self.shard_hosts[shard_id]["host"]}
+
+    def shard_host(self, shard_id: str) -> Optional[str]:
+        with self.lock:
+            shard = self.shard_hosts.get(shard_id)
+            return shard["host"] if shard else None
+
+    def shards(self) -> List[Dict]:
+        with self.lock:
+            load = self._shard_load()
+            return [{"shard_id": shard_id, "host": shard["host"], "updated_at": shard["updated_at"],
+                     "rooms": load[shard_id][0], "players": load[shard_id][1]}
+                    for shard_id, shard in self.shard_hosts.items()]
+
+    # 房间
+    def add_room(self, room: Dict):
+        room = {field: room.get(field) for field in ROOM_FIELDS}
+        room["player_count"] = room["player_count"] or 0
+        with self.lock:
+            if room["room_id"] in self.rooms:
+                raise ValueError(f"房间已存在: {room['room_id']}")
+            self.rooms[room["room_id"]] = room
+        self._publish({"type": "room", "room": room_summary(room)})
+
+    def get_room(self, room_id: str) -> Optional[Dict]:
+        with self.lock:
+            room = self.rooms.get(room_id)
+            return dict(room) if room else None
+
+    def list_rooms(self) -> List[Dict]:
+        with self.lock:
+            return [room_summary(room) for room in self.rooms.values()]
+
+    def room_ids(self, shard_id: str) -> set:
+        with self.lock:
+            return {room_id for room_id, room in self.rooms.items() if room["shard_id"] == shard_id}
+
+    def set_room_players(self, room_id: str, count: int):
+        with self.lock:
+            room = self.rooms.get(room_id)
+            if not room or room["player_count"] == count:
+                return
+            room["player_count"] = count
+            summary = room_summary(room)
+        self._publish({"type": "room", "room": summary})
+
+    def remove_room(self, room_id: str):
+        with self.lock:
+            if self.rooms.pop(room_id, None) is None:
+                return
+            for username in [u for u, r in self.user_rooms.items() if r == room_id]:
+                del self.user_rooms[username]
+        self._publish({"type": "room_removed", "room_id": room_id})
+
+    def room_members(self, room_id: str) -> int:
+        with self.lock:
+            return sum(1 for r in self.user_rooms.values() if r == room_id)
+
+    # 玩家所在房间
+    def get_user_room(self, username: str) -> Optional[str]:
+        with self.lock:
+            return self.user_rooms.get(username)
+
+    def user_room_map(self, usernames: Iterable[str]) -> Dict[str, str]:
+        with self.lock:
+            return {username: self.user_rooms[username] for username in usernames
+                    if username in self.user_rooms}
+
+    def set_user_room(self, username: str, room_id: str):
+        with self.lock:
+            self.user_rooms[username] = room_id
+
+    def pop_user_room(self, username: str):
+        with self.lock:
+            self.user_rooms.pop(username, None)
+
+    def count_user_rooms(self) -> int:
+        with self.lock:
+            return len(self.user_rooms)
+
+
+# 代理进程对外提供的操作，即 MemoryBackend 上除 subscribe 以外的公开方法
+BROKER_OPS = frozenset(
+    name for name in set(vars(ClusterBackend)) | set(vars(Storage))
+    if not name.startswith("_") and callable(getattr(MemoryBackend, name))
+    and name not in ("subscribe", "close")
+)
+
+
+def parse_address(address: str):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _remote(op: str):
+    def call(self, *args):
+        return self._call(op, *args)
+    call.__name__ = op
+    return call
+
+
+class BrokerBackend(ClusterBackend):
+    """代理进程的客户端
+
+    协议是一行一个 JSON：每条连接先发送 {"op": "auth", "token": 密钥}，
+    之后请求 {"op": 方法名, "args": [...]}，应答 {"result": ...} 或 {"error": "..."}。
+    请求在一条连接上按顺序收发；订阅使用另一条连接，由后台线程读取代理推送的事件并调用回调。
+    订阅连接断开（例如读取太慢被代理断开）后自动重新订阅，期间错过的事件由调用方的定期全量同步补上。
+    """
+
+    supports_push = True
+
+    def __init__(self, address: str = BROKER_ADDRESS, token: Optional[str] = None, timeout: float = 5.0):
+        self.address = parse_address(address)
+        self.token = token
+        if not token:
+            raise RuntimeError(f"broker 后端需要设置 {BROKER_TOKEN_ENV}")
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sock = self._connect()
+        self.file = self.sock.makefile("rwb")
+        self.subscription = None
+        self.closed = False
+
+    def _connect(self) -> socket.socket:
+        """建立连接并认证"""
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        sock.sendall(json.dumps({"op": "auth", "token": self.token}).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+        reply = json.loads(line) if line else {"error": "代理断开了连接"}
+        if "error" in reply:
+            sock.close()
+            raise RuntimeError(f"集群代理认证失败: {reply['error']}")
+        return sock
+
+    def _call(self, op: str, *args):
+        request = json.dumps({"op": op, "args": args}, default=list).encode() + b"\n"
+        with self.lock:
+            self.file.write(request)
+            self.file.flush()
+            line = self.file.readline()
+        if not line:
+            raise ConnectionError("集群代理已断开")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise RuntimeError(f"集群代理错误: {reply['error']}")
+        return reply["result"]
+
+    def _subscribe(self) -> socket.socket:
+        sock = self._connect()
+        sock.settimeout(None)
+        sock.sendall(json.dumps({"op": "subscribe"}).encode() + b"\n")
+        self.subscription = sock
+        return sock
+
+    def subscribe(self, callback: Callable[[Dict], None]):
+        sock = self._subscribe()
+
+        def read_events(sock):
+            while True:
+                try:
+                    with sock.makefile("rb") as events:
+                        for line in events:
+                            callback(json.loads(line))
+                except OSError:
+                    pass
+                while not self.closed:
+                    time.sleep(SUBSCRIBE_RETRY)
+                    try:
+                        sock = self._subscribe()
+                        break
+                    except (OSError, RuntimeError):
+                        continue
+                if self.closed:
+                    return
+
+        threading.Thread(target=read_events, args=(sock,), name="cluster-events", daemon=True).start()
+
+    def room_ids(self, shard_id: str) -> set:
+        return set(self._call("room_ids", shard_id))
+
+    def close(self):
+        self.closed = True
+        with self.lock:
+            self.file.close()
+            self.sock.close()
+        if self.subscription:
+            self.subscription.close()
+
+
+for _op in BROKER_OPS:
+    if _op not in vars(BrokerBackend):
+        setattr(BrokerBackend, _op, _remote(_op))
+update_abstractmethods(BrokerBackend)  # 远程方法在类创建之后才加上
+
+
+async def serve_broker(address: str = BROKER_ADDRESS, token: Optional[str] = None):
+    """运行代理：数据保存在一个 MemoryBackend 中，变化推送给所有订阅连接
+
+    每条连接的第一条消息必须是携带 token 的认证请求，否则直接断开。
+    订阅连接积压的未发送数据超过 MAX_SUBSCRIBER_BUFFER 时断开它，
+    一个读取太慢的进程不会让代理的内存无限增长；客户端会重新订阅。
+    """
+    if not token:
+        raise RuntimeError(f"集群代理需要设置 {BROKER_TOKEN_ENV}")
+    expected = token.encode()
+    backend = MemoryBackend()
+    subscribers = set()
+
+    def publish(event):
+        line = json.dumps(event).encode() + b"\n"
+        for writer in list(subscribers):
+            if writer.transport.get_write_buffer_size() > MAX_SUBSCRIBER_BUFFER:
+                subscribers.discard(writer)
+                writer.transport.abort()
+                continue
+            writer.write(line)
+
+    backend.subscribe(publish)
+
+    async def authenticate(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        request = json.loads(await reader.readline() or b"{}")
+        token = request.get("token") if request.get("op") == "auth" else None
+        ok = isinstance(token, str) and hmac.compare_digest(token.encode(), expected)
+        writer.write(json.dumps({"result": True} if ok else {"error": "认证失败"}).encode() + b"\n")
+        await writer.drain()
+        return ok
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            if not await authenticate(reader, writer):
+                return
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                op = request.get("op")
+                if op == "subscribe":
+                    subscribers.add(writer)
+                    continue
+                if op not in BROKER_OPS:
+                    reply = {"error": f"未知操作: {op}"}
+                else:
+                    try:
+                        reply = {"result": getattr(backend, op)(*request.get("args", ()))}
+                    except Exception as e:
+                        reply = {"error": str(e)}
+                writer.write(json.dumps(reply, default=list).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError, AttributeError):
+            pass
+        finally:
+            subscribers.discard(writer)
+            writer.close()
+
+    host, port = parse_address(address)
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def open_cluster(backend: str, path: str, broker_address: str = BROKER_ADDRESS,
+                 broker_token: Optional[str] = None) -> ClusterBackend:
+    if backend == "sqlite":
+        return SQLiteBackend(path)
+    if backend == "memory":
+        return MemoryBackend()
+    if backend == "broker":
+        return BrokerBackend(broker_address, broker_token)
+    raise RuntimeError(f"未知的集群后端: {backend}")
+
+
+def spawn_broker(address: str, env: Dict) -> subprocess.Popen:
+    """启动代理进程（env 中带有认证密钥），等它开始监听后返回"""
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--broker-only", "--broker", address],
+                               env=env)
+    for _ in range(50):
+        try:
+            socket.create_connection(parse_address(address), timeout=1).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("集群代理启动失败")
+
+
+def _start_server(role_env: Dict, port: int, bind_host: str, base_env: Dict, log_level: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bs_server:app", "--host", bind_host,
+         "--port", str(port), "--log-level", log_level],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=dict(base_env, **role_env)
+    )
+
+
+def _cluster_env(env: Optional[Dict], backend: str, broker_address: str) -> Dict:
+    if backend not in ("sqlite", "broker"):
+        raise ValueError(f"多进程部署只支持 sqlite 或 broker 后端: {backend}")
+    base_env = dict(os.environ if env is None else env, PW_CLUSTER_BACKEND=backend)
+    if backend == "sqlite":
+        base_env["PW_STORAGE"] = "sqlite"
+    else:
+        base_env["PW_BROKER_ADDR"] = broker_address
+        # 没有指定密钥时为这次启动的代理和服务器进程生成一个
+        base_env.setdefault(BROKER_TOKEN_ENV, secrets.token_urlsafe(32))
+    return base_env
+
+
+def spawn_cluster(shards: int, port: int, public_host: str = "localhost",
+                  bind_host: str = "0.0.0.0", env: Dict = None,
+                  log_level: str = "info", backend: str = "sqlite",
+                  broker_address: str = BROKER_ADDRESS) -> List[subprocess.Popen]:
+    """启动一个路由进程和 shards 个分片进程，返回进程列表
+
+    路由进程在最前；使用 broker 后端时先启动代理进程，放在列表最后。
+    """
+    base_env = _cluster_env(env, backend, broker_address)
+    broker = [spawn_broker(broker_address, base_env)] if backend == "broker" else []
+
+    processes = [_start_server({"PW_ROLE": "router"}, port, bind_host, base_env, log_level)]
+    for i in range(shards):
+        shard_port = port + 1 + i
+        processes.append(_start_server({
+            "PW_ROLE": "shard",
+            "PW_SHARD_ID": f"shard-{i}",
+            "PW_SHARD_HOST": f"{public_host}:{shard_port}"
+        }, shard_port, bind_host, base_env, log_level))
+    return processes + broker
+
+
+def spawn_nodes(nodes: int, port: int, public_host: str = "localhost",
+                bind_host: str = "0.0.0.0", env: Dict = None,
+                log_level: str = "info", backend: str = "sqlite",
+                broker_address: str = BROKER_ADDRESS) -> List[subprocess.Popen]:
+    """启动 nodes 个对等节点（端口从 port 开始），返回进程列表，代理进程（如果有）在最后"""
+    base_env = _cluster_env(env, backend, broker_address)
+    broker = [spawn_broker(broker_address, base_env)] if backend == "broker" else []
+
+    processes = []
+    for i in range(nodes):
+        node_port = port + i
+        processes.append(_start_server({
+            "PW_ROLE": "node",
+            "PW_SHARD_ID": f"node-{i}",
+            "PW_SHARD_HOST": f"{public_host}:{node_port}"
+        }, node_port, bind_host, base_env, log_level))
+    return processes + broker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以集群模式启动 PixelWarzone 服务器")
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 1, help="分片进程数，默认等于 CPU 核数")
+    parser.add_argument("--nodes", type=int, default=0, help="改为启动这么多个对等节点，而不是路由 + 分片")
+    parser.add_argument("--port", type=int, default=3000, help="第一个进程的端口，其余进程依次使用后面的端口")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--public-host", default="localhost", help="客户端连接分片或节点时使用的主机名")
+    parser.add_argument("--backend", choices=("sqlite", "broker"), default="sqlite", help="集群后端")
+    parser.add_argument("--broker", default=BROKER_ADDRESS, help="代理地址 host:port")
+    parser.add_argument("--broker-only", action="store_true", help="只运行代理进程")
+    args = parser.parse_args()
+
+    if args.broker_only:
+        print(f"集群代理: {args.broker}")
+        try:
+            asyncio.run(serve_broker(args.broker, os.environ.get(BROKER_TOKEN_ENV)))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.nodes:
+        processes = spawn_nodes(args.nodes, args.port, args.public_host, args.host,
+                                backend=args.backend, broker_address=args.broker)
+        for i in range(args.nodes):
+            print(f"节点 node-{i}: http://{args.public_host}:{args.port + i}")
+    else:
+        processes = spawn_cluster(args.shards, args.port, args.public_host, args.host,
+                                  backend=args.backend, broker_address=args.broker)
+        print(f"路由: http://{args.public_host}:{args.port}")
+        for i in range(args.shards):
+            print(f"分片 shard-{i}: ws://{args.public_host}:{args.port + 1 + i}")
+    if args.backend == "broker":
+        print(f"集群代理: {args.broker}")
+
+    def shutdown(*_):
+        # 按列表顺序逐个结束，代理进程最后退出，服务器退出时还能写回统计
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+                process.wait()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown()
+
+
+if __name__ == "__main__":
+    main()
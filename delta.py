@@ -0,0 +1,114 @@
+import json
+from collections import OrderedDict
+from typing import Dict, Optional
+
+KEYFRAME_INTERVAL = 250  # 每隔多少帧强制发送一次关键帧
+SNAPSHOT_HISTORY = 64  # 保留多少帧快照用作增量基准
+
+
+class DeltaEncoder:
+    """房间级的快照/增量编码器
+
+    每帧记录一份快照（公开的玩家状态、存活子弹 id、房间信息）。
+    每个客户端以自己最后确认（ack）的那一帧为基准接收增量；
+    没有确认过、基准已超出历史窗口或到了关键帧周期时发送关键帧。
+    子弹只在出现时发送一次发射信息（位置、速度、发射帧和发射时的 clock），
+    之后由客户端按 clock 之差外推位置，消失时只发送 id。
+    同一帧内基准相同的客户端共用一次序列化结果。
+    """
+
+    def __init__(self, keyframe_interval: int = KEYFRAME_INTERVAL,
+                 history: int = SNAPSHOT_HISTORY):
+        self.keyframe_interval = keyframe_interval
+        self.history_size = history
+        self.history: "OrderedDict[int, Dict]" = OrderedDict()
+        self.acks: Dict[str, int] = {}  # {username: 已确认的帧号}
+        self.current: Optional[Dict] = None
+        self._spawns: Dict[int, Dict] = {}
+        self._cache: Dict = {}
+
+    def ack(self, username: str, tick):
+        if not isinstance(tick, int) or tick not in self.history:
+            return
+        if tick > self.acks.get(username, -1):
+            self.acks[username] = tick
+
+    def forget(self, username: str):
+        self.acks.pop(username, None)
+
+    def capture(self, room):
+        """记录房间当前帧的快照，每帧调用一次"""
+        snapshot = {
+            "tick": room.tick,
+            "clock": round(room.clock, 3),
+            "players": room.public_players(),
+            "bullets": frozenset(room.bullet_spawns),
+            "room_info": room.room_info()
+        }
+        self.history[room.tick] = snapshot
+        while len(self.history) > self.history_size:
+            self.history.popitem(last=False)
+        self.current = snapshot
+        self._spawns = room.bullet_spawns
+        self._cache = {}
+
+    def encode_for(self, username: str) -> str:
+        """返回发给该客户端的本帧消息（已序列化）"""
+        tick = self.current["tick"]
+        base = self.acks.get(username)
+        if (base is None or base not in self.history or
+                tick % self.keyframe_interval == 0):
+            base = None
+
+        message = self._cache.get(base)
+        if message is None:
+            if base is None:
+                message = json.dumps(self._keyframe())
+            else:
+                message = json.dumps(self._delta(self.history[base]))
+            self._cache[base] = message
+        return message
+
+    def _keyframe(self) -> Dict:
+        current = self.current
+        return {
+            "type": "keyframe",
+            "tick": current["tick"],
+            "clock": current["clock"],
+            "players": current["players"],
+            "bullets": [self._spawns[i] for i in current["bullets"]],
+            "room_info": current["room_info"]
+        }
+
+    def _delta(self, base: Dict) -> Dict:
+        current = self.current
+        message = {"type": "delta", "tick": current["tick"], "clock": current["clock"], "base": base["tick"]}
+
+        # 玩家只发送相对基准变化的字段
+        base_players = base["players"]
+        changed = {}
+        for username, player in current["players"].items():
+            old = base_players.get(username)
+            if old is None:
+                changed[username] = player
+                continue
+            diff = {k: v for k, v in player.items() if old.get(k) != v}
+            if diff:
+                changed[username] = diff
+        if changed:
+            message["players"] = changed
+        left = [u for u in base_players if u not in current["players"]]
+        if left:
+            message["left"] = left
+
+        # 子弹只发送新出现的发射信息和消失的 id
+        new_ids = current["bullets"] - base["bullets"]
+        if new_ids:
+            message["bullets"] = [self._spawns[i] for i in new_ids]
+        removed = base["bullets"] - current["bullets"]
+        if removed:
+            message["removed"] = list(removed)
+
+        if current["room_info"] != base["room_info"]:
+            message["room_info"] = current["room_info"]
+        return message
@@ -0,0 +1,560 @@
+import json
+import math
+import random
+import time
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+from delta import DeltaEncoder
+from inputs import PlayerInput, clamp_vector
+from interest import InterestEncoder
+from lag_compensation import MAX_REWIND_SECONDS, PositionHistory, rewind_ticks
+from spatial import UniformGrid
+
+MAP_WIDTH = 1920
+MAP_HEIGHT = 1080
+
+# 模拟参数
+TICK_RATE = 50  # 默认每秒模拟帧数，可以按房间调低（见 Room.tick_rate）
+# 下面"每帧"的速度和回血量都以这个帧率为基准，实际每帧按真实经过的时间缩放，
+# 因此调整模拟帧率不改变游戏速度
+REFERENCE_TICK_RATE = 50
+MAX_STEP_DT = 0.1  # 单帧最多推进的时间（秒），避免卡顿或恢复后一次跳得太远
+SWEEP_SCALE = 1 + 1e-6  # 一帧推进超过一个基准帧（时间戳的浮点误差以外）时，子弹按扫掠检测判定命中
+BULLET_DAMAGE = 300
+MAX_ROOM_PLAYERS = 64  # 房间人数上限的上限（二进制协议用一个字节表示人数和子弹所属玩家）
+BULLET_LIFETIME = 10  # 子弹最长存活秒数
+HIT_RADIUS = 30
+HIT_RADIUS_SQ = HIT_RADIUS * HIT_RADIUS
+MAX_HP = 1000
+REGEN_DELAY = 5  # 受伤后多少秒开始回血
+REGEN_PER_TICK = 10
+
+# 输入校验：与前端 js/config.js 中的数值一致
+PLAYER_SPEED = 6  # 每个基准帧每个方向的最大移动距离
+BULLET_SPEED = 20  # 子弹每个基准帧的飞行距离，客户端给出的方向会被归一化到这个速度
+MAX_BULLET_DIST = 800  # 子弹最大射程
+SHOT_COOLDOWN = 1.0  # 平均每颗子弹的间隔（秒）
+SHOT_BURST = 2  # 允许连续发射的子弹数，吸收网络抖动造成的射击聚集
+
+# step() 内各阶段的名称，与 Room.phase_times 一一对应
+STEP_PHASES = ("players", "bullets", "collision", "regen")
+
+MAX_POOLED_BULLETS = 1024  # 每个房间最多保留多少个回收的子弹对象
+
+
+class Bullet:
+    """服务器端的子弹
+
+    用 __slots__ 省去每颗子弹的实例字典；失效的子弹放回房间的对象池，
+    下次发射时原地重置后复用。hit_set 在第一次命中时才创建。
+    view 是发给客户端的字典，第一次需要时创建，之后每帧只更新坐标。
+    rewind 为延迟补偿回溯的帧数：子弹与玩家在 rewind 帧之前的位置做命中判定。
+    """
+
+    __slots__ = ("id", "x", "y", "dx", "dy", "owner", "start_x", "start_y",
+                 "max_dist", "created_at", "hit_set", "view", "rewind")
+
+    def reset(self, owner: str, x: float, y: float, dx: float, dy: float, max_dist: float,
+              created_at: float, start_x: float, start_y: float, hit_set: Optional[set],
+              rewind: int):
+        self.x = x
+        self.y = y
+        self.dx = dx
+        self.dy = dy
+        self.owner = owner
+        self.start_x = start_x
+        self.start_y = start_y
+        self.max_dist = max_dist
+        self.created_at = created_at
+        self.hit_set = hit_set
+        self.view = None
+        self.rewind = rewind
+
+
+class Room:
+    def __init__(self, room_id: str, name: str, creator: str, max_players: int = 8, password: str = None,
+                 seed: Optional[int] = None, tick_rate: int = TICK_RATE):
+        self.room_id = room_id
+        self.name = name
+        self.creator = creator
+        self.max_players = max_players
+        self.password = password
+        # 出生和重生位置使用房间自己的随机数生成器，相同种子和输入下模拟结果完全一致（录像回放依赖这一点）
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.recording = None  # 录像缓冲（replay.RoomRecording），未开启录像时为 None
+        self.players = {}  # {username: player_data}
+        self.bullets: List[Bullet] = []
+        self._bullet_pool: List[Bullet] = []
+        self.grid = UniformGrid(MAP_WIDTH, MAP_HEIGHT)
+        self.tick_rate = tick_rate
+        self.last_step: Optional[float] = None  # 上一帧的时间戳，空闲时为 None（下一帧按标称间隔推进）
+        self.max_bullet_speed = 0.0  # 发射过的子弹的最大速度（每基准帧），决定扫掠检测的查询半径
+        self.max_rewind = round(MAX_REWIND_SECONDS * tick_rate)  # 延迟补偿最多回溯的帧数
+        self.history = PositionHistory(self.max_rewind + 1)  # 最近几帧的玩家位置
+        self.tick = 0
+        self.clock = 0.0  # 累计推进的基准帧数（每帧加上 scale），客户端按它而不是帧号外推子弹
+        self.next_bullet_id = 0
+        self.bullet_spawns = {}  # {bullet_id: 发射时的公开信息}，只保留存活子弹
+        self.connections = {}  # {username: websocket}
+        self.protocols = {}  # {username: "json" | "delta" | "binary" | "interest"}
+        self.outboxes = {}  # {username: Outbox}
+        self.inputs: Dict[str, PlayerInput] = {}  # 两帧之间缓冲的输入，下一帧开始时生效
+        self.delta = DeltaEncoder()
+        self.interest = InterestEncoder(MAP_WIDTH, MAP_HEIGHT)
+        self.phase_times = (0.0, 0.0, 0.0, 0.0)  # 上一帧 step() 各阶段耗时（秒），见 STEP_PHASES
+        self.game_running = False
+        self.created_at = time.time()
+        self.empty_since = self.created_at  # 最后一个连接断开的时间，房间回收用
+        self._views: Dict[str, object] = {}  # 本帧的公开状态，见 _view()
+        self._view_tick = -1
+
+    def add_player(self, username: str, websocket) -> bool:
+        if len(self.players) >= self.max_players:
+            return False
+
+        self.players[username] = {
+            "x": self.rng.randint(100, MAP_WIDTH-100),
+            "y": self.rng.randint(100, MAP_HEIGHT-100),
+            "dx": 0,
+            "dy": 0,
+            "hp": MAX_HP,
+            "last_hit": time.time(),
+            "kills": 0,
+            "deaths": 0
+        }
+        self.connections[username] = websocket
+        self.inputs[username] = PlayerInput(1 / SHOT_COOLDOWN, SHOT_BURST, time.monotonic())
+        self._views.clear()
+        if self.recording:
+            self.recording.join(username, self.players[username]["last_hit"])
+        return True
+
+    def resume_player(self, username: str, websocket) -> bool:
+        """把连接接回房间里已有、但没有连接的玩家（从快照恢复的房间，或创建房间、匹配时
+        以 None 占位的玩家），没有这样的玩家时返回 False"""
+        if username not in self.players or self.connections.get(username) is not None:
+            return False
+        self.connections[username] = websocket
+        return True
+
+    def remove_player(self, username: str):
+        if self.players.pop(username, None) is not None and self.recording:
+            self.recording.leave(username)
+        self.connections.pop(username, None)
+        self.protocols.pop(username, None)
+        self.outboxes.pop(username, None)
+        self.inputs.pop(username, None)
+        self.delta.forget(username)
+        self.interest.forget(username)
+        self._views.clear()
+
+        # 如果房间空了，标记为待删除
+        if not self.players and self.game_running:
+            self.game_running = False
+
+    def _register_bullet(self, owner: str, x: float, y: float, dx: float, dy: float) -> int:
+        """分配子弹 id 并记录发射信息，客户端据此自行外推子弹位置"""
+        bullet_id = self.next_bullet_id
+        self.next_bullet_id += 1
+        speed = math.hypot(dx, dy)
+        if speed > self.max_bullet_speed:
+            self.max_bullet_speed = speed
+        self.bullet_spawns[bullet_id] = {
+            "id": bullet_id,
+            "x": x, "y": y,
+            "dx": dx, "dy": dy,
+            "owner": owner,
+            "tick": self.tick,
+            "clock": round(self.clock, 3)
+        }
+        return bullet_id
+
+    def _prune_spawns(self, alive_ids):
+        if len(alive_ids) != len(self.bullet_spawns):
+            for bullet_id in self.bullet_spawns.keys() - alive_ids:
+                del self.bullet_spawns[bullet_id]
+
+    def spawn_bullet(self, owner: str, x: float, y: float, dx: float, dy: float, max_dist: float,
+                     now: float, start_x: Optional[float] = None, start_y: Optional[float] = None,
+                     hit_set: Optional[set] = None, rewind: int = 0) -> int:
+        """发射一颗子弹，返回子弹 id；出发点默认为当前位置"""
+        bullet = self._bullet_pool.pop() if self._bullet_pool else Bullet()
+        bullet.reset(owner, x, y, dx, dy, max_dist, now,
+                     x if start_x is None else start_x, y if start_y is None else start_y,
+                     hit_set or None, rewind)
+        bullet.id = self._register_bullet(owner, x, y, dx, dy)
+        self.bullets.append(bullet)
+        return bullet.id
+
+    def add_bullet(self, bullet: Dict):
+        """以字典形式添加子弹（与 numpy 后端一致），字段同 Bullet"""
+        bullet["id"] = self.spawn_bullet(
+            bullet["owner"], bullet["x"], bullet["y"], bullet["dx"], bullet["dy"],
+            bullet["max_dist"], bullet["created_at"], bullet["start_x"], bullet["start_y"],
+            set(bullet["hit_set"]) if bullet.get("hit_set") else None, bullet.get("rewind", 0))
+
+    def handle_input(self, username: str, msg: Dict) -> bool:
+        """校验一条客户端输入并放入缓冲，下一帧开始时生效；被拒绝时返回 False
+
+        移动速度每个分量限制在 PLAYER_SPEED 以内，子弹方向归一化到 BULLET_SPEED，
+        射程限制在 MAX_BULLET_DIST 以内，射击频率受令牌桶限制，
+        因此每名玩家同时存在的子弹数有上限。
+
+        射击可以带上客户端开枪时看到的帧号 tick（delta 客户端缺省时用最后确认的帧），
+        子弹据此回溯若干帧做命中判定，最多回溯 max_rewind 帧。
+        """
+        inputs = self.inputs.get(username)
+        player = self.players.get(username)
+        if inputs is None or player is None:
+            return False
+
+        kind = msg.get("type")
+        if kind == "move":
+            move = clamp_vector(msg.get("dx", 0), msg.get("dy", 0), math.inf)
+            if move is None:
+                return False
+            # 按轴限制，前端斜向移动时两个分量都是 PLAYER_SPEED
+            inputs.move = (min(max(move[0], -PLAYER_SPEED), PLAYER_SPEED),
+                           min(max(move[1], -PLAYER_SPEED), PLAYER_SPEED))
+        elif kind == "shoot":
+            if player["hp"] <= 0:
+                return False
+            direction = clamp_vector(msg.get("dx", player["dx"] or BULLET_SPEED),
+                                     msg.get("dy", player["dy"] or 0), math.inf)
+            if direction is None or direction == (0, 0):
+                return False
+            max_dist = msg.get("max_dist", MAX_BULLET_DIST)
+            if type(max_dist) not in (int, float) or not math.isfinite(max_dist):
+                max_dist = MAX_BULLET_DIST
+            if not inputs.shot_bucket.take(time.monotonic()):
+                return False
+            scale = BULLET_SPEED / math.hypot(*direction)
+            # 输入在下一帧开始、self.tick 递增之前生效，此时算出的回溯帧数不变
+            view_tick = msg.get("tick", self.delta.acks.get(username))
+            inputs.shots.append((direction[0] * scale, direction[1] * scale,
+                                 min(max(max_dist, 0), MAX_BULLET_DIST),
+                                 rewind_ticks(self.tick, view_tick, self.max_rewind)))
+        elif kind == "respawn":
+            inputs.respawn = True
+        else:
+            return False
+        return True
+
+    def apply_inputs(self, now: float):
+        """让上一帧以来缓冲的输入生效，在 step() 之前调用"""
+        if self.recording:
+            self.recording.tick(self, now)
+        for username, inputs in self.inputs.items():
+            player = self.players.get(username)
+            if player is None:
+                continue
+            if inputs.respawn:
+                inputs.respawn = False
+                if player["hp"] <= 0:
+                    player.update({
+                        "x": self.rng.randint(100, MAP_WIDTH-100),
+                        "y": self.rng.randint(100, MAP_HEIGHT-100),
+                        "hp": MAX_HP,
+                        "last_hit": now
+                    })
+            if inputs.move is not None:
+                player["dx"], player["dy"] = inputs.move
+                inputs.move = None
+            if inputs.shots:
+                for dx, dy, max_dist, rewind in inputs.shots:
+                    self.spawn_bullet(username, player["x"], player["y"], dx, dy, max_dist, now,
+                                      rewind=rewind)
+                player["last_hit"] = now
+                inputs.shots.clear()
+
+    def _step_scale(self, now: float) -> float:
+        """本帧推进的时间折合成多少个基准帧，移动距离和回血量都乘以它
+
+        按与上一帧的真实间隔计算，限制在 MAX_STEP_DT 以内；第一帧和
+        空闲之后的第一帧按标称间隔 1 / tick_rate 计算。
+        """
+        if self.last_step is None:
+            dt = 1 / self.tick_rate
+        else:
+            dt = min(max(now - self.last_step, 0.0), MAX_STEP_DT)
+        return dt * REFERENCE_TICK_RATE
+
+    def _finish_step(self, now: float):
+        # 空闲的房间会降频或休眠，恢复后的第一帧不应按停下的这段时间推进
+        self.last_step = None if self.is_idle() else now
+
+    def step(self, now: float) -> List[Dict]:
+        """推进一帧模拟，返回本帧的命中事件列表"""
+        self.tick += 1
+        scale = self._step_scale(now)
+        self.clock += scale
+        t0 = perf_counter()
+
+        # 移动玩家
+        for player in self.players.values():
+            player["x"] = max(20, min(MAP_WIDTH-20, player["x"] + player["dx"] * scale))
+            player["y"] = max(20, min(MAP_HEIGHT-20, player["y"] + player["dy"] * scale))
+        self.history.record(self.tick, self.players)
+
+        t1 = perf_counter()
+
+        # 移动子弹，存活的子弹原地前移压缩，失效的子弹放回对象池
+        bullets = self.bullets
+        pool = self._bullet_pool
+        spawns = self.bullet_spawns
+        rewinds = set()  # 存活子弹中出现的回溯帧数（不含 0）
+        alive = 0
+        for bullet in bullets:
+            x = bullet.x = bullet.x + bullet.dx * scale
+            y = bullet.y = bullet.y + bullet.dy * scale
+
+            # 检查子弹边界和距离（比较距离平方，省去开方）
+            ddx = x - bullet.start_x
+            ddy = y - bullet.start_y
+            max_dist = bullet.max_dist
+            if (0 < x < MAP_WIDTH and 0 < y < MAP_HEIGHT and
+                    max_dist > 0 and ddx * ddx + ddy * ddy < max_dist * max_dist and
+                    now - bullet.created_at < BULLET_LIFETIME):
+                bullets[alive] = bullet
+                alive += 1
+                if bullet.rewind:
+                    rewinds.add(bullet.rewind)
+            else:
+                del spawns[bullet.id]
+                if len(pool) < MAX_POOLED_BULLETS:
+                    bullet.hit_set = None
+                    pool.append(bullet)
+        del bullets[alive:]
+        t2 = perf_counter()
+
+        # 碰撞检测：只检查玩家附近格子里的子弹。
+        # 带延迟补偿的子弹与玩家在 rewind 帧之前的位置比较，每种回溯帧数各查询一次网格。
+        # 这一帧推进超过一个基准帧时（帧率低于基准帧率，或卡顿后按真实间隔追赶），子弹按这一帧
+        # 走过的线段做扫掠检测，每帧飞行距离超过玩家直径也不会穿透，网格查询半径加上子弹这一帧的
+        # 最大飞行距离；不超过一个基准帧时仍只按终点判定，结果与原来一致
+        hits = []
+        grid = self.grid
+        grid.rebuild_points([bullet.x for bullet in bullets], [bullet.y for bullet in bullets])
+        swept = scale > SWEEP_SCALE
+        reach = HIT_RADIUS + self.max_bullet_speed * scale if swept else HIT_RADIUS
+        for username, player in self.players.items():
+            px, py = player["x"], player["y"]
+            if rewinds:
+                targets = {0: (px, py)}
+                for rewind in rewinds:
+                    targets[rewind] = self.history.position(self.tick - rewind, username, (px, py))
+                candidates = sorted(i for rewind, (x, y) in targets.items()
+                                    for i in grid.query(x, y, reach) if bullets[i].rewind == rewind)
+            else:
+                targets = None
+                candidates = grid.query(px, py, reach)
+            for i in candidates:
+                bullet = bullets[i]
+                hit_set = bullet.hit_set
+                if bullet.owner == username or (hit_set is not None and username in hit_set):
+                    continue
+
+                if targets is None:
+                    ddx = px - bullet.x
+                    ddy = py - bullet.y
+                else:
+                    tx, ty = targets[bullet.rewind]
+                    ddx = tx - bullet.x
+                    ddy = ty - bullet.y
+                if ddx * ddx + ddy * ddy >= HIT_RADIUS_SQ:
+                    if not swept:
+                        continue
+                    # 终点不在范围内时，求线段上离玩家最近的点（与 numpy 后端的运算顺序一致）
+                    sdx = bullet.dx * scale
+                    sdy = bullet.dy * scale
+                    length_sq = sdx * sdx + sdy * sdy
+                    if not length_sq:
+                        continue
+                    rx = ddx + sdx  # 玩家相对线段起点的位置
+                    ry = ddy + sdy
+                    t = (rx * sdx + ry * sdy) / length_sq
+                    t = 0.0 if t < 0 else (1.0 if t > 1 else t)
+                    cx = rx - t * sdx
+                    cy = ry - t * sdy
+                    if cx * cx + cy * cy >= HIT_RADIUS_SQ:
+                        continue
+                player["hp"] -= BULLET_DAMAGE
+                player["last_hit"] = now
+                if hit_set is None:
+                    bullet.hit_set = {username}
+                else:
+                    hit_set.add(username)
+
+                killed = player["hp"] <= 0
+                if killed:
+                    player["deaths"] += 1
+                    if bullet.owner in self.players:
+                        self.players[bullet.owner]["kills"] += 1
+
+                hits.append({
+                    "owner": bullet.owner,
+                    "target": username,
+                    "damage": BULLET_DAMAGE,
+                    "killed": killed
+                })
+        t3 = perf_counter()
+
+        # 回血逻辑
+        for player in self.players.values():
+            if now - player["last_hit"] > REGEN_DELAY and player["hp"] < MAX_HP:
+                player["hp"] += REGEN_PER_TICK * scale  # 每个基准帧回10血
+                if player["hp"] > MAX_HP:
+                    player["hp"] = MAX_HP
+
+        self._finish_step(now)
+        self.phase_times = (t1 - t0, t2 - t1, t3 - t2, perf_counter() - t3)
+        return hits
+
+    def bullet_count(self) -> int:
+        return len(self.bullets)
+
+    def _bullet_records(self) -> List[tuple]:
+        """存活子弹的 (owner, x, y, dx, dy, max_dist, created_at, start_x, start_y, hit_set, rewind)"""
+        return [(b.owner, b.x, b.y, b.dx, b.dy, b.max_dist, b.created_at, b.start_x, b.start_y,
+                 tuple(b.hit_set or ()), b.rewind) for b in self.bullets]
+
+    def snapshot(self) -> Dict:
+        """房间的模拟状态，只含基本类型，用于进程重启后恢复（见 snapshot.py）
+
+        连接、各协议的编码器和延迟补偿的历史位置不保存，恢复后重新建立。
+        """
+        return {
+            "room_id": self.room_id,
+            "name": self.name,
+            "creator": self.creator,
+            "max_players": self.max_players,
+            "password": self.password,
+            "seed": self.seed,
+            "rng": self.rng.getstate(),
+            "created_at": self.created_at,
+            "tick": self.tick,
+            "clock": self.clock,
+            "next_bullet_id": self.next_bullet_id,
+            "players": {username: dict(player) for username, player in self.players.items()},
+            "bullets": self._bullet_records()
+        }
+
+    def restore(self, state: Dict):
+        """在新建的房间上载入 snapshot() 的结果，玩家等待重新连接（见 resume_player）"""
+        self.rng.setstate(state["rng"])
+        self.created_at = state["created_at"]
+        self.tick = state["tick"]
+        self.clock = state.get("clock", 0.0)
+        now = time.monotonic()
+        for username, player in state["players"].items():
+            self.players[username] = dict(player)
+            self.inputs[username] = PlayerInput(1 / SHOT_COOLDOWN, SHOT_BURST, now)
+        # 子弹按当前帧重新登记发射信息，客户端从恢复时的位置外推
+        self.next_bullet_id = state["next_bullet_id"]
+        for owner, x, y, dx, dy, max_dist, created_at, start_x, start_y, hit_set, rewind in state["bullets"]:
+            self.spawn_bullet(owner, x, y, dx, dy, max_dist, created_at, start_x, start_y,
+                              set(hit_set), rewind)
+        self._views.clear()
+
+    def is_idle(self) -> bool:
+        """没有子弹、没有玩家在移动或回血时，之后的帧与这一帧完全相同"""
+        if self.bullet_count():
+            return False
+        for player in self.players.values():
+            if player["dx"] or player["dy"] or 0 < player["hp"] < MAX_HP:
+                return False
+        return True
+
+    def _view(self, name: str, build: Callable[[], object]):
+        """本帧的公开状态只生成一次，各种协议共用；进入下一帧或玩家进出时失效
+
+        返回的对象在多个编码器之间共享，调用方不能修改。
+        """
+        if self._view_tick != self.tick:
+            self._views.clear()
+            self._view_tick = self.tick
+        view = self._views.get(name)
+        if view is None:
+            view = self._views[name] = build()
+        return view
+
+    def public_bullets(self) -> List[Dict]:
+        """发给客户端的子弹列表，去掉 hit_set、start_x 等服务器专用字段"""
+        return self._view("bullets", self._public_bullets)
+
+    def _public_bullets(self) -> List[Dict]:
+        views = []
+        for bullet in self.bullets:
+            view = bullet.view
+            if view is None:
+                view = bullet.view = {
+                    "id": bullet.id,
+                    "x": bullet.x, "y": bullet.y,
+                    "dx": bullet.dx, "dy": bullet.dy,
+                    "owner": bullet.owner
+                }
+            else:
+                view["x"] = bullet.x
+                view["y"] = bullet.y
+            views.append(view)
+        return views
+
+    def public_players(self) -> Dict[str, Dict]:
+        """发给客户端的玩家状态，不含 last_hit 等服务器专用字段"""
+        return self._view("players", self._public_players)
+
+    def _public_players(self) -> Dict[str, Dict]:
+        return {
+            username: {
+                "x": round(player["x"], 1),
+                "y": round(player["y"], 1),
+                "dx": player["dx"],
+                "dy": player["dy"],
+                "hp": max(0, int(player["hp"])),
+                "kills": player["kills"],
+                "deaths": player["deaths"],
+                "status": "dead" if player["hp"] <= 0 else "alive"
+            }
+            for username, player in self.players.items()
+        }
+
+    def room_info(self) -> Dict:
+        return {
+            "name": self.name,
+            "player_count": len(self.players),
+            "max_players": self.max_players,
+            "tick_rate": self.tick_rate
+        }
+
+    def get_state(self) -> Dict:
+        """完整状态（json 协议），与 public_players/public_bullets 共用本帧的缓存"""
+        return self._view("state", lambda: {
+            "tick": self.tick,
+            "players": self.public_players(),
+            "bullets": self.public_bullets(),
+            "room_info": self.room_info()
+        })
+
+    def state_json(self) -> str:
+        """序列化后的完整状态，每帧只序列化一次"""
+        return self._view("state_json", lambda: json.dumps(self.get_state()))
+
+
+def new_room(room_id: str, name: str, creator: str, max_players: int = 8,
+             password: str = None, backend: str = "dict", seed: Optional[int] = None,
+             tick_rate: int = TICK_RATE) -> Room:
+    """按模拟后端创建房间：dict（默认）或 numpy"""
+    if backend == "numpy":
+        from numpy_backend import NumpyRoom
+        return NumpyRoom(room_id, name, creator, max_players, password, seed, tick_rate)
+    return Room(room_id, name, creator, max_players, password, seed, tick_rate)
+
+
+def restore_room(state: Dict, backend: str = "dict", tick_rate: int = TICK_RATE) -> Room:
+    """按 Room.snapshot() 的结果重建房间，模拟后端和帧率可以与保存时不同"""
+    room = new_room(state["room_id"], state["name"], state["creator"], state["max_players"],
+                    state["password"], backend=backend, seed=state["seed"], tick_rate=tick_rate)
+    room.restore(state)
+    return room
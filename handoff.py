@@ -0,0 +1,97 @@
+"""进程交接：新进程接管旧进程的监听 socket，玩家不需要重新登录或加入房间
+
+旧进程在 PW_HANDOFF_SOCKET 指定的 Unix socket 上等待交接请求。新进程以同样的配置
+启动时先连接这个路径，发现有旧进程在监听就请求交接：
+
+1. 旧进程停止所有房间的模拟，写入最终快照（见 snapshot.py）；
+2. 旧进程通过 SCM_RIGHTS 把监听 socket 的文件描述符发给新进程，回复 ready；
+3. 旧进程停止接受连接，以 1012（服务重启）关闭所有 WebSocket 后退出；
+4. 新进程用收到的 socket 开始服务并从快照恢复，客户端立即重连，回到原来的位置。
+
+监听 socket 在整个过程中一直打开，交接期间到达的连接在内核的等待队列里排队，不会被拒绝。
+"""
+import logging
+import os
+import socket
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+HANDOFF_TIMEOUT = 10.0  # 等待旧进程写完快照并交出 socket 的最长时间（秒）
+REQUEST = b"handoff\n"
+READY = b"ready"
+
+
+def request_handoff(path: str, timeout: float = HANDOFF_TIMEOUT) -> Optional[socket.socket]:
+    """向旧进程请求交接，返回接管的监听 socket；没有旧进程在监听时返回 None"""
+    if not os.path.exists(path):
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+    with conn:
+        try:
+            conn.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return None  # 上一个进程已经退出，留下的文件在 HandoffListener.start 中清理
+        conn.sendall(REQUEST)
+        message, fds, _, _ = socket.recv_fds(conn, 64, 1)
+    if message != READY or not fds:
+        raise RuntimeError(f"交接失败: {message.decode(errors='replace') or '旧进程断开了连接'}")
+    return socket.socket(fileno=fds[0])
+
+
+class HandoffListener:
+    """在后台线程中等待交接请求，只处理一次
+
+    prepare 在本线程中阻塞执行（停止模拟、写快照），成功后交出 listen_socket，
+    再调用 finish 让服务器退出。
+    """
+
+    def __init__(self, path: str, listen_socket: socket.socket,
+                 prepare: Callable[[], None], finish: Callable[[], None]):
+        self.path = path
+        self.listen_socket = listen_socket
+        self.prepare = prepare
+        self.finish = finish
+        self.handed_off = False
+        self._server: Optional[socket.socket] = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # 旧进程留下的文件（已交接或已退出）
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        server.listen(1)
+        self._server = server
+        threading.Thread(target=self._serve, name="handoff", daemon=True).start()
+
+    def _serve(self):
+        while not self.handed_off:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return  # close() 之后
+            with conn:
+                try:
+                    conn.settimeout(HANDOFF_TIMEOUT)
+                    if conn.recv(len(REQUEST)) != REQUEST:
+                        continue
+                    logger.info("收到交接请求，写入快照并交出监听 socket")
+                    self.prepare()
+                    socket.send_fds(conn, [READY], [self.listen_socket.fileno()])
+                    self.handed_off = True
+                except Exception as e:
+                    logger.error(f"Handoff error: {e}")
+                    try:
+                        conn.sendall(str(e).encode())
+                    except OSError:
+                        pass
+                    continue
+            self.finish()
+
+    def close(self):
+        # 不删除 socket 文件：交接之后这个路径已经属于新进程
+        if self._server is not None:
+            self._server.close()
+            self._server = None
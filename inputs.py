@@ -0,0 +1,64 @@
+import math
+from typing import List, Optional, Tuple
+
+# 每个连接每秒最多处理的消息数：delta 客户端每帧一条 ack，另加 INPUT_MESSAGE_RATE 条移动和射击，
+# 见 message_rate()。50 Hz 下为 120 条
+INPUT_MESSAGE_RATE = 70
+MESSAGE_BURST = 60
+# 一秒内超出速率丢弃这么多条消息的连接视为洪泛，直接断开
+MAX_DROPPED_PER_SECOND = 120
+
+
+def message_rate(tick_rate: int) -> int:
+    """房间帧率下每个连接每秒允许的消息数，ack 随帧率增加，输入的额度不被挤占"""
+    return tick_rate + INPUT_MESSAGE_RATE
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多积攒 capacity 个"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float = 0.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if tokens < 1:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1
+        return True
+
+
+def clamp_vector(dx, dy, limit: float) -> Optional[Tuple[float, float]]:
+    """校验客户端给出的向量，长度超过 limit 时按比例缩短；不是有限数值时返回 None"""
+    if type(dx) not in (int, float) or type(dy) not in (int, float):
+        return None
+    if not (math.isfinite(dx) and math.isfinite(dy)):
+        return None
+    length_sq = dx * dx + dy * dy
+    if length_sq > limit * limit:
+        scale = limit / math.sqrt(length_sq)
+        dx, dy = dx * scale, dy * scale
+    return dx, dy
+
+
+class PlayerInput:
+    """单个玩家在两帧之间的输入缓冲
+
+    移动只保留最后一次（合并），射击在通过令牌桶后排队，重生只记一个标记，
+    都在下一帧开始时由 Room.apply_inputs 统一生效。
+    """
+
+    __slots__ = ("move", "shots", "respawn", "shot_bucket")
+
+    def __init__(self, shot_rate: float, shot_burst: int, now: float):
+        self.move: Optional[Tuple[float, float]] = None
+        self.shots: List[Tuple[float, float, float]] = []  # [(dx, dy, max_dist)]
+        self.respawn = False
+        self.shot_bucket = TokenBucket(shot_rate, shot_burst, now)
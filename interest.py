@@ -0,0 +1,130 @@
+import json
+from typing import Dict, List, Optional
+
+from spatial import UniformGrid
+
+NEAR_RADIUS = 480  # 这个距离内的玩家每帧发送
+FAR_INTERVAL = 5  # 更远的玩家每隔这么多帧随一次完整帧发送
+BULLET_RADIUS = 400  # 只发送这个距离内的子弹（子弹约 20 帧内飞不到的不发），自己发射的总是发送
+CELL_SIZE = 160
+
+
+class InterestEncoder:
+    """房间级的兴趣区域编码器
+
+    每帧为玩家和子弹各建一个均匀网格，并把每个非空格子里的对象按需序列化成
+    一个片段（每帧每个格子至多一次，一个格子只调用一次 json.dumps）。每个客户端的消息只拼接自己附近格子的
+    片段：附近的玩家和子弹每帧发送，远处的玩家每 far_interval 帧随完整帧发送
+    一次，远处的子弹不发送。裁剪以格子为单位，实际范围略大于给定半径。
+    不同客户端的完整帧错开到不同的帧上，同一帧内所有完整帧共用一次拼接结果。
+    """
+
+    def __init__(self, width: float, height: float, near_radius: float = NEAR_RADIUS,
+                 far_interval: int = FAR_INTERVAL, bullet_radius: float = BULLET_RADIUS):
+        self.near_radius = near_radius
+        self.far_interval = far_interval
+        self.bullet_radius = bullet_radius
+        self.player_grid = UniformGrid(width, height, CELL_SIZE)
+        self.bullet_grid = UniformGrid(width, height, CELL_SIZE)
+        self.offsets: Dict[str, int] = {}  # {username: 完整帧相位}
+        self.tick = 0
+        self.clock = 0.0
+        self._names: List[str] = []
+        self._players: List[Dict] = []
+        self._index: Dict[str, int] = {}  # {username: 在 _players 中的下标}
+        self._bullets: List[Dict] = []
+        self._own_bullets: Dict[str, List[int]] = {}  # {owner: 子弹下标}
+        self._player_cells: Dict[int, str] = {}  # {格子: 片段}
+        self._bullet_cells: Dict[int, str] = {}
+        self._head = ""
+        self._tail = ""
+        self._all_players: Optional[str] = None
+
+    def forget(self, username: str):
+        self.offsets.pop(username, None)
+
+    def capture(self, room):
+        """记录房间当前帧的状态，每帧调用一次"""
+        players = room.public_players()
+        self.tick = room.tick
+        self.clock = round(room.clock, 3)
+        self._names = list(players)
+        self._players = list(players.values())
+        self._index = {name: i for i, name in enumerate(self._names)}
+        # 位置和速度保留一位小数（与 public_players 一致），片段更短，序列化也更快；
+        # public_bullets() 的结果由各协议共用，不能原地修改
+        self._bullets = bullets = [
+            {"id": bullet["id"], "x": round(bullet["x"], 1), "y": round(bullet["y"], 1),
+             "dx": round(bullet["dx"], 1), "dy": round(bullet["dy"], 1), "owner": bullet["owner"]}
+            for bullet in room.public_bullets()
+        ]
+        self._own_bullets = {}
+        for i, bullet in enumerate(bullets):
+            self._own_bullets.setdefault(bullet["owner"], []).append(i)
+        self.player_grid.rebuild(self._players)
+        self.bullet_grid.rebuild(self._bullets)
+        self._player_cells = {}
+        self._bullet_cells = {}
+        self._head = f'{{"type":"interest","tick":{self.tick},"clock":{self.clock},'
+        self._tail = f'"room_info":{json.dumps(room.room_info())}}}'
+        self._all_players = None
+
+    def _player_cell(self, key: int) -> Optional[str]:
+        fragment = self._player_cells.get(key)
+        if fragment is None:
+            indices = self.player_grid.cells.get(key)
+            if not indices:
+                return None
+            # 整个格子只调用一次 json.dumps，去掉外层的花括号作为片段
+            names, players = self._names, self._players
+            fragment = json.dumps({names[i]: players[i] for i in indices})[1:-1]
+            self._player_cells[key] = fragment
+        return fragment
+
+    def _bullet_cell(self, key: int) -> Optional[str]:
+        fragment = self._bullet_cells.get(key)
+        if fragment is None:
+            indices = self.bullet_grid.cells.get(key)
+            if not indices:
+                return None
+            bullets = self._bullets
+            fragment = self._bullet_cells[key] = json.dumps([bullets[i] for i in indices])[1:-1]
+        return fragment
+
+    def encode_for(self, username: str) -> str:
+        """返回发给该客户端的本帧消息（已序列化）"""
+        offset = self.offsets.get(username)
+        if offset is None:
+            offset = self.offsets[username] = len(self.offsets) % self.far_interval
+
+        me = self._index.get(username)
+        if me is not None:
+            x, y = self._players[me]["x"], self._players[me]["y"]
+        full = me is None or (self.tick + offset) % self.far_interval == 0
+        if full:
+            if self._all_players is None:
+                self._all_players = ",".join(
+                    fragment for fragment in map(self._player_cell, self.player_grid.cells) if fragment)
+            players = self._all_players
+        else:
+            players = ",".join(fragment for fragment in
+                               map(self._player_cell, self.player_grid.keys(x, y, self.near_radius))
+                               if fragment)
+
+        if me is None:
+            keys = list(self.bullet_grid.cells)
+        else:
+            keys = self.bullet_grid.keys(x, y, self.bullet_radius)
+        bullets = [fragment for fragment in map(self._bullet_cell, keys) if fragment]
+        own = self._own_bullets.get(username)
+        if own and me is not None:
+            # 自己发射、已经飞出范围的子弹
+            near = set(keys)
+            key = self.bullet_grid.key
+            far = [bullet for bullet in map(self._bullets.__getitem__, own)
+                   if key(bullet["x"], bullet["y"]) not in near]
+            if far:
+                bullets.append(json.dumps(far)[1:-1])
+
+        return (f'{self._head}"full":{"true" if full else "false"},"players":{{{players}}},'
+                f'"bullets":[{",".join(bullets)}],{self._tail}')
@@ -1,7 +1,9 @@
 const CONFIG = {
     BACKEND_URL: "47.86.22.26:3000",
+    PROTOCOL: "delta",  // 状态同步协议：delta（增量）或 interest（只收附近的玩家和子弹，适合大地图/大房间）
     MAP_WIDTH: 1920,
     MAP_HEIGHT: 1080,
+    REFERENCE_TICK_RATE: 50,  // 速度按这个帧率的每帧位移给出，与服务器一致
     MAX_BULLET_DIST: 800,
     PLAYER_SPEED: 6,
     BULLET_SPEED: 20,
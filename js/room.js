@@ -3,13 +3,24 @@ class RoomManager {
         this.auth = auth;
         this.currentRoom = null;
         this.refreshInterval = null;
+        this.lobbySocket = null;
+        this.lobbyRooms = new Map();  // 大厅推送维护的房间列表 {id: room}
+        this.roomsEtag = null;
+        this.cachedRooms = [];
     }
 
     async getRooms() {
         try {
-            const response = await fetch(`http://${CONFIG.BACKEND_URL}/api/rooms`);
+            // 列表未变化时服务器返回 304，直接使用上次的结果
+            const headers = this.roomsEtag ? { 'If-None-Match': this.roomsEtag } : {};
+            const response = await fetch(`http://${CONFIG.BACKEND_URL}/api/rooms?limit=100`, { headers });
+            if (response.status === 304) {
+                return this.cachedRooms;
+            }
             const data = await response.json();
-            return data.rooms || [];
+            this.roomsEtag = response.headers.get('ETag');
+            this.cachedRooms = data.rooms || [];
+            return this.cachedRooms;
         } catch (error) {
             console.error('获取房间列表失败:', error);
             return [];
@@ -53,20 +64,90 @@ class RoomManager {
         }
     }
 
+    // 自动匹配：服务器每次最多等待约 20 秒，还没有分配到房间时返回 queued，继续请求直到成功或取消
+    async matchmake(onWaiting = null) {
+        this.matchmaking = true;
+        try {
+            while (this.matchmaking) {
+                const response = await fetch(`http://${CONFIG.BACKEND_URL}/api/matchmaking/join?session_token=${this.auth.sessionToken}`, {
+                    method: 'POST'
+                });
+                const data = await response.json();
+                if (data.success) {
+                    this.currentRoom = data.room_id;
+                    return data;
+                }
+                if (!data.queued) return data;
+                if (onWaiting) onWaiting(data);
+            }
+            return { success: false, error: '已取消匹配' };
+        } catch (error) {
+            return { success: false, error: '网络错误：' + error.message };
+        } finally {
+            this.matchmaking = false;
+        }
+    }
+
+    async cancelMatchmaking() {
+        this.matchmaking = false;
+        try {
+            await fetch(`http://${CONFIG.BACKEND_URL}/api/matchmaking/cancel?session_token=${this.auth.sessionToken}`, {
+                method: 'POST'
+            });
+        } catch (error) {
+            console.error('取消匹配失败:', error);
+        }
+    }
+
     leaveRoom() {
         this.currentRoom = null;
+        this.stopRoomListRefresh();
+    }
+
+    sortedLobbyRooms() {
+        return [...this.lobbyRooms.values()].sort((a, b) => b.created_at - a.created_at);
+    }
+
+    // 优先订阅大厅推送；推送连接断开时退回到带 ETag 的轮询
+    startRoomListRefresh(callback, interval = 3000) {
+        this.stopRoomListRefresh();
+        const socket = new WebSocket(`ws://${CONFIG.BACKEND_URL}/ws/lobby`);
+        this.lobbySocket = socket;
+
+        socket.onmessage = (event) => {
+            const msg = JSON.parse(event.data);
+            if (msg.type === 'rooms') {
+                this.lobbyRooms = new Map(msg.rooms.map(room => [room.id, room]));
+            } else if (msg.type === 'rooms_changed') {
+                msg.updated.forEach(room => this.lobbyRooms.set(room.id, room));
+                msg.removed.forEach(id => this.lobbyRooms.delete(id));
+            } else {
+                return;
+            }
+            callback(this.sortedLobbyRooms());
+        };
+
+        socket.onclose = () => {
+            if (this.lobbySocket !== socket) return;
+            this.lobbySocket = null;
+            this.refreshInterval = setInterval(async () => {
+                const rooms = await this.getRooms();
+                callback(rooms);
+            }, interval);
+        };
+    }
+
+    stopRoomListRefresh() {
+        if (this.lobbySocket) {
+            const socket = this.lobbySocket;
+            this.lobbySocket = null;
+            socket.close();
+        }
         if (this.refreshInterval) {
             clearInterval(this.refreshInterval);
             this.refreshInterval = null;
         }
     }
-
-    startRoomListRefresh(callback, interval = 3000) {
-        this.refreshInterval = setInterval(async () => {
-            const rooms = await this.getRooms();
-            callback(rooms);
-        }, interval);
-    }
 }
 
 window.RoomManager = RoomManager;
\ No newline at end of file
@@ -87,7 +87,10 @@ class UI {
                         <div>
                             <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 20px;">
                                 <h2>房间列表</h2>
-                                <button onclick="window.ui.showCreateRoomForm()" style="padding: 10px 20px; background: #ff4444; color: white; border: none; border-radius: 5px; cursor: pointer;">创建房间</button>
+                                <div>
+                                    <button id="matchButton" onclick="window.ui.toggleMatchmaking()" style="padding: 10px 20px; margin-right: 10px; background: #44aa44; color: white; border: none; border-radius: 5px; cursor: pointer;">快速匹配</button>
+                                    <button onclick="window.ui.showCreateRoomForm()" style="padding: 10px 20px; background: #ff4444; color: white; border: none; border-radius: 5px; cursor: pointer;">创建房间</button>
+                                </div>
                             </div>
                             <div id="roomList" style="background: #333; border-radius: 10px; padding: 20px;">
                                 <div style="text-align: center; color: #666;">加载中...</div>
@@ -137,11 +140,37 @@ class UI {
                             ${room.players >= room.max_players ? 'disabled' : ''}>
                         ${room.players >= room.max_players ? '房间已满' : '加入'}
                     </button>
+                    <button onclick="window.ui.spectateRoom('${room.id}', ${room.has_password})" 
+                            style="padding: 8px 15px; margin-left: 8px; background: #4488ff; color: white; border: none; border-radius: 5px; cursor: pointer;">
+                        观战
+                    </button>
                 </div>
             `).join('');
         }
     }
 
+    async toggleMatchmaking() {
+        const button = document.getElementById('matchButton');
+        if (this.roomManager.matchmaking) {
+            await this.roomManager.cancelMatchmaking();
+            if (button) button.textContent = '快速匹配';
+            return;
+        }
+
+        if (button) button.textContent = '匹配中...（点击取消）';
+        const result = await this.roomManager.matchmake((status) => {
+            if (button) button.textContent = `匹配中 ${Math.round(status.waited)} 秒...（点击取消）`;
+        });
+        if (result.success) {
+            this.roomManager.stopRoomListRefresh();
+            this.showGameCanvas();
+            window.wsManager.connect(result.room_id);
+        } else {
+            if (button) button.textContent = '快速匹配';
+            if (result.error !== '已取消匹配') alert(result.error);
+        }
+    }
+
     async joinRoom(roomId, hasPassword) {
         let password = '';
         if (hasPassword) {
@@ -151,13 +180,26 @@ class UI {
         
         const result = await this.roomManager.joinRoom(roomId, password);
         if (result.success) {
+            this.roomManager.stopRoomListRefresh();
             this.showGameCanvas();
-            window.wsManager.connect(roomId);
+            window.wsManager.connect(roomId, result.ws_host);
         } else {
             alert(result.error);
         }
     }
 
+    spectateRoom(roomId, hasPassword) {
+        let password = null;
+        if (hasPassword) {
+            password = prompt('请输入房间密码:');
+            if (password === null) return;
+        }
+
+        this.roomManager.stopRoomListRefresh();
+        this.showGameCanvas();
+        window.wsManager.spectate(roomId, password);
+    }
+
     showGameCanvas() {
         document.body.innerHTML = `
             <div style="margin: 0; background: linear-gradient(120deg, #222244 60%, #444466 100%); font-family: Arial, sans-serif;">
@@ -188,8 +230,9 @@ class UI {
     }
 
     leaveRoom() {
+        const spectating = window.wsManager.spectating;
         window.wsManager.disconnect();
-        this.roomManager.leaveRoom();
+        if (!spectating) this.roomManager.leaveRoom();
         this.showRoomList();
     }
 
@@ -1,3 +1,114 @@
+// 服务器的速度（dx/dy）以每个基准帧（1/REFERENCE_TICK_RATE 秒）给出。
+// 服务器每帧按真实间隔推进，clock 是累计推进的基准帧数，两次 clock 之差即为经过的基准帧；
+// 旧服务器没有 clock 时按帧号之差乘以 REFERENCE_TICK_RATE / tick_rate 估算
+function referenceElapsed(clock, since, tick, sinceTick, roomInfo) {
+    if (clock !== undefined && since !== undefined) {
+        return clock - since;
+    }
+    const tickRate = (roomInfo && roomInfo.tick_rate) || CONFIG.REFERENCE_TICK_RATE;
+    return (tick - sinceTick) * CONFIG.REFERENCE_TICK_RATE / tickRate;
+}
+
+// 解码服务器的关键帧/增量消息，还原成渲染用的完整状态
+class DeltaDecoder {
+    constructor(historySize = 64) {
+        this.historySize = historySize;
+        this.reset();
+    }
+
+    reset() {
+        this.history = new Map();
+    }
+
+    apply(msg) {
+        let snap;
+        if (msg.type === "keyframe") {
+            snap = {
+                tick: msg.tick,
+                clock: msg.clock,
+                players: msg.players,
+                bullets: new Map(msg.bullets.map(b => [b.id, b])),
+                roomInfo: msg.room_info
+            };
+        } else {
+            const base = this.history.get(msg.base);
+            if (!base) return null;
+
+            const players = Object.assign({}, base.players);
+            for (const [name, diff] of Object.entries(msg.players || {})) {
+                players[name] = Object.assign({}, base.players[name], diff);
+            }
+            for (const name of msg.left || []) {
+                delete players[name];
+            }
+
+            const bullets = new Map(base.bullets);
+            for (const b of msg.bullets || []) {
+                bullets.set(b.id, b);
+            }
+            for (const id of msg.removed || []) {
+                bullets.delete(id);
+            }
+
+            snap = {
+                tick: msg.tick,
+                clock: msg.clock,
+                players,
+                bullets,
+                roomInfo: msg.room_info || base.roomInfo
+            };
+        }
+
+        this.history.set(snap.tick, snap);
+        for (const tick of this.history.keys()) {
+            if (tick > snap.tick - this.historySize) break;
+            this.history.delete(tick);
+        }
+        return this.toState(snap);
+    }
+
+    toState(snap) {
+        // 子弹只在发射时下发一次，按发射以来经过的基准帧外推当前位置
+        const bullets = [];
+        for (const b of snap.bullets.values()) {
+            const elapsed = referenceElapsed(snap.clock, b.clock, snap.tick, b.tick, snap.roomInfo);
+            bullets.push({ id: b.id, x: b.x + b.dx * elapsed, y: b.y + b.dy * elapsed, owner: b.owner });
+        }
+        return { tick: snap.tick, players: snap.players, bullets, room_info: snap.roomInfo };
+    }
+}
+
+// 合并 interest 协议的消息：附近的玩家每帧更新，远处的玩家只在完整帧（full）中更新，
+// 期间按速度外推；完整帧中没有的玩家已离开房间。子弹每帧只包含附近的
+class InterestDecoder {
+    constructor() {
+        this.reset();
+    }
+
+    reset() {
+        this.players = {};
+    }
+
+    apply(msg) {
+        if (msg.full) {
+            this.players = {};
+        }
+        for (const [name, player] of Object.entries(msg.players)) {
+            this.players[name] = Object.assign({ tick: msg.tick, clock: msg.clock }, player);
+        }
+
+        const players = {};
+        for (const [name, player] of Object.entries(this.players)) {
+            const elapsed = referenceElapsed(msg.clock, player.clock, msg.tick, player.tick, msg.room_info);
+            players[name] = elapsed === 0 ? player : Object.assign({}, player, {
+                x: Math.max(20, Math.min(CONFIG.MAP_WIDTH - 20, player.x + player.dx * elapsed)),
+                y: Math.max(20, Math.min(CONFIG.MAP_HEIGHT - 20, player.y + player.dy * elapsed))
+            });
+        }
+        return { tick: msg.tick, players, bullets: msg.bullets, room_info: msg.room_info };
+    }
+}
+
 class WebSocketManager {
     constructor(auth, gameRenderer) {
         this.auth = auth;
@@ -6,22 +117,73 @@ class WebSocketManager {
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 5;
         this.reconnectDelay = 3000;
+        // 服务器重启或交接（1012）时房间状态已保存，频繁重试以便尽快回到原来的位置
+        this.restartAttempts = 0;
+        this.maxRestartAttempts = 60;
+        this.restartDelay = 250;
+        this.decoder = new DeltaDecoder();
+        this.interestDecoder = new InterestDecoder();
     }
 
-    connect(roomId) {
+    // wsHost 为房间所在分片的 host:port（分片模式下由加入房间接口返回），默认连接后端地址
+    connect(roomId, wsHost = null) {
+        this.spectating = false;
+        const protocol = CONFIG.PROTOCOL || "delta";
+        this.open(roomId, wsHost, `/ws/${roomId}?session_token=${this.auth.sessionToken}&protocol=${protocol}`);
+    }
+
+    // 观战：只接收房间的广播，不占玩家名额，也不发送输入
+    spectate(roomId, password = null, wsHost = null) {
+        this.spectating = true;
+        this.spectatePassword = password;
+        let path = `/ws/${roomId}/spectate?session_token=${this.auth.sessionToken}`;
+        if (password) path += `&password=${encodeURIComponent(password)}`;
+        this.open(roomId, wsHost, path);
+    }
+
+    reconnect(roomId) {
+        if (this.spectating) {
+            this.spectate(roomId, this.spectatePassword);
+        } else {
+            this.connect(roomId);
+        }
+    }
+
+    open(roomId, wsHost, path) {
+        this.wsHost = wsHost || this.wsHost || CONFIG.BACKEND_URL;
         if (this.ws) {
             this.ws.close();
         }
 
-        this.ws = new WebSocket(`ws://${CONFIG.BACKEND_URL}/ws/${roomId}?session_token=${this.auth.sessionToken}`);
+        this.decoder.reset();
+        this.interestDecoder.reset();
+        this.viewTick = null;  // 当前显示的帧号，射击时发给服务器做延迟补偿
+        this.ws = new WebSocket(`ws://${this.wsHost}${path}`);
         
         this.ws.onopen = () => {
             console.log(`WebSocket连接成功，房间：${roomId}`);
             this.reconnectAttempts = 0;
+            this.restartAttempts = 0;
         };
         
         this.ws.onmessage = (event) => {
-            const state = JSON.parse(event.data);
+            const msg = JSON.parse(event.data);
+            if (msg.type === "spectate") {
+                // 观战广播是完整状态，不需要确认
+                this.gameRenderer.updateState(msg);
+                return;
+            }
+            if (msg.type === "interest") {
+                this.viewTick = msg.tick;
+                this.gameRenderer.updateState(this.interestDecoder.apply(msg));
+                return;
+            }
+            if (msg.type !== "keyframe" && msg.type !== "delta") return;
+
+            const state = this.decoder.apply(msg);
+            if (!state) return;
+            this.sendMessage({ type: "ack", tick: state.tick });
+            this.viewTick = state.tick;
             this.gameRenderer.updateState(state);
         };
         
@@ -42,11 +204,23 @@ class WebSocketManager {
         } else if (event.code === 4004) {
             alert("房间不存在");
             window.ui.showRoomList();
+        } else if (this.spectating && event.code >= 4000) {
+            // 密码错误、观战人数已满或房间已关闭，不再重连
+            alert(event.code === 4200 ? "房间已关闭" : (event.reason || "无法观战"));
+            this.disconnect();
+            window.ui.showRoomList();
+        } else if (event.code === 1012 || this.restartAttempts > 0) {
+            if (this.restartAttempts < this.maxRestartAttempts) {
+                this.restartAttempts++;
+                setTimeout(() => this.reconnect(roomId), this.restartDelay);
+            } else {
+                alert("服务器重启后无法重连，请刷新页面");
+            }
         } else if (this.reconnectAttempts < this.maxReconnectAttempts) {
             console.log(`连接断开，${this.reconnectDelay/1000}秒后尝试重连...`);
             setTimeout(() => {
                 this.reconnectAttempts++;
-                this.connect(roomId);
+                this.reconnect(roomId);
             }, this.reconnectDelay);
         } else {
             alert("连接断开，无法重连，请刷新页面");
@@ -54,6 +228,7 @@ class WebSocketManager {
     }
 
     sendMessage(message) {
+        if (this.spectating) return false;
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
             this.ws.send(JSON.stringify(message));
             return true;
@@ -63,10 +238,12 @@ class WebSocketManager {
 
     disconnect() {
         if (this.ws) {
+            this.ws.onclose = null;
             this.ws.close();
             this.ws = null;
         }
         this.reconnectAttempts = 0;
+        this.restartAttempts = 0;
     }
 
     move(dx, dy) {
@@ -74,7 +251,9 @@ class WebSocketManager {
     }
 
     shoot(dx, dy, maxDist = CONFIG.MAX_BULLET_DIST) {
-        return this.sendMessage({ type: "shoot", dx, dy, max_dist: maxDist });
+        const msg = { type: "shoot", dx, dy, max_dist: maxDist };
+        if (this.viewTick !== null) msg.tick = this.viewTick;
+        return this.sendMessage(msg);
     }
 
     respawn() {
@@ -82,4 +261,5 @@ class WebSocketManager {
     }
 }
 
+window.DeltaDecoder = DeltaDecoder;
 window.WebSocketManager = WebSocketManager;
\ No newline at end of file
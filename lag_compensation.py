@@ -0,0 +1,46 @@
+from typing import Dict, List, Optional, Tuple
+
+# 最多回溯这么久（秒）。回溯越多，高延迟玩家越容易命中，
+# 被击中的玩家也越容易在自己屏幕上"已经躲开"后仍被判定命中，因此设一个上限
+MAX_REWIND_SECONDS = 0.2
+
+
+class PositionHistory:
+    """最近若干帧玩家位置的环形缓冲
+
+    槽位在创建时分配好并循环复用，每帧只写入一次所有玩家的坐标，
+    内存和每帧开销都只与玩家数和缓冲长度成正比。
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._ticks: List[int] = [-1] * size
+        self._frames: List[Dict[str, Tuple[float, float]]] = [{} for _ in range(size)]
+
+    def record(self, tick: int, players: Dict[str, Dict]):
+        """记录 tick 帧移动后的玩家位置"""
+        slot = tick % self.size
+        frame = self._frames[slot]
+        frame.clear()
+        for username, player in players.items():
+            frame[username] = (player["x"], player["y"])
+        self._ticks[slot] = tick
+
+    def frame(self, tick: int) -> Optional[Dict[str, Tuple[float, float]]]:
+        """tick 帧的玩家位置，已被覆盖或还没有记录时返回 None"""
+        slot = tick % self.size
+        return self._frames[slot] if self._ticks[slot] == tick else None
+
+    def position(self, tick: int, username: str, default: Tuple[float, float]) -> Tuple[float, float]:
+        """玩家在 tick 帧的位置，没有记录（例如那时还没加入）时返回 default"""
+        frame = self.frame(tick)
+        if frame is None:
+            return default
+        return frame.get(username, default)
+
+
+def rewind_ticks(current_tick: int, view_tick, max_rewind: int) -> int:
+    """射手开枪时看到的是 view_tick 帧，子弹需要回溯的帧数（0 到 max_rewind）"""
+    if type(view_tick) is not int:
+        return 0
+    return min(max(current_tick - view_tick, 0), max_rewind)
@@ -0,0 +1,88 @@
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional
+
+PAGE_SIZE = 50
+
+
+def kd_ratio(stats: Dict) -> float:
+    return stats["kills"] / max(stats["deaths"], 1)
+
+
+def win_rate(stats: Dict) -> float:
+    return stats["wins"] / max(stats["games_played"], 1) * 100
+
+
+# 排序键：名称 -> 从统计中计算分数的函数，均按分数从高到低排列
+SORT_KEYS = {
+    "kills": lambda stats: stats["kills"],
+    "kd_ratio": kd_ratio,
+    "win_rate": win_rate,
+}
+
+
+def leaderboard_entry(username: str, stats: Dict) -> Dict:
+    return {
+        "username": username,
+        "kills": stats["kills"],
+        "deaths": stats["deaths"],
+        "wins": stats["wins"],
+        "games_played": stats["games_played"],
+        "kd_ratio": round(kd_ratio(stats), 2),
+        "win_rate": round(win_rate(stats), 1)
+    }
+
+
+class LeaderboardIndex:
+    """增量维护的排行榜索引
+
+    每个排序键维护一个按 (-分数, 用户名) 排好序的列表，统计变化时
+    只把该用户的条目删掉再二分插入，不需要每次请求重新排序全部用户。
+    排名查询是一次二分查找，分页是列表切片。
+    """
+
+    def __init__(self):
+        self.stats: Dict[str, Dict] = {}  # {username: stats}，与 users_db 共享同一个字典
+        self._sorted: Dict[str, List] = {key: [] for key in SORT_KEYS}  # {sort: [(-score, username)]}
+        self._keys: Dict[str, Dict[str, tuple]] = {key: {} for key in SORT_KEYS}  # {sort: {username: 当前条目}}
+
+    def __len__(self):
+        return len(self.stats)
+
+    def update(self, username: str, stats: Dict):
+        """插入或刷新一个用户，统计变化后调用"""
+        self.stats[username] = stats
+        for key, score in SORT_KEYS.items():
+            entry = (-score(stats), username)
+            entries = self._sorted[key]
+            old = self._keys[key].get(username)
+            if old == entry:
+                continue
+            if old is not None:
+                del entries[bisect_left(entries, old)]
+            insort(entries, entry)
+            self._keys[key][username] = entry
+
+    def remove(self, username: str):
+        if self.stats.pop(username, None) is None:
+            return
+        for key in SORT_KEYS:
+            old = self._keys[key].pop(username)
+            entries = self._sorted[key]
+            del entries[bisect_left(entries, old)]
+
+    def page(self, sort: str = "kills", offset: int = 0, limit: int = PAGE_SIZE) -> List[Dict]:
+        return [leaderboard_entry(username, self.stats[username])
+                for _, username in self._sorted[sort][offset:offset + limit]]
+
+    def rank(self, username: str, sort: str = "kills") -> Optional[int]:
+        """返回用户的名次（从 1 开始），不在榜上时返回 None"""
+        entry = self._keys[sort].get(username)
+        if entry is None:
+            return None
+        return bisect_left(self._sorted[sort], entry) + 1
+
+    def clear(self):
+        self.stats.clear()
+        for key in SORT_KEYS:
+            self._sorted[key].clear()
+            self._keys[key].clear()
@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+"""机器人压测工具
+
+通过 REST 接口注册机器人用户、创建并加入房间，再用脚本化的移动/射击
+机器人驱动 /ws/{room_id}，统计服务器能承受的房间数和玩家数。
+
+用法:
+    python load_test.py --rooms 20 --players 8 --duration 30
+    python load_test.py --spawn --rooms 50 --output results.json
+    python load_test.py --spawn --compare baseline.json --output new.json
+    python load_test.py --spawn --shards 4 --rooms 80   # 分片模式
+
+结果写成 JSON，可与之前版本的结果对比（--compare），指标变差超过
+--tolerance 时以非零状态退出，方便在发布前发现性能回退。
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from game_engine import BULLET_SPEED, PLAYER_SPEED
+
+DELTA_HISTORY = 64
+
+# 对比时检查的指标：(路径, 越大越好)
+COMPARED_METRICS = [
+    (("tick_rate", "mean"), True),
+    (("tick_rate", "min"), True),
+    (("input_latency_ms", "p50"), False),
+    (("input_latency_ms", "p99"), False),
+    (("broadcast_interval_ms", "p99"), False),
+    (("server_cpu_percent",), False),
+    (("bytes_per_sec_per_client",), False),
+]
+
+
+def percentiles(values, points=(50, 95, 99)):
+    if not values:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(values)
+    result = {}
+    for p in points:
+        index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+        result[f"p{p}"] = round(ordered[index], 3)
+    return result
+
+
+def read_cpu_seconds(pid):
+    """从 /proc 读取进程累计 CPU 时间（仅 Linux）"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def git_version():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Bot:
+    """单个机器人：按固定频率随机移动和射击，统计收到的状态帧"""
+
+    def __init__(self, tester, username, token, room_id, ws_host=None):
+        self.tester = tester
+        self.username = username
+        self.token = token
+        self.room_id = room_id
+        self.ws_url = f"ws://{ws_host}" if ws_host else tester.ws_url  # 分片模式下连接房间所在分片
+        self.rng = random.Random(username)
+        self.connected = False
+        self.closed_code = None
+
+        self.frames = 0
+        self.bytes = 0
+        self.intervals = []  # 相邻状态帧到达间隔（毫秒）
+        self.latencies = []  # 发出移动到在状态中看到该移动的耗时（毫秒）
+        self._last_frame = None
+        self._pending_move = None  # (dx, dy, 发送时间)
+        self._delta_states = {}  # {tick: {username: player}}，delta 协议的解码历史
+
+    def _measuring(self):
+        return self.tester.measuring
+
+    def _own_player(self, message):
+        """从状态消息中取出自己的玩家数据，不是状态消息时返回 False"""
+        protocol = self.tester.protocol
+        if protocol == "binary":
+            from protocol import decode_state
+            return decode_state(message)["players"].get(self.username)
+        msg = json.loads(message)
+        if msg.get("type") == "death":
+            self._respawn = True
+            return False
+        if protocol == "delta":
+            if msg.get("type") == "keyframe":
+                players = msg["players"]
+            elif msg.get("type") == "delta":
+                base = self._delta_states.get(msg["base"])
+                if base is None:
+                    return False
+                players = {name: dict(player) for name, player in base.items()}
+                for name, changes in msg.get("players", {}).items():
+                    players.setdefault(name, {}).update(changes)
+                for name in msg.get("left", []):
+                    players.pop(name, None)
+            else:
+                return False
+            self._delta_states[msg["tick"]] = players
+            self._delta_states.pop(msg["tick"] - DELTA_HISTORY, None)
+            self._ack = msg["tick"]
+            return players.get(self.username)
+        if protocol == "interest":
+            # 自己总在附近的格子里，每帧都有；远处的玩家只在完整帧中出现，机器人不需要合并
+            if msg.get("type") != "interest":
+                return False
+            return msg["players"].get(self.username)
+        if "players" not in msg:
+            return False
+        return msg["players"].get(self.username)
+
+    def _on_frame(self, message):
+        now = time.perf_counter()
+        if isinstance(message, str) and self.tester.protocol == "binary":
+            # 二进制连接上的文本消息是事件（如死亡通知）
+            if json.loads(message).get("type") == "death":
+                self._respawn = True
+            return
+
+        player = self._own_player(message)
+        if player is False:
+            return
+
+        if self._measuring():
+            self.frames += 1
+            self.bytes += len(message)
+            if self._last_frame is not None:
+                self.intervals.append((now - self._last_frame) * 1000)
+        self._last_frame = now
+
+        pending = self._pending_move
+        if pending and player and abs(player.get("dx", 0) - pending[0]) < 1e-3 \
+                and abs(player.get("dy", 0) - pending[1]) < 1e-3:
+            if self._measuring():
+                self.latencies.append((now - pending[2]) * 1000)
+            self._pending_move = None
+
+    async def run(self, websockets, stop):
+        url = (f"{self.ws_url}/ws/{self.room_id}"
+               f"?session_token={self.token}&protocol={self.tester.protocol}")
+        self._ack = None
+        self._respawn = False
+        try:
+            async with websockets.connect(url, max_size=None) as ws:
+                self.connected = True
+                receiver = asyncio.create_task(self._receive(ws))
+                try:
+                    await self._drive(ws, stop)
+                finally:
+                    receiver.cancel()
+        except Exception as e:
+            self.closed_code = getattr(e, "code", None) or str(e)
+        finally:
+            self.connected = False
+
+    async def _receive(self, ws):
+        async for message in ws:
+            self._on_frame(message)
+
+    async def _send(self, ws, msg):
+        if self.tester.protocol == "binary":
+            from protocol import encode_input
+            await ws.send(encode_input(msg))
+        else:
+            await ws.send(json.dumps(msg))
+
+    async def _drive(self, ws, stop):
+        tester = self.tester
+        move_interval = 1 / tester.move_rate
+        shoot_every = max(1, round(tester.move_rate / tester.shoot_rate)) if tester.shoot_rate else 0
+        # 错开各机器人的发送时间
+        await asyncio.sleep(self.rng.random() * move_interval)
+        step = 0
+        while not stop.is_set():
+            if self._respawn:
+                self._respawn = False
+                await self._send(ws, {"type": "respawn"})
+
+            angle = self.rng.random() * 2 * math.pi
+            dx, dy = math.cos(angle) * PLAYER_SPEED, math.sin(angle) * PLAYER_SPEED
+            self._pending_move = (dx, dy, time.perf_counter())
+            await self._send(ws, {"type": "move", "dx": dx, "dy": dy})
+
+            if shoot_every and step % shoot_every == 0:
+                angle = self.rng.random() * 2 * math.pi
+                await self._send(ws, {"type": "shoot",
+                                      "dx": math.cos(angle) * BULLET_SPEED,
+                                      "dy": math.sin(angle) * BULLET_SPEED,
+                                      "max_dist": 800})
+
+            if tester.protocol == "delta" and self._ack is not None:
+                await self._send(ws, {"type": "ack", "tick": self._ack})
+            step += 1
+            await asyncio.sleep(move_interval)
+
+
+class LoadTester:
+    def __init__(self, args):
+        self.server_url = args.server.rstrip("/")
+        self.ws_url = "ws" + self.server_url[len("http"):]
+        self.admin_password = args.admin_password
+        self.rooms = args.rooms
+        self.players = args.players
+        self.duration = args.duration
+        self.warmup = args.warmup
+        self.move_rate = args.move_rate
+        self.shoot_rate = args.shoot_rate
+        self.protocol = args.protocol
+        self.server_pids = args.server_pids or []
+        self.prefix = args.prefix or f"bot{int(time.time()) % 100000}"
+        self.measuring = False
+        self.bots = []
+        self.http = None
+
+    def _post(self, path, payload):
+        response = self.http.post(f"{self.server_url}{path}", json=payload, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    def admin_stats(self):
+        """管理员统计；分片模式下房间详情来自各个分片"""
+        stats = self._post("/api/admin/stats", {"admin_password": self.admin_password})
+        for shard in stats.get("cluster", {}).get("shards", []):
+            response = self.http.post(f"http://{shard['host']}/api/admin/stats",
+                                      json={"admin_password": self.admin_password}, timeout=30)
+            stats["room_details"].extend(response.json().get("room_details", []))
+        return stats
+
+    def cpu_seconds(self):
+        if not self.server_pids:
+            return None
+        samples = [read_cpu_seconds(pid) for pid in self.server_pids]
+        return None if None in samples else sum(samples)
+
+    def register(self, i):
+        username = f"{self.prefix}_{i}"[:16]
+        result = self._post("/api/register", {
+            "username": username, "password": "load-test", "email": f"{username}@bots.local"
+        })
+        if not result.get("success"):
+            raise RuntimeError(f"注册 {username} 失败: {result.get('error')}")
+        return username, result["session_token"]
+
+    def setup(self):
+        """注册用户、创建并加入房间"""
+        total = self.rooms * self.players
+        print(f"👥 注册 {total} 个机器人用户...", end=" ", flush=True)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            users = list(pool.map(self.register, range(total)))
+        print("✅")
+
+        print(f"🏠 创建 {self.rooms} 个房间...", end=" ", flush=True)
+        for r in range(self.rooms):
+            members = users[r * self.players:(r + 1) * self.players]
+            owner, owner_token = members[0]
+            result = self._post(f"/api/rooms/create?session_token={owner_token}",
+                                {"room_name": f"{self.prefix}-{r}", "max_players": self.players})
+            if not result.get("success"):
+                raise RuntimeError(f"创建房间失败: {result.get('error')}")
+            room_id = result["room_id"]
+            self.bots.append(Bot(self, owner, owner_token, room_id, result.get("ws_host")))
+            for username, token in members[1:]:
+                joined = self._post(f"/api/rooms/{room_id}/join?session_token={token}", {})
+                if not joined.get("success"):
+                    raise RuntimeError(f"{username} 加入房间失败: {joined.get('error')}")
+                self.bots.append(Bot(self, username, token, room_id, joined.get("ws_host")))
+        print("✅")
+
+    async def drive(self):
+        import websockets
+
+        stop = asyncio.Event()
+        print(f"🤖 连接 {len(self.bots)} 个机器人（协议: {self.protocol}）...", end=" ", flush=True)
+        tasks = [asyncio.create_task(bot.run(websockets, stop)) for bot in self.bots]
+        await asyncio.sleep(self.warmup)
+        print(f"✅ 已连接 {sum(bot.connected for bot in self.bots)}")
+
+        print(f"⏱️  测量 {self.duration} 秒...", end=" ", flush=True)
+        before = await asyncio.to_thread(self.admin_stats)
+        cpu_before = self.cpu_seconds()
+        start = time.monotonic()
+        self.measuring = True
+        await asyncio.sleep(self.duration)
+        self.measuring = False
+        elapsed = time.monotonic() - start
+        cpu_after = self.cpu_seconds()
+        after = await asyncio.to_thread(self.admin_stats)
+        print("✅")
+
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return self.summarize(before, after, elapsed, cpu_before, cpu_after)
+
+    def summarize(self, before, after, elapsed, cpu_before, cpu_after):
+        ours = {bot.room_id for bot in self.bots}
+        ticks_before = {room["id"]: room["tick"] for room in before.get("room_details", [])}
+        rates = []
+        max_tick_ms = 0.0
+        dropped = 0
+        for room in after.get("room_details", []):
+            if room["id"] not in ours or not room.get("tick") or room["id"] not in ticks_before:
+                continue
+            rates.append((room["tick"]["ticks"] - ticks_before[room["id"]]["ticks"]) / elapsed)
+            max_tick_ms = max(max_tick_ms, room["tick"]["max_tick_ms"])
+            dropped += sum(conn["dropped"] for conn in room.get("connections", {}).values())
+
+        intervals = [v for bot in self.bots for v in bot.intervals]
+        latencies = [v for bot in self.bots for v in bot.latencies]
+        clients = len(self.bots)
+        cpu = None
+        if cpu_before is not None and cpu_after is not None:
+            cpu = round((cpu_after - cpu_before) / elapsed * 100, 1)
+
+        return {
+            "tick_rate": {
+                "target": after["room_details"][0]["tick"]["target_rate"] if after.get("room_details") else None,
+                "mean": round(sum(rates) / len(rates), 2) if rates else None,
+                "min": round(min(rates), 2) if rates else None
+            },
+            "max_tick_ms": max_tick_ms,
+            "broadcast_interval_ms": percentiles(intervals),
+            "input_latency_ms": {**percentiles(latencies), "samples": len(latencies)},
+            "frames_per_sec_per_client": round(sum(bot.frames for bot in self.bots) / elapsed / clients, 2),
+            "bytes_per_sec_per_client": round(sum(bot.bytes for bot in self.bots) / elapsed / clients, 1),
+            "server_cpu_percent": cpu,
+            "dropped_frames": dropped,
+            "disconnected_bots": sum(1 for bot in self.bots if bot.closed_code is not None)
+        }
+
+    def run(self):
+        import requests
+
+        self.http = requests.Session()
+        print("🔧 机器人压测")
+        print("=" * 60)
+        print(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"服务器: {self.server_url}")
+        print(f"规模: {self.rooms} 个房间 × {self.players} 名玩家")
+        print("=" * 60)
+
+        self.setup()
+        results = asyncio.run(self.drive())
+        return {
+            "version": git_version(),
+            "timestamp": time.time(),
+            "config": {
+                "rooms": self.rooms,
+                "players_per_room": self.players,
+                "duration": self.duration,
+                "move_rate": self.move_rate,
+                "shoot_rate": self.shoot_rate,
+                "protocol": self.protocol
+            },
+            "results": results
+        }
+
+
+def display_results(report):
+    results = report["results"]
+    print(f"\n📊 压测结果 (版本 {report['version'] or '未知'}):")
+    tick = results["tick_rate"]
+    print(f"  帧率: 平均 {tick['mean']} Hz / 最低 {tick['min']} Hz（目标 {tick['target']} Hz）")
+    print(f"  最长单帧: {results['max_tick_ms']} ms")
+    interval = results["broadcast_interval_ms"]
+    print(f"  广播间隔: p50 {interval['p50']} / p95 {interval['p95']} / p99 {interval['p99']} ms")
+    latency = results["input_latency_ms"]
+    print(f"  输入延迟: p50 {latency['p50']} / p95 {latency['p95']} / p99 {latency['p99']} ms"
+          f"（{latency['samples']} 个样本）")
+    print(f"  每客户端: {results['frames_per_sec_per_client']} 帧/秒, "
+          f"{results['bytes_per_sec_per_client']} 字节/秒")
+    cpu = results["server_cpu_percent"]
+    print(f"  服务器 CPU: {f'{cpu}%' if cpu is not None else '未测量（使用 --spawn 或 --server-pid）'}")
+    print(f"  丢弃帧: {results['dropped_frames']}, 断开的机器人: {results['disconnected_bots']}")
+
+
+def compare(report, baseline, tolerance):
+    """与基线对比，返回变差超过容差的指标"""
+    if baseline.get("config") != report["config"]:
+        print("⚠️  注意: 基线的压测配置与本次不同，对比结果仅供参考")
+    regressions = []
+    print(f"\n📈 与基线对比 (版本 {baseline.get('version') or '未知'}):")
+    for path, higher_is_better in COMPARED_METRICS:
+        old, new = baseline.get("results", {}), report["results"]
+        for key in path:
+            old = old.get(key) if isinstance(old, dict) else None
+            new = new.get(key) if isinstance(new, dict) else None
+        name = ".".join(path)
+        if not old or new is None:
+            print(f"  {name}: {old} -> {new}")
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = "❌" if worse > tolerance else "✅"
+        print(f"  {flag} {name}: {old} -> {new} ({change:+.1%})")
+        if worse > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def spawn_server(port, shards=0, db_dir=None):
+    """在子进程中启动独立的服务器，返回 (进程列表, 地址)
+
+    shards 为 0 时启动一个纯内存存储的单进程服务器，否则启动一个路由进程
+    和 shards 个分片进程，共享 db_dir 下的临时数据库。
+    """
+    import requests
+
+    if shards:
+        from cluster import spawn_cluster
+        env = dict(os.environ, PW_DB_PATH=os.path.join(db_dir, "load_test.db"))
+        processes = spawn_cluster(shards, port, "127.0.0.1", "127.0.0.1", env=env, log_level="warning")
+    else:
+        env = dict(os.environ, PW_STORAGE="memory")
+        processes = [subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "bs_server:app", "--port", str(port), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env
+        )]
+
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(f"{url}/health", timeout=1).raise_for_status()
+            # 分片模式下等所有分片都发出第一次心跳
+            if not shards or all(requests.get(f"http://127.0.0.1:{port + 1 + i}/health", timeout=1).ok
+                                 for i in range(shards)):
+                time.sleep(0.5 if shards else 0)
+                return processes, url
+        except requests.RequestException:
+            pass
+        if any(process.poll() is not None for process in processes):
+            break
+        time.sleep(0.1)
+    for process in processes:
+        process.kill()
+    raise RuntimeError("服务器启动失败")
+
+
+def main():
+    """主函数"""
+    # 检查依赖
+    try:
+        import requests
+        import websockets
+    except ImportError as e:
+        print(f"❌ 错误: 缺少依赖 {e.name}")
+        print("请运行: pip install requests websockets")
+        return 1
+
+    parser = argparse.ArgumentParser(description="PixelWarzone 机器人压测")
+    parser.add_argument("--server", default="http://localhost:3000", help="服务器地址")
+    parser.add_argument("--admin-password", default="admin123")
+    parser.add_argument("--spawn", action="store_true", help="启动一个独立的纯内存服务器进程进行压测")
+    parser.add_argument("--port", type=int, default=3100, help="--spawn 时服务器监听的端口")
+    parser.add_argument("--shards", type=int, default=0, help="--spawn 时以分片模式启动，指定分片进程数")
+    parser.add_argument("--server-pid", type=int, dest="server_pids", action="append",
+                        help="服务器进程号，用于统计 CPU 占用，可重复指定")
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--players", type=int, default=8, help="每个房间的玩家数")
+    parser.add_argument("--duration", type=float, default=20, help="测量时长（秒）")
+    parser.add_argument("--warmup", type=float, default=3, help="连接后等待多久开始测量（秒）")
+    parser.add_argument("--move-rate", type=float, default=10, help="每个机器人每秒发送的移动次数")
+    parser.add_argument("--shoot-rate", type=float, default=1, help="每个机器人每秒射击次数")
+    parser.add_argument("--protocol", choices=("json", "delta", "binary", "interest"), default="json")
+    parser.add_argument("--prefix", help="机器人用户名前缀，默认按时间生成")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前的 JSON 结果对比")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="允许的变差比例，默认 10%%")
+    args = parser.parse_args()
+
+    processes = []
+    db_dir = tempfile.TemporaryDirectory()
+    if args.spawn:
+        processes, args.server = spawn_server(args.port, args.shards, db_dir.name)
+        args.server_pids = [process.pid for process in processes]
+    try:
+        report = LoadTester(args).run()
+        report["config"]["shards"] = args.shards
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        db_dir.cleanup()
+
+    display_results(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ 性能回退: {', '.join(regressions)}")
+            return 1
+        print("\n🎉 未发现性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
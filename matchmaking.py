@@ -0,0 +1,181 @@
+"""自动匹配：排队的玩家按批次放进房间
+
+每隔 MATCH_INTERVAL 秒处理一批排队的玩家：先按剩余名额从少到多补满已有的房间，
+剩下的玩家每 room_size 人开一个新房间；凑不满一个新房间时继续等待，
+直到其中最早排队的玩家已等待 NEW_ROOM_WAIT 秒。这样房间尽量满员运行，
+每个房间的模拟和广播开销分摊到更多玩家上。
+
+开启水平匹配时，玩家只进入平均水平与自己相近的房间，允许的差距随等待时间放宽，
+等得越久越容易匹配上。
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+MATCH_INTERVAL = 0.5  # 处理一批排队玩家的间隔（秒）
+ROOM_SIZE = 8  # 匹配创建的房间的人数上限
+NEW_ROOM_WAIT = 3.0  # 凑不满一个新房间时，最早排队的玩家等待这么久后仍然开新房间
+POLL_TIMEOUT = 20.0  # 一次匹配请求最多等待的时间（秒），超时后客户端再次请求
+TICKET_TTL = 10.0  # 没有请求在等待的排队超过这么久（秒）视为客户端已离开
+SKILL_TOLERANCE = 1.0  # 水平匹配允许的初始差距（1 相当于 K/D 差一倍）
+SKILL_WIDEN_RATE = 0.5  # 每等待一秒允许的差距增加多少
+WAIT_SAMPLES = 1000  # 计算等待时间分位数使用的最近匹配数
+
+
+def skill_rating(stats: Dict) -> float:
+    """按击杀/死亡比估计的水平，取对数，没有战绩的玩家为 0"""
+    return math.log2((stats.get("kills", 0) + 1) / (stats.get("deaths", 0) + 1))
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+class Ticket:
+    """一名排队的玩家；result 在分配到房间后得到房间 id，被取消时为 None"""
+
+    __slots__ = ("username", "rating", "enqueued_at", "last_seen", "waiters", "result")
+
+    def __init__(self, username: str, rating: float, now: float):
+        self.username = username
+        self.rating = rating
+        self.enqueued_at = now
+        self.last_seen = now
+        self.waiters = 0
+        self.result: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def tolerance(self, now: float) -> float:
+        return SKILL_TOLERANCE + SKILL_WIDEN_RATE * (now - self.enqueued_at)
+
+
+class OpenRoom:
+    """可以补人的房间：剩余名额和房间内玩家的平均水平（不做水平匹配时为 None）"""
+
+    __slots__ = ("room_id", "free", "rating")
+
+    def __init__(self, room_id: str, free: int, rating: Optional[float] = None):
+        self.room_id = room_id
+        self.free = free
+        self.rating = rating
+
+
+def plan(tickets: List[Ticket], open_rooms: List[OpenRoom], now: float,
+         room_size: int = ROOM_SIZE, skill: bool = False,
+         new_room_wait: float = NEW_ROOM_WAIT) -> Tuple[List[Tuple[str, List[Ticket]]], List[List[Ticket]]]:
+    """分配一批排队的玩家，返回 (补入已有房间的 [(房间 id, 玩家)], 每个新房间的玩家)"""
+    waiting = sorted(tickets, key=lambda t: t.enqueued_at)
+    fills = []
+    # 剩余名额最少的房间先补，尽快凑满
+    for room in sorted(open_rooms, key=lambda r: r.free):
+        if not waiting:
+            break
+        chosen = []
+        for ticket in waiting:
+            if len(chosen) == room.free:
+                break
+            if skill and room.rating is not None and abs(ticket.rating - room.rating) > ticket.tolerance(now):
+                continue
+            chosen.append(ticket)
+        if chosen:
+            fills.append((room.room_id, chosen))
+            taken = set(map(id, chosen))
+            waiting = [ticket for ticket in waiting if id(ticket) not in taken]
+
+    if skill:
+        waiting.sort(key=lambda t: t.rating)
+    groups = []
+    for i in range(0, len(waiting), room_size):
+        group = waiting[i:i + room_size]
+        if len(group) == room_size or now - min(t.enqueued_at for t in group) >= new_room_wait:
+            groups.append(group)
+    return fills, groups
+
+
+class Matchmaker:
+    """匹配队列：请求在 wait() 中等待，后台任务定时调用 plan() 并由服务器把玩家放进房间"""
+
+    def __init__(self, room_size: int = ROOM_SIZE, skill: bool = False,
+                 new_room_wait: float = NEW_ROOM_WAIT):
+        self.room_size = room_size
+        self.skill = skill
+        self.new_room_wait = new_room_wait
+        self.tickets: Dict[str, Ticket] = {}
+        self.waits = deque(maxlen=WAIT_SAMPLES)  # 最近匹配的等待时间（秒）
+        self.matched = 0
+        self.filled = 0  # 补入已有房间的玩家数
+        self.rooms_opened = 0
+        self.abandoned = 0  # 客户端离开或取消的排队
+
+    def __len__(self):
+        return len(self.tickets)
+
+    def enqueue(self, username: str, rating: float) -> Ticket:
+        """加入队列；已在排队时返回原来的排队，等待时间从第一次排队算起"""
+        now = time.monotonic()
+        ticket = self.tickets.get(username)
+        if ticket is None:
+            ticket = self.tickets[username] = Ticket(username, rating, now)
+        ticket.last_seen = now
+        return ticket
+
+    async def wait(self, ticket: Ticket, timeout: float = POLL_TIMEOUT) -> Tuple[bool, Optional[str]]:
+        """等待分配结果，返回 (是否已有结果, 房间 id)；超时返回 (False, None)，玩家仍在队列中"""
+        ticket.waiters += 1
+        try:
+            return True, await asyncio.wait_for(asyncio.shield(ticket.result), timeout)
+        except asyncio.TimeoutError:
+            return False, None
+        finally:
+            ticket.waiters -= 1
+            ticket.last_seen = time.monotonic()
+
+    def cancel(self, username: str) -> bool:
+        ticket = self.tickets.pop(username, None)
+        if ticket is None:
+            return False
+        self.abandoned += 1
+        if not ticket.result.done():
+            ticket.result.set_result(None)
+        return True
+
+    def plan(self, open_rooms: List[OpenRoom], now: float):
+        """丢弃客户端已离开的排队，然后分配剩下的玩家"""
+        for username, ticket in list(self.tickets.items()):
+            if not ticket.waiters and now - ticket.last_seen > TICKET_TTL:
+                self.cancel(username)
+        return plan(list(self.tickets.values()), open_rooms, now,
+                    self.room_size, self.skill, self.new_room_wait)
+
+    def complete(self, ticket: Ticket, room_id: str, now: float, new_room: bool):
+        """玩家已放进房间"""
+        self.tickets.pop(ticket.username, None)
+        self.waits.append(now - ticket.enqueued_at)
+        self.matched += 1
+        if not new_room:
+            self.filled += 1
+        if not ticket.result.done():
+            ticket.result.set_result(room_id)
+
+    def wait_percentiles(self) -> Dict[str, float]:
+        waits = sorted(self.waits)
+        return {
+            "p50": round(percentile(waits, 0.5), 3),
+            "p90": round(percentile(waits, 0.9), 3),
+            "p99": round(percentile(waits, 0.99), 3),
+            "max": round(waits[-1], 3) if waits else 0.0
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "queued": len(self.tickets),
+            "matched": self.matched,
+            "filled_existing": self.filled,
+            "rooms_opened": self.rooms_opened,
+            "abandoned": self.abandoned,
+            "skill": self.skill,
+            "wait_seconds": self.wait_percentiles()
+        }
@@ -0,0 +1,185 @@
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+from game_engine import STEP_PHASES
+
+# 每帧记录的阶段：step() 内部的四个阶段，加上统计结算、序列化和放入发送队列
+TICK_PHASES = STEP_PHASES + ("stats", "serialize", "enqueue")
+
+# 直方图分桶（秒），覆盖 50us 到一帧预算（20ms）的数倍
+TIME_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1)
+
+LOOP_LAG_INTERVAL = 0.1  # 事件循环延迟的采样间隔（秒）
+
+
+class Histogram:
+    """固定分桶直方图，observe 只做一次二分查找和两次加法"""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...] = TIME_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最后一个桶是 +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def merge(self, other: "Histogram"):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+
+    def render(self, name: str, labels: str = "") -> List[str]:
+        sep = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum:.6f}")
+        lines.append(f"{name}_count{suffix} {cumulative}")
+        return lines
+
+
+class RoomMetrics:
+    __slots__ = ("phases", "tick", "bullets")
+
+    def __init__(self):
+        self.phases = [Histogram() for _ in TICK_PHASES]
+        self.tick = Histogram()
+        self.bullets = 0
+
+
+class Metrics:
+    """模拟与网络指标，以 Prometheus 文本格式导出
+
+    每帧只更新所在房间的直方图，全局直方图在导出时汇总，
+    已删除房间的数据并入 retired，保证全局计数单调递增。
+    """
+
+    def __init__(self):
+        self.rooms: Dict[str, RoomMetrics] = {}
+        self.retired = RoomMetrics()
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.messages_out = 0
+        self.bytes_out = 0
+        self.messages_dropped = 0  # 超出连接消息速率被丢弃
+        self.inputs_rejected = 0  # 校验失败或超出射击频率
+        self.send = Histogram()  # 单次 socket 发送耗时
+        self.loop_lag = Histogram()
+        self.last_loop_lag = 0.0
+
+    def room(self, room_id: str) -> RoomMetrics:
+        metrics = self.rooms.get(room_id)
+        if metrics is None:
+            metrics = self.rooms[room_id] = RoomMetrics()
+        return metrics
+
+    def observe_tick(self, room_id: str, phase_times: Iterable[float], total: float, bullets: int):
+        metrics = self.room(room_id)
+        for histogram, value in zip(metrics.phases, phase_times):
+            histogram.observe(value)
+        metrics.tick.observe(total)
+        metrics.bullets = bullets
+
+    def forget_room(self, room_id: str):
+        metrics = self.rooms.pop(room_id, None)
+        if metrics is None:
+            return
+        for retired, histogram in zip(self.retired.phases, metrics.phases):
+            retired.merge(histogram)
+        self.retired.tick.merge(metrics.tick)
+
+    def record_in(self, size: int):
+        self.messages_in += 1
+        self.bytes_in += size
+
+    def record_out(self, size: int, duration: float):
+        self.messages_out += 1
+        self.bytes_out += size
+        self.send.observe(duration)
+
+    async def sample_loop_lag(self, interval: float = LOOP_LAG_INTERVAL):
+        """定时 sleep，实际醒来时间比预期晚多少就是事件循环延迟"""
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.monotonic() - start - interval)
+            self.last_loop_lag = lag
+            self.loop_lag.observe(lag)
+
+    def render(self, gauges: Dict[str, Tuple[float, str]] = None) -> str:
+        """导出全部指标，gauges 为额外的 {名称: (数值, 说明)}"""
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        header("pw_tick_phase_seconds", "histogram", "Time spent in each phase of a room tick, all rooms")
+        for i, phase in enumerate(TICK_PHASES):
+            total = Histogram()
+            total.merge(self.retired.phases[i])
+            for metrics in self.rooms.values():
+                total.merge(metrics.phases[i])
+            lines.extend(total.render("pw_tick_phase_seconds", f'phase="{phase}"'))
+
+        header("pw_tick_seconds", "histogram", "Total time of a room tick, all rooms")
+        total = Histogram()
+        total.merge(self.retired.tick)
+        for metrics in self.rooms.values():
+            total.merge(metrics.tick)
+        lines.extend(total.render("pw_tick_seconds"))
+
+        header("pw_room_tick_phase_seconds", "histogram", "Time spent in each phase of a room tick")
+        for room_id, metrics in self.rooms.items():
+            for phase, histogram in zip(TICK_PHASES, metrics.phases):
+                lines.extend(histogram.render("pw_room_tick_phase_seconds",
+                                              f'room="{room_id}",phase="{phase}"'))
+
+        header("pw_room_tick_seconds", "histogram", "Total time of a room tick")
+        for room_id, metrics in self.rooms.items():
+            lines.extend(metrics.tick.render("pw_room_tick_seconds", f'room="{room_id}"'))
+
+        header("pw_room_bullets", "gauge", "Bullets alive in a room")
+        for room_id, metrics in self.rooms.items():
+            lines.append(f'pw_room_bullets{{room="{room_id}"}} {metrics.bullets}')
+
+        header("pw_bullets", "gauge", "Bullets alive, all rooms")
+        lines.append(f"pw_bullets {sum(m.bullets for m in self.rooms.values())}")
+
+        for name, value, help_text in (
+            ("pw_messages_in_total", self.messages_in, "WebSocket messages received from players"),
+            ("pw_bytes_in_total", self.bytes_in, "WebSocket bytes received from players"),
+            ("pw_messages_out_total", self.messages_out, "WebSocket messages sent"),
+            ("pw_bytes_out_total", self.bytes_out, "WebSocket bytes sent"),
+            ("pw_messages_dropped_total", self.messages_dropped, "Player messages dropped by the per-connection rate limit"),
+            ("pw_inputs_rejected_total", self.inputs_rejected, "Player inputs rejected by validation or the shot rate limit"),
+        ):
+            header(name, "counter", help_text)
+            lines.append(f"{name} {value}")
+
+        header("pw_socket_send_seconds", "histogram", "Time to hand one message to the socket")
+        lines.extend(self.send.render("pw_socket_send_seconds"))
+
+        header("pw_event_loop_lag_seconds", "histogram", "How late the event loop woke up a sleeping task")
+        lines.extend(self.loop_lag.render("pw_event_loop_lag_seconds"))
+        header("pw_event_loop_lag_last_seconds", "gauge", "Most recent event loop lag sample")
+        lines.append(f"pw_event_loop_lag_last_seconds {self.last_loop_lag:.6f}")
+
+        for name, (value, help_text) in (gauges or {}).items():
+            header(name, "gauge", help_text)
+            lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -0,0 +1,230 @@
+import numpy as np
+from time import perf_counter
+from typing import Dict, List, Optional
+
+from game_engine import (
+    Room, MAP_WIDTH, MAP_HEIGHT, BULLET_DAMAGE, BULLET_LIFETIME,
+    HIT_RADIUS_SQ, MAX_HP, REGEN_DELAY, REGEN_PER_TICK, SWEEP_SCALE
+)
+
+# 以 NumPy 数组存放的子弹字段
+BULLET_FIELDS = ("x", "y", "dx", "dy", "start_x", "start_y", "max_dist", "created_at")
+
+
+class NumpyRoom(Room):
+    """结构数组（SoA）布局的房间
+
+    子弹的位置、速度、出发点、射程和创建时间各存一个 NumPy 数组，
+    移动、越界/射程/超时过滤和距离判定都按批处理。玩家数据仍保存在
+    players 字典中，每帧按顺序取成数组计算后再写回。命中结算按
+    (玩家, 子弹) 的原始顺序进行，因此结果与 Room.step 完全一致（包括延迟补偿）。
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._capacity = 0
+        self._count = 0
+        super().__init__(*args, **kwargs)
+
+    def _reset_bullets(self, capacity: int = 64):
+        self._capacity = capacity
+        self._count = 0
+        self._arrays = {field: np.empty(capacity) for field in BULLET_FIELDS}
+        self._ids: List[int] = []
+        self._owners: List[str] = []
+        self._hit_sets: List[set] = []
+        self._rewinds: List[int] = []
+
+    def _grow(self):
+        capacity = self._capacity * 2
+        for field, arr in self._arrays.items():
+            grown = np.empty(capacity)
+            grown[:self._count] = arr[:self._count]
+            self._arrays[field] = grown
+        self._capacity = capacity
+
+    @property
+    def bullets(self) -> List[Dict]:
+        """子弹的字典视图（每次调用重新生成）"""
+        n = self._count
+        columns = [self._arrays[field][:n].tolist() for field in BULLET_FIELDS]
+        bullets = []
+        for i, values in enumerate(zip(*columns)):
+            bullet = dict(zip(BULLET_FIELDS, values))
+            bullet["id"] = self._ids[i]
+            bullet["owner"] = self._owners[i]
+            bullet["hit_set"] = self._hit_sets[i]
+            bullet["rewind"] = self._rewinds[i]
+            bullets.append(bullet)
+        return bullets
+
+    @bullets.setter
+    def bullets(self, value: List[Dict]):
+        self._reset_bullets()
+        for bullet in value:
+            self.add_bullet(bullet)
+
+    def spawn_bullet(self, owner: str, x: float, y: float, dx: float, dy: float, max_dist: float,
+                     now: float, start_x: Optional[float] = None, start_y: Optional[float] = None,
+                     hit_set: Optional[set] = None, rewind: int = 0) -> int:
+        if self._count >= self._capacity:
+            self._grow()
+        i = self._count
+        values = (x, y, dx, dy, x if start_x is None else start_x,
+                  y if start_y is None else start_y, max_dist, now)
+        for field, value in zip(BULLET_FIELDS, values):
+            self._arrays[field][i] = value
+        bullet_id = self._register_bullet(owner, x, y, dx, dy)
+        self._ids.append(bullet_id)
+        self._owners.append(owner)
+        self._hit_sets.append(set(hit_set or ()))
+        self._rewinds.append(rewind)
+        self._count += 1
+        return bullet_id
+
+    def step(self, now: float) -> List[Dict]:
+        self.tick += 1
+        scale = self._step_scale(now)
+        self.clock += scale
+        t0 = perf_counter()
+        players = self.players
+        names = list(players)
+        player_list = [players[name] for name in names]
+
+        # 移动玩家
+        if player_list:
+            px = np.array([p["x"] for p in player_list], dtype=float)
+            py = np.array([p["y"] for p in player_list], dtype=float)
+            px += np.array([p["dx"] for p in player_list], dtype=float) * scale
+            py += np.array([p["dy"] for p in player_list], dtype=float) * scale
+            np.clip(px, 20, MAP_WIDTH-20, out=px)
+            np.clip(py, 20, MAP_HEIGHT-20, out=py)
+            for player, x, y in zip(player_list, px.tolist(), py.tolist()):
+                player["x"] = x
+                player["y"] = y
+        self.history.record(self.tick, players)
+
+        t1 = perf_counter()
+
+        # 移动子弹并过滤越界、超射程、超时的子弹
+        n = self._count
+        a = self._arrays
+        if n:
+            bx, by = a["x"][:n], a["y"][:n]
+            bx += a["dx"][:n] * scale
+            by += a["dy"][:n] * scale
+            max_dist = a["max_dist"][:n]
+            dist_sq = (bx - a["start_x"][:n]) ** 2 + (by - a["start_y"][:n]) ** 2
+            keep = ((0 < bx) & (bx < MAP_WIDTH) &
+                    (0 < by) & (by < MAP_HEIGHT) &
+                    (max_dist > 0) & (dist_sq < max_dist * max_dist) &
+                    (now - a["created_at"][:n] < BULLET_LIFETIME))
+
+            if not keep.all():
+                idx = np.flatnonzero(keep)
+                k = len(idx)
+                for field in BULLET_FIELDS:
+                    arr = a[field]
+                    arr[:k] = arr[idx]
+                idx = idx.tolist()
+                self._ids = [self._ids[i] for i in idx]
+                self._owners = [self._owners[i] for i in idx]
+                self._hit_sets = [self._hit_sets[i] for i in idx]
+                self._rewinds = [self._rewinds[i] for i in idx]
+                self._count = n = k
+                self._prune_spawns(set(self._ids))
+        t2 = perf_counter()
+
+        # 碰撞检测：一次算出所有 (玩家, 子弹) 到子弹终点（低于基准帧率时还有到这一帧飞行线段）
+        # 的距离平方，按行优先顺序结算；带延迟补偿的子弹所在的列换成玩家在 rewind 帧之前的位置
+        hits = []
+        if player_list and n:
+            tx, ty = px[:, None], py[:, None]
+            lagged = set(self._rewinds) - {0}
+            if lagged:
+                tx = np.repeat(tx, n, axis=1)
+                ty = np.repeat(ty, n, axis=1)
+                rewinds = np.array(self._rewinds)
+                for rewind in lagged:
+                    past = [self.history.position(self.tick - rewind, name, (x, y))
+                            for name, x, y in zip(names, px.tolist(), py.tolist())]
+                    cols = rewinds == rewind
+                    tx[:, cols] = np.array([p[0] for p in past])[:, None]
+                    ty[:, cols] = np.array([p[1] for p in past])[:, None]
+            ddx = tx - a["x"][:n][None, :]
+            ddy = ty - a["y"][:n][None, :]
+            close = ddx * ddx + ddy * ddy < HIT_RADIUS_SQ
+            if scale > SWEEP_SCALE:
+                # 线段上离玩家最近的点，运算顺序与 Room.step 一致，保证结果逐位相同
+                sdx = a["dx"][:n] * scale
+                sdy = a["dy"][:n] * scale
+                length_sq = sdx * sdx + sdy * sdy
+                rx = ddx + sdx
+                ry = ddy + sdy
+                t = np.divide(rx * sdx + ry * sdy, length_sq,
+                              out=np.zeros(rx.shape), where=length_sq > 0)
+                np.clip(t, 0.0, 1.0, out=t)
+                cx = rx - t * sdx
+                cy = ry - t * sdy
+                close |= cx * cx + cy * cy < HIT_RADIUS_SQ
+            close = np.argwhere(close)
+            for i, j in close.tolist():
+                username = names[i]
+                owner = self._owners[j]
+                hit_set = self._hit_sets[j]
+                if owner == username or username in hit_set:
+                    continue
+
+                player = player_list[i]
+                player["hp"] -= BULLET_DAMAGE
+                player["last_hit"] = now
+                hit_set.add(username)
+
+                killed = player["hp"] <= 0
+                if killed:
+                    player["deaths"] += 1
+                    if owner in players:
+                        players[owner]["kills"] += 1
+
+                hits.append({
+                    "owner": owner,
+                    "target": username,
+                    "damage": BULLET_DAMAGE,
+                    "killed": killed
+                })
+        t3 = perf_counter()
+
+        # 回血逻辑
+        if player_list:
+            hp = np.array([p["hp"] for p in player_list], dtype=float)
+            last_hit = np.array([p["last_hit"] for p in player_list], dtype=float)
+            regen = (now - last_hit > REGEN_DELAY) & (hp < MAX_HP)
+            for i in np.flatnonzero(regen).tolist():
+                player = player_list[i]
+                player["hp"] = min(player["hp"] + REGEN_PER_TICK * scale, MAX_HP)
+
+        self._finish_step(now)
+        self.phase_times = (t1 - t0, t2 - t1, t3 - t2, perf_counter() - t3)
+        return hits
+
+    def bullet_count(self) -> int:
+        return self._count
+
+    def _bullet_records(self) -> List[tuple]:
+        n = self._count
+        a = self._arrays
+        columns = [a[field][:n].tolist()
+                   for field in ("x", "y", "dx", "dy", "max_dist", "created_at", "start_x", "start_y")]
+        return [(owner, *values, tuple(hit_set), rewind)
+                for owner, hit_set, rewind, values in zip(self._owners, self._hit_sets, self._rewinds,
+                                                          zip(*columns))]
+
+    def _public_bullets(self) -> List[Dict]:
+        n = self._count
+        a = self._arrays
+        return [
+            {"id": bullet_id, "x": x, "y": y, "dx": dx, "dy": dy, "owner": owner}
+            for bullet_id, owner, x, y, dx, dy in zip(
+                self._ids, self._owners,
+                a["x"][:n].tolist(), a["y"][:n].tolist(),
+                a["dx"][:n].tolist(), a["dy"][:n].tolist())
+        ]
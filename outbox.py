@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from collections import deque
+from time import perf_counter
+
+from game_engine import TICK_RATE
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_QUEUE_DEPTH = 4  # 每个连接最多排队的消息数
+MAX_DROP_SECONDS = 3.0  # 连续丢帧持续这么久（秒）仍未发出则断开
+
+
+class Outbox:
+    """单个连接的发送队列，由独立的写任务负责发送
+
+    模拟帧只负责把消息放入队列，从不等待网络。状态帧采用
+    “最新状态优先”：队列满时丢弃最旧的状态帧；死亡通知等事件
+    消息不会被丢弃。连续丢帧过多说明客户端已跟不上，直接断开。
+    rate 为状态帧的推送频率，用来把 max_drop_seconds 换算成帧数。
+    """
+
+    def __init__(self, websocket, max_depth: int = MAX_QUEUE_DEPTH,
+                 rate: float = TICK_RATE, max_drop_seconds: float = MAX_DROP_SECONDS):
+        self.websocket = websocket
+        self.max_depth = max_depth
+        self.max_drop_streak = max(1, round(max_drop_seconds * rate))
+        self.queue = deque()  # [(is_state, payload)]
+        self.closed = False
+
+        # 统计
+        self.sent = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self.max_depth_seen = 0
+        self.drop_streak = 0
+
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._writer())
+
+    def push_state(self, payload):
+        self._push(True, payload)
+
+    def push_event(self, payload):
+        self._push(False, payload)
+
+    def _push(self, is_state: bool, payload):
+        if self.closed:
+            return
+        self.queue.append((is_state, payload))
+
+        if len(self.queue) > self.max_depth:
+            self._drop_oldest_state()
+        self.max_depth_seen = max(self.max_depth_seen, len(self.queue))
+        self._wakeup.set()
+
+    def _drop_oldest_state(self):
+        for i, (is_state, _) in enumerate(self.queue):
+            if is_state:
+                del self.queue[i]
+                self.dropped += 1
+                self.drop_streak += 1
+                break
+
+        if self.drop_streak >= self.max_drop_streak:
+            logger.warning(f"Slow client dropped after {self.drop_streak} skipped frames")
+            asyncio.create_task(self.close(code=4008, reason="Connection too slow"))
+
+    async def _writer(self):
+        ws = self.websocket
+        try:
+            while True:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                _, payload = self.queue.popleft()
+                start = perf_counter()
+                if isinstance(payload, bytes):
+                    await ws.send_bytes(payload)
+                else:
+                    await ws.send_text(payload)
+                metrics.record_out(len(payload), perf_counter() - start)
+                self.sent += 1
+                self.bytes_sent += len(payload)
+                self.drop_streak = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 连接已断开，由接收端负责清理
+            self.closed = True
+            self.queue.clear()
+
+    async def close(self, code: int = None, reason: str = None):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self._task.cancel()
+        if code is not None:
+            try:
+                await asyncio.wait_for(self.websocket.close(code=code, reason=reason), timeout=1)
+            except Exception:
+                pass
+
+    def stats(self):
+        return {
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_depth_seen,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "bytes_sent": self.bytes_sent
+        }
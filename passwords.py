@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+# scrypt 参数，可按部署调整；修改后旧哈希会在下次登录时自动升级
+SCRYPT_N = int(os.environ.get("PW_SCRYPT_N", 2 ** 14))
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+HASH_WORKERS = int(os.environ.get("PW_HASH_WORKERS", 2))
+HASH_MAX_PENDING = 64  # 排队中的哈希请求上限，超过则直接拒绝
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def hash_password(password: str, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P) -> str:
+    """加盐 scrypt 哈希，格式：scrypt$n$r$p$salt$hash"""
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                            maxmem=128 * n * r * 2)
+    return f"scrypt${n}${r}${p}${salt.hex()}${digest.hex()}"
+
+
+def verify_password(password: str, stored: str) -> Tuple[bool, bool]:
+    """校验密码，返回 (是否正确, 是否需要重新哈希)"""
+    if not stored.startswith("scrypt$"):
+        # 旧版无盐 SHA-256
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored), True
+
+    try:
+        _, n, r, p, salt, expected = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        digest = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt), n=n, r=r, p=p,
+                                maxmem=128 * n * r * 2)
+    except ValueError:
+        return False, False
+    ok = hmac.compare_digest(digest.hex(), expected)
+    return ok, ok and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+class PasswordHasher:
+    """在有界线程池中执行密码哈希，避免阻塞驱动游戏循环的事件循环
+
+    hashlib.scrypt 执行期间会释放 GIL，所以线程池足以让哈希
+    与模拟帧并行。同时执行的哈希数不超过 workers，多余的请求排队等待，
+    排队数超过 max_pending 时抛出 HasherBusy。
+
+    用户不存在时用 verify_missing() 对一个固定的哈希做同样的校验，
+    让两种情况的耗时相同，无法通过响应时间探测用户名是否存在。
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pw-hash")
+        self.semaphore = asyncio.Semaphore(workers)
+        self.waiting = 0
+        # 启动时在线程池中生成，与真实哈希使用相同的参数
+        self._dummy_hash = self.executor.submit(hash_password, os.urandom(SALT_BYTES).hex())
+
+    async def _run(self, fn, *args):
+        if self.waiting >= self.max_pending:
+            raise HasherBusy()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self.semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, password: str, stored: str) -> Tuple[bool, bool]:
+        return await self._run(verify_password, password, stored)
+
+    async def verify_missing(self, password: str) -> Tuple[bool, bool]:
+        """用户不存在时调用，耗时与 verify() 相同，结果总是失败"""
+        await self._run(lambda: verify_password(password, self._dummy_hash.result()))
+        return False, False
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
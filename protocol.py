@@ -0,0 +1,161 @@
+import math
+import struct
+from typing import Dict, Optional
+
+# 二进制协议：所有数值均为小端序定长结构
+# 客户端 -> 服务器
+MSG_MOVE = 1  # B type, f dx, f dy
+MSG_SHOOT = 2  # B type, f dx, f dy, f max_dist[, I tick]
+MSG_RESPAWN = 3  # B type
+MSG_ACK = 4  # B type, I tick
+
+# 服务器 -> 客户端
+MSG_STATE = 1
+
+BINARY_SUBPROTOCOL = "pw-binary"
+
+MOVE = struct.Struct("<Bff")
+SHOOT = struct.Struct("<Bfff")
+SHOOT_TICK = struct.Struct("<BfffI")  # 带开枪时看到的帧号，用于延迟补偿
+ACK = struct.Struct("<BI")
+
+# 状态帧：B type, I tick, B 玩家数, B 最大玩家数, H 子弹数, B 房间名长度 + 房间名
+STATE_HEADER = struct.Struct("<BIBBHB")
+# 玩家：B 名字长度 + 名字, f x, f y, f dx, f dy, i hp, I kills, I deaths, B 是否存活
+PLAYER = struct.Struct("<ffffiIIB")
+# 子弹：f x, f y, B 所属玩家在本帧玩家列表中的下标（0xFF 表示已离开）
+BULLET = struct.Struct("<ffB")
+
+NO_OWNER = 0xFF
+
+
+def decode_input(data: bytes) -> Optional[Dict]:
+    """把二进制输入解码成与 JSON 消息相同结构的字典，无法识别时返回 None"""
+    if not data:
+        return None
+    kind = data[0]
+    try:
+        if kind == MSG_MOVE:
+            _, dx, dy = MOVE.unpack(data)
+            if not (math.isfinite(dx) and math.isfinite(dy)):
+                return None
+            return {"type": "move", "dx": dx, "dy": dy}
+        if kind == MSG_SHOOT:
+            if len(data) == SHOOT_TICK.size:
+                _, dx, dy, max_dist, tick = SHOOT_TICK.unpack(data)
+            else:
+                _, dx, dy, max_dist = SHOOT.unpack(data)
+                tick = None
+            if not (math.isfinite(dx) and math.isfinite(dy) and math.isfinite(max_dist)):
+                return None
+            msg = {"type": "shoot", "dx": dx, "dy": dy, "max_dist": max_dist}
+            if tick is not None:
+                msg["tick"] = tick
+            return msg
+        if kind == MSG_RESPAWN:
+            return {"type": "respawn"}
+        if kind == MSG_ACK:
+            _, tick = ACK.unpack(data)
+            return {"type": "ack", "tick": tick}
+    except struct.error:
+        return None
+    return None
+
+
+def encode_input(msg: Dict) -> bytes:
+    """客户端侧编码，供机器人和基准测试使用"""
+    kind = msg["type"]
+    if kind == "move":
+        return MOVE.pack(MSG_MOVE, msg.get("dx", 0), msg.get("dy", 0))
+    if kind == "shoot":
+        if "tick" in msg:
+            return SHOOT_TICK.pack(MSG_SHOOT, msg["dx"], msg["dy"], msg.get("max_dist", 800), msg["tick"])
+        return SHOOT.pack(MSG_SHOOT, msg["dx"], msg["dy"], msg.get("max_dist", 800))
+    if kind == "respawn":
+        return bytes([MSG_RESPAWN])
+    if kind == "ack":
+        return ACK.pack(MSG_ACK, msg["tick"])
+    raise ValueError(f"Unknown message type: {kind}")
+
+
+def _short_utf8(text: str) -> bytes:
+    """UTF-8 编码后截断到 255 字节以内，不截断多字节字符"""
+    encoded = text.encode()
+    if len(encoded) <= 255:
+        return encoded
+    return encoded[:255].decode("utf-8", "ignore").encode()
+
+
+def _clamp_u32(value: int) -> int:
+    return min(max(int(value), 0), 0xFFFFFFFF)
+
+
+def encode_state(room) -> bytes:
+    """把房间状态编码成一个二进制状态帧"""
+    players = room.players
+    names = list(players)
+    index = {name: i for i, name in enumerate(names)}
+    bullets = room.public_bullets()
+    room_name = _short_utf8(room.name)
+
+    parts = [
+        STATE_HEADER.pack(MSG_STATE, room.tick & 0xFFFFFFFF, len(names),
+                          min(room.max_players, 255), min(len(bullets), 0xFFFF),
+                          len(room_name)),
+        room_name
+    ]
+    pack_player = PLAYER.pack
+    for name in names:
+        player = players[name]
+        encoded = _short_utf8(name)
+        hp = player["hp"]
+        parts.append(bytes([len(encoded)]))
+        parts.append(encoded)
+        parts.append(pack_player(
+            player["x"], player["y"], player["dx"], player["dy"],
+            min(max(int(hp), 0), 0x7FFFFFFF),
+            _clamp_u32(player["kills"]), _clamp_u32(player["deaths"]),
+            1 if hp > 0 else 0
+        ))
+
+    pack_bullet = BULLET.pack
+    for bullet in bullets[:0xFFFF]:
+        parts.append(pack_bullet(bullet["x"], bullet["y"],
+                                 index.get(bullet["owner"], NO_OWNER)))
+    return b"".join(parts)
+
+
+def decode_state(data: bytes) -> Dict:
+    """解码状态帧，结构与 Room.get_state() 一致（供测试工具使用）"""
+    _, tick, player_count, max_players, bullet_count, name_len = STATE_HEADER.unpack_from(data)
+    offset = STATE_HEADER.size
+    room_name = data[offset:offset + name_len].decode()
+    offset += name_len
+
+    names = []
+    players = {}
+    for _ in range(player_count):
+        length = data[offset]
+        name = data[offset + 1:offset + 1 + length].decode()
+        offset += 1 + length
+        x, y, dx, dy, hp, kills, deaths, alive = PLAYER.unpack_from(data, offset)
+        offset += PLAYER.size
+        names.append(name)
+        players[name] = {
+            "x": x, "y": y, "dx": dx, "dy": dy, "hp": hp,
+            "kills": kills, "deaths": deaths,
+            "status": "alive" if alive else "dead"
+        }
+
+    bullets = []
+    for _ in range(bullet_count):
+        x, y, owner = BULLET.unpack_from(data, offset)
+        offset += BULLET.size
+        bullets.append({"x": x, "y": y, "owner": names[owner] if owner != NO_OWNER else None})
+
+    return {
+        "tick": tick,
+        "players": players,
+        "bullets": bullets,
+        "room_info": {"name": room_name, "player_count": player_count, "max_players": max_players}
+    }
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""对局录像：记录房间的输入，离线重新模拟
+
+开启录像（PW_REPLAY_DIR=目录）后，每个房间写一个 gzip 压缩的 JSON Lines 文件，
+只追加写入，每行一条记录：
+- room：房间信息、模拟帧率和随机数种子，文件的第一条记录；
+- join / leave：玩家进出房间；
+- tick：一帧的时间戳和这一帧生效的输入（移动、射击、重生，已经过校验和限速）；
+- keyframe：每隔 KEYFRAME_INTERVAL 帧一次的完整状态，回放时用来校验结果是否一致。
+
+游戏循环只把记录追加到内存缓冲，后台任务每隔 FLUSH_INTERVAL 秒在线程池中
+编码、压缩并写入，每次写入后同步刷新，进程崩溃时文件中已有的部分仍然可读。
+
+模拟只依赖房间的随机数种子、玩家进出和每帧的输入与时间戳，因此回放可以
+不启动服务器、不等待真实时间，逐帧重新模拟出完全相同的结果，也可以作为
+模拟代码的确定性基准测试语料。
+
+用法:
+    python replay.py replays/abcd1234-1700000000.pwr.gz
+    python replay.py replays/*.pwr.gz --backend numpy --repeat 3
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional
+
+from game_engine import Room, new_room
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2  # 2: 记录模拟帧率，移动按帧间隔缩放
+KEYFRAME_INTERVAL = 500  # 每隔多少帧写一次完整状态（50 Hz 下 10 秒）
+FLUSH_INTERVAL = 1.0  # 写入间隔（秒），崩溃时最多丢失这么久的录像
+FILE_SUFFIX = ".pwr.gz"
+
+
+def room_keyframe(room: Room) -> Dict:
+    """房间当前的完整模拟状态（玩家包含 last_hit 等服务器字段）"""
+    return {
+        "type": "keyframe",
+        "tick": room.tick,
+        "players": {username: dict(player) for username, player in room.players.items()},
+        "bullets": [dict(bullet) for bullet in room.public_bullets()]
+    }
+
+
+class RoomRecording:
+    """单个房间的录像缓冲，由 Room 在玩家进出和每帧开始时调用"""
+
+    def __init__(self, path: str, room: Room, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.records = 0
+        self.pending: List[Dict] = [{
+            "type": "room",
+            "version": FORMAT_VERSION,
+            "room_id": room.room_id,
+            "name": room.name,
+            "creator": room.creator,
+            "max_players": room.max_players,
+            "seed": room.seed,
+            "tick_rate": room.tick_rate,
+            "created_at": room.created_at
+        }]
+        self._file = None
+
+    def join(self, username: str, at: float):
+        self.pending.append({"type": "join", "user": username, "at": at})
+
+    def leave(self, username: str):
+        self.pending.append({"type": "leave", "user": username})
+
+    def tick(self, room: Room, now: float):
+        """在 apply_inputs 之前调用，记录这一帧将要生效的输入"""
+        if room.tick % self.keyframe_interval == 0:
+            self.pending.append(room_keyframe(room))
+        record = {"type": "tick", "tick": room.tick + 1, "now": now}
+        inputs = [
+            [username, buffered.move, list(buffered.shots), buffered.respawn]
+            for username, buffered in room.inputs.items()
+            if buffered.move is not None or buffered.shots or buffered.respawn
+        ]
+        if inputs:
+            record["inputs"] = inputs
+        self.pending.append(record)
+
+    def drain(self) -> List[Dict]:
+        batch, self.pending = self.pending, []
+        return batch
+
+    def write(self, batch: List[Dict]) -> int:
+        """编码并追加写入一批记录（在线程池中执行），返回写入的字节数"""
+        if self._file is None:
+            self._file = gzip.open(self.path, "ab")
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in batch).encode()
+        self._file.write(data)
+        self._file.flush(zlib.Z_SYNC_FLUSH)
+        self.records += len(batch)
+        return len(data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ReplayRecorder:
+    """管理所有房间的录像，后台任务定时批量写入"""
+
+    def __init__(self, directory: str, keyframe_interval: int = KEYFRAME_INTERVAL,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.directory = directory
+        self.keyframe_interval = keyframe_interval
+        self.flush_interval = flush_interval
+        self.recordings: Dict[str, RoomRecording] = {}
+        self.bytes_written = 0
+        self.flushes = 0
+        self._lock = asyncio.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self, room: Room) -> RoomRecording:
+        path = os.path.join(self.directory, f"{room.room_id}-{int(room.created_at)}{FILE_SUFFIX}")
+        recording = RoomRecording(path, room, self.keyframe_interval)
+        room.recording = recording
+        self.recordings[room.room_id] = recording
+        return recording
+
+    def _write(self, batches, closing):
+        written = 0
+        for recording, batch in batches:
+            try:
+                written += recording.write(batch)
+            except Exception as e:
+                logger.error(f"Replay write error ({recording.path}): {e}")
+        for recording in closing:
+            recording.close()
+        return written
+
+    async def flush(self, closing: Optional[List[RoomRecording]] = None):
+        async with self._lock:
+            closing = closing or []
+            batches = [(recording, recording.drain())
+                       for recording in list(self.recordings.values()) + closing
+                       if recording.pending]
+            if not batches and not closing:
+                return
+            self.bytes_written += await asyncio.to_thread(self._write, batches, closing)
+            self.flushes += 1
+
+    async def stop(self, room: Room):
+        """房间删除时调用：写入剩余的记录并关闭文件"""
+        recording = self.recordings.pop(room.room_id, None)
+        room.recording = None
+        if recording is not None:
+            await self.flush([recording])
+
+    async def close(self):
+        closing = list(self.recordings.values())
+        self.recordings.clear()
+        await self.flush(closing)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+def read_records(path: str) -> Iterator[Dict]:
+    """逐条读取录像；文件末尾不完整（进程崩溃时正在写入）时读到最后一条完整记录为止"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if line.endswith("\n"):
+                    yield json.loads(line)
+        except (EOFError, zlib.error):
+            logger.warning(f"{path}: 录像文件不完整，只回放到最后一条完整记录")
+
+
+class ReplayResult:
+    def __init__(self, path: str):
+        self.path = path
+        self.room_id = None
+        self.ticks = 0
+        self.players = set()
+        self.shots = 0
+        self.hits = 0
+        self.kills = 0
+        self.keyframes = 0
+        self.mismatches: List[int] = []  # 与录像中的完整状态不一致的帧号
+        self.match_seconds = 0.0  # 录像覆盖的真实时长
+        self.sim_seconds = 0.0  # 回放的模拟耗时
+        self.final_players: Dict[str, Dict] = {}  # 每名玩家离开时（或录像结束时）的状态
+
+
+def replay(path: str, backend: str = "dict", verify: bool = True) -> ReplayResult:
+    """不启动服务器，按录像逐帧重新模拟一个房间"""
+    result = ReplayResult(path)
+    room = None
+    first_now = None
+    now = 0.0
+    for record in read_records(path):
+        kind = record["type"]
+        if kind == "room":
+            if record["version"] != FORMAT_VERSION:
+                raise ValueError(f"不支持的录像格式版本: {record['version']}")
+            room = new_room(record["room_id"], record["name"], record["creator"],
+                            record["max_players"], backend=backend, seed=record["seed"],
+                            tick_rate=record["tick_rate"])
+            room.created_at = record["created_at"]
+            result.room_id = room.room_id
+        elif kind == "join":
+            room.add_player(record["user"], None)
+            room.players[record["user"]]["last_hit"] = record["at"]
+            result.players.add(record["user"])
+        elif kind == "leave":
+            player = room.public_players().get(record["user"])
+            if player is not None:
+                result.final_players[record["user"]] = player
+            room.remove_player(record["user"])
+        elif kind == "keyframe":
+            if verify:
+                result.keyframes += 1
+                if (record["tick"] != room.tick or record["players"] != room.players or
+                        record["bullets"] != room.public_bullets()):
+                    result.mismatches.append(record["tick"])
+        elif kind == "tick":
+            now = record["now"]
+            if first_now is None:
+                first_now = now
+            for username, move, shots, respawn in record.get("inputs", ()):
+                buffered = room.inputs.get(username)
+                if buffered is None:
+                    continue
+                buffered.move = tuple(move) if move is not None else None
+                buffered.shots = [tuple(shot) for shot in shots]  # (dx, dy, max_dist, rewind)
+                buffered.respawn = respawn
+                result.shots += len(shots)
+            start = time.perf_counter()
+            room.apply_inputs(now)
+            hits = room.step(now)
+            result.sim_seconds += time.perf_counter() - start
+            if verify and room.tick != record["tick"]:
+                result.mismatches.append(record["tick"])
+            result.ticks += 1
+            result.hits += len(hits)
+            result.kills += sum(1 for hit in hits if hit["killed"])
+    if first_now is not None:
+        result.match_seconds = now - first_now
+    if room is not None:
+        result.final_players.update(room.public_players())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放 PixelWarzone 对局录像")
+    parser.add_argument("files", nargs="+", help="录像文件（.pwr.gz），可以使用通配符")
+    parser.add_argument("--backend", choices=("dict", "numpy"), default="dict", help="模拟后端")
+    parser.add_argument("--repeat", type=int, default=1, help="每个文件回放几次，取最快的一次计时")
+    parser.add_argument("--no-verify", action="store_true", help="不与录像中的完整状态比较")
+    parser.add_argument("--players", action="store_true", help="输出最终的玩家状态")
+    args = parser.parse_args()
+
+    paths = [path for pattern in args.files for path in sorted(glob.glob(pattern)) or [pattern]]
+    failed = False
+    print(f"{'房间':<10} {'帧数':>8} {'玩家':>5} {'命中':>6} {'击杀':>5} {'时长(s)':>9} "
+          f"{'回放(s)':>9} {'倍速':>8} {'每帧(us)':>9} {'校验':>8}")
+    for path in paths:
+        results = [replay(path, args.backend, verify=not args.no_verify) for _ in range(max(args.repeat, 1))]
+        result = min(results, key=lambda r: r.sim_seconds)
+        speedup = result.match_seconds / result.sim_seconds if result.sim_seconds else float("inf")
+        per_tick = result.sim_seconds / result.ticks * 1e6 if result.ticks else 0.0
+        if args.no_verify:
+            verdict = "-"
+        elif result.mismatches:
+            verdict = f"✗ {result.mismatches[0]}"
+            failed = True
+        else:
+            verdict = f"✓ {result.keyframes}"
+        print(f"{result.room_id or '?':<10} {result.ticks:>8} {len(result.players):>5} {result.hits:>6} "
+              f"{result.kills:>5} {result.match_seconds:>9.1f} {result.sim_seconds:>9.3f} "
+              f"{speedup:>7.0f}x {per_tick:>9.1f} {verdict:>8}")
+        if args.players:
+            for username, player in result.final_players.items():
+                print(f"    {username}: {json.dumps(player, ensure_ascii=False)}")
+    if failed:
+        print("❌ 回放结果与录像不一致（上表给出第一处不一致的帧号）")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import hashlib
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Tuple
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+MAX_CACHED_QUERIES = 256
+
+
+def room_summary(room) -> Dict:
+    return {
+        "id": room.room_id,
+        "name": room.name,
+        "creator": room.creator,
+        "player_count": len(room.players),
+        "max_players": room.max_players,
+        "has_password": bool(room.password),
+        "created_at": room.created_at
+    }
+
+
+def encode_cursor(key: Tuple[float, str]) -> str:
+    return f"{-key[0]!r}_{key[1]}"
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[float, str]]:
+    created_at, sep, room_id = cursor.partition("_")
+    try:
+        return -float(created_at), room_id
+    except ValueError:
+        return None
+
+
+class RoomDirectory:
+    """大厅房间目录
+
+    按创建时间从新到旧维护 (-created_at, room_id) 的有序列表和每个房间的
+    摘要，房间创建、进出玩家、删除时增量更新，不再每次请求重建并排序。
+    每次变化递增 version，与查询参数一起生成 ETag；同一 version 下相同查询直接返回缓存。
+    自上次 drain_changes() 以来变化过的房间会被记录下来，供大厅推送合并发送。
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._order: List[Tuple[float, str]] = []  # [(-created_at, room_id)]
+        self._summaries: Dict[str, Dict] = {}  # {room_id: 摘要}
+        self._cache: Dict[tuple, Dict] = {}  # {查询参数: 结果}，只对当前 version 有效
+        self._changed = set()  # 自上次推送以来新增或变化的 room_id
+        self._removed = set()  # 自上次推送以来删除的 room_id
+
+    def __len__(self):
+        return len(self._summaries)
+
+    def etag(self, cursor: Optional[str] = None, limit: int = PAGE_SIZE,
+             has_password: Optional[bool] = None, not_full: bool = False) -> str:
+        """当前 version 下这个查询的 ETag，不同的页和筛选条件互不相同"""
+        params = repr((self.version, cursor or None, limit, has_password, not_full))
+        return f'W/"rooms-{self.version}-{hashlib.sha1(params.encode()).hexdigest()[:16]}"'
+
+    def _bump(self):
+        self.version += 1
+        self._cache.clear()
+
+    def update(self, room):
+        """房间创建或人数变化后调用"""
+        self.update_summary(room_summary(room))
+
+    def update_summary(self, summary: Dict):
+        room_id = summary["id"]
+        old = self._summaries.get(room_id)
+        if old == summary:
+            return
+        if old is None:
+            insort(self._order, (-summary["created_at"], room_id))
+        self._summaries[room_id] = summary
+        self._changed.add(room_id)
+        self._removed.discard(room_id)
+        self._bump()
+
+    def sync(self, summaries: List[Dict]):
+        """用完整的房间列表（如分片模式下的共享存储）刷新目录，只有变化的房间会被记录"""
+        seen = set()
+        for summary in summaries:
+            seen.add(summary["id"])
+            self.update_summary(summary)
+        for room_id in [room_id for room_id in self._summaries if room_id not in seen]:
+            self.remove(room_id)
+
+    def remove(self, room_id: str):
+        summary = self._summaries.pop(room_id, None)
+        if summary is None:
+            return
+        key = (-summary["created_at"], room_id)
+        del self._order[bisect_left(self._order, key)]
+        self._changed.discard(room_id)
+        self._removed.add(room_id)
+        self._bump()
+
+    def query(self, cursor: Optional[str] = None, limit: int = PAGE_SIZE,
+              has_password: Optional[bool] = None, not_full: bool = False) -> Dict:
+        """返回一页房间，next_cursor 为 None 表示没有更多"""
+        params = (cursor or None, limit, has_password, not_full)
+        cached = self._cache.get(params)
+        if cached is not None:
+            return cached
+
+        start = 0
+        if cursor:
+            key = decode_cursor(cursor)
+            if key is not None:
+                start = bisect_right(self._order, key)
+
+        page = []
+        next_cursor = None
+        order = self._order
+        for i in range(start, len(order)):
+            summary = self._summaries[order[i][1]]
+            if has_password is not None and summary["has_password"] != has_password:
+                continue
+            if not_full and summary["player_count"] >= summary["max_players"]:
+                continue
+            if len(page) == limit:
+                # 还有更多匹配的房间，从本页最后一个房间之后继续
+                last = page[-1]
+                next_cursor = encode_cursor((-last["created_at"], last["id"]))
+                break
+            page.append(summary)
+
+        result = {"rooms": page, "next_cursor": next_cursor, "version": self.version}
+        if len(self._cache) >= MAX_CACHED_QUERIES:
+            self._cache.clear()
+        self._cache[params] = result
+        return result
+
+    def snapshot(self) -> List[Dict]:
+        return [self._summaries[room_id] for _, room_id in self._order]
+
+    def drain_changes(self) -> Optional[Dict]:
+        """取出自上次调用以来的变化，没有变化时返回 None"""
+        if not self._changed and not self._removed:
+            return None
+        changes = {
+            "version": self.version,
+            "updated": [self._summaries[room_id] for room_id in self._changed],
+            "removed": list(self._removed)
+        }
+        self._changed = set()
+        self._removed = set()
+        return changes
+
+    def clear(self):
+        for room_id in list(self._summaries):
+            self.remove(room_id)
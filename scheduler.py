@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict
+
+from game_engine import TICK_RATE
+
+logger = logging.getLogger(__name__)
+
+IDLE_TICK_RATE = 2  # 房间空闲时的帧率
+IDLE_AFTER = 1.0  # 连续空闲这么久（秒）后降到 IDLE_TICK_RATE
+HIBERNATE_AFTER = 30.0  # 连续空闲这么久（秒）后完全停止，没有连接的房间空闲 IDLE_AFTER 后即停止
+
+
+class TickStats:
+    """单个房间的帧率统计"""
+
+    def __init__(self, tick_rate: int):
+        self.target_rate = tick_rate
+        self.ticks = 0
+        self.skipped = 0
+        self.catchup = 0
+        self.achieved_rate = float(tick_rate)
+        self.last_tick_ms = 0.0
+        self.max_tick_ms = 0.0
+        self.mode = "active"  # active（全速）、idle（低帧率）或 hibernating（停止，等待唤醒）
+        self.hibernations = 0
+        self._window_start = time.monotonic()
+        self._window_ticks = 0
+
+    def record(self, duration: float, now: float):
+        self.ticks += 1
+        self._window_ticks += 1
+        self.last_tick_ms = duration * 1000
+        self.max_tick_ms = max(self.max_tick_ms, self.last_tick_ms)
+
+        # 每秒刷新一次实际帧率
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            self.achieved_rate = self._window_ticks / elapsed
+            self._window_start = now
+            self._window_ticks = 0
+
+    def to_dict(self):
+        return {
+            "target_rate": self.target_rate,
+            "achieved_rate": round(self.achieved_rate, 2),
+            "ticks": self.ticks,
+            "skipped": self.skipped,
+            "catchup": self.catchup,
+            "last_tick_ms": round(self.last_tick_ms, 3),
+            "max_tick_ms": round(self.max_tick_ms, 3),
+            "mode": self.mode,
+            "hibernations": self.hibernations
+        }
+
+
+class RoomScheduler:
+    """为每个房间运行独立的固定步长模拟任务
+
+    每个房间按自己的时钟推进，慢房间或慢连接不会拖慢其他房间。
+    下一帧的截止时间按固定间隔累加，而不是在帧末固定 sleep，
+    因此单帧耗时不会累积成时钟漂移。落后时先连续追帧，
+    落后超过 max_catchup 帧则直接丢弃多余的帧。
+
+    房间连续空闲（room.is_idle()：下一帧不会有任何变化）idle_after 秒后降到
+    idle_tick_rate，继续空闲 hibernate_after 秒（没有连接时 idle_after 秒）后
+    完全停止。任何时候调用 wake() 都会立即恢复全速，例如收到玩家输入时。
+    空闲时状态不变，所以降频或停止不影响模拟结果。
+    """
+
+    def __init__(self, tick_callback: Callable[..., Awaitable[None]],
+                 tick_rate: int = TICK_RATE, max_catchup: int = 5,
+                 idle_tick_rate: int = IDLE_TICK_RATE, idle_after: float = IDLE_AFTER,
+                 hibernate_after: float = HIBERNATE_AFTER):
+        self.tick_callback = tick_callback
+        self.tick_rate = tick_rate
+        self.interval = 1.0 / tick_rate
+        self.max_catchup = max_catchup
+        self.idle_interval = 1.0 / idle_tick_rate
+        self.idle_after = idle_after
+        self.hibernate_after = hibernate_after
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.stats: Dict[str, TickStats] = {}
+        self.wakeups: Dict[str, asyncio.Event] = {}
+
+    def start(self, room):
+        if room.room_id in self.tasks:
+            return
+        self.stats[room.room_id] = TickStats(self.tick_rate)
+        self.wakeups[room.room_id] = asyncio.Event()
+        self.tasks[room.room_id] = asyncio.create_task(self._run(room))
+
+    def stop(self, room_id: str):
+        task = self.tasks.pop(room_id, None)
+        self.stats.pop(room_id, None)
+        self.wakeups.pop(room_id, None)
+        if task and task is not asyncio.current_task():
+            task.cancel()
+
+    def stop_all(self):
+        for room_id in list(self.tasks):
+            self.stop(room_id)
+
+    def wake(self, room_id: str):
+        """房间有输入或人员变化，立即恢复全速"""
+        wakeup = self.wakeups.get(room_id)
+        if wakeup:
+            wakeup.set()
+
+    def hibernating(self) -> int:
+        return sum(1 for stats in self.stats.values() if stats.mode == "hibernating")
+
+    def get_stats(self, room_id: str):
+        stats = self.stats.get(room_id)
+        return stats.to_dict() if stats else None
+
+    async def _run(self, room):
+        stats = self.stats[room.room_id]
+        wakeup = self.wakeups[room.room_id]
+        next_tick = time.monotonic()
+        idle_since = None
+
+        while self.tasks.get(room.room_id) is asyncio.current_task():
+            # 从这一帧开始之后的唤醒都会让下面的等待立即返回
+            wakeup.clear()
+            now = time.monotonic()
+            behind = now - next_tick
+
+            # 落后太多时跳帧，避免连续补帧拖垮事件循环
+            if behind > self.interval * self.max_catchup:
+                dropped = int(behind / self.interval)
+                stats.skipped += dropped
+                next_tick += dropped * self.interval
+            elif behind > self.interval:
+                stats.catchup += 1
+
+            try:
+                await self.tick_callback(room, time.time())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Room {room.room_id} tick error: {e}")
+
+            finished = time.monotonic()
+            stats.record(finished - now, finished)
+
+            if not room.is_idle():
+                idle_since = None
+            elif idle_since is None:
+                idle_since = finished
+            idle_for = finished - idle_since if idle_since is not None else 0.0
+            if idle_for >= self.idle_after:
+                if not room.outboxes or idle_for >= self.hibernate_after:
+                    stats.mode = "hibernating"
+                    stats.hibernations += 1
+                    await wakeup.wait()
+                else:
+                    stats.mode = "idle"
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), self.idle_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                if wakeup.is_set():
+                    idle_since = None
+                    stats.mode = "active"
+                # 降频或停止期间不追帧
+                next_tick = time.monotonic()
+                continue
+            stats.mode = "active"
+
+            next_tick += self.interval
+            delay = next_tick - finished
+            # 追帧时也要让出事件循环
+            await asyncio.sleep(delay if delay > 0 else 0)
@@ -0,0 +1,87 @@
+import heapq
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+SESSION_TTL = 86400  # 会话有效期：24小时
+ONLINE_WINDOW = 300  # 最近 5 分钟内有活动视为在线
+TOUCH_INTERVAL = 1.0  # 同一用户的活动时间最多每秒更新一次
+
+
+class SessionStore:
+    """会话存储
+
+    - 过期：按到期时间维护最小堆，每次只弹出已到期的会话，
+      不需要扫描全部会话。被提前删除的会话在堆中惰性跳过。
+    - 在线：按最近活动时间排序的 OrderedDict，活动时移到末尾，
+      从头部淘汰超过 ONLINE_WINDOW 未活动的用户，因此在线列表是 O(在线人数)。
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, online_window: float = ONLINE_WINDOW):
+        self.ttl = ttl
+        self.online_window = online_window
+        self.tokens: Dict[str, Dict] = {}  # {session_token: {username, created_at}}
+        self._expiry_heap = []  # [(expires_at, session_token)]
+        self._last_seen: "OrderedDict[str, float]" = OrderedDict()  # {username: last_seen}
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, token):
+        return token in self.tokens
+
+    def add(self, token: str, username: str, created_at: float = None) -> Dict:
+        created_at = time.time() if created_at is None else created_at
+        session = {"username": username, "created_at": created_at}
+        self.tokens[token] = session
+        heapq.heappush(self._expiry_heap, (created_at + self.ttl, token))
+        return session
+
+    def remove(self, token: str):
+        self.tokens.pop(token, None)
+
+    def get_username(self, token: str, now: float = None) -> Optional[str]:
+        session = self.tokens.get(token)
+        if not session:
+            return None
+        now = time.time() if now is None else now
+        if now - session["created_at"] >= self.ttl:
+            return None
+        return session["username"]
+
+    def touch(self, username: str, now: float = None):
+        """记录用户活动"""
+        now = time.time() if now is None else now
+        last_seen = self._last_seen.get(username)
+        if last_seen is not None and now - last_seen < TOUCH_INTERVAL:
+            return
+        self._last_seen[username] = now
+        self._last_seen.move_to_end(username)
+
+    def expire(self, now: float = None) -> List[str]:
+        """淘汰已过期的会话，返回被淘汰的 token"""
+        now = time.time() if now is None else now
+        expired = []
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, token = heapq.heappop(heap)
+            session = self.tokens.get(token)
+            if session and session["created_at"] + self.ttl <= now:
+                del self.tokens[token]
+                expired.append(token)
+        return expired
+
+    def online_users(self, now: float = None) -> List[str]:
+        now = time.time() if now is None else now
+        last_seen = self._last_seen
+        while last_seen:
+            username, seen = next(iter(last_seen.items()))
+            if now - seen < self.online_window:
+                break
+            last_seen.popitem(last=False)
+        return list(last_seen)
+
+    def clear(self):
+        self.tokens.clear()
+        self._expiry_heap.clear()
+        self._last_seen.clear()
@@ -0,0 +1,164 @@
+"""运行状态快照：进程重启或交接后恢复房间、会话和玩家所在的房间
+
+开启快照（PW_SNAPSHOT_PATH=文件）后，后台任务每隔 SNAPSHOT_INTERVAL 秒把
+内存中的状态写入一个二进制文件，进程正常退出时再写一次。新进程启动时从中恢复，
+房间接着上次的帧继续模拟，玩家在 RESUME_GRACE 秒内重新连接 /ws/{room_id}
+即可回到原来的位置（坐标、血量、击杀数和飞行中的子弹都保留）。
+
+文件格式：HEADER（魔数、格式版本、marshal 版本、写入时间、数据长度、CRC32）
+之后是 zlib 压缩的 marshal 数据。marshal 只能表示基本类型、不会执行代码，
+编解码都比 JSON 快得多；它的格式随 Python 版本变化，版本不一致时不恢复。
+
+采集状态在事件循环中进行，每处理 CAPTURE_BATCH 个房间让出一次。采集结果引用了
+用户等仍在事件循环中被修改的字典，因此 marshal 编码也在事件循环中完成（比深拷贝更快）；
+压缩和写盘在线程池中执行，写入临时文件后原子替换，模拟帧不会等待磁盘。
+"""
+import asyncio
+import logging
+import marshal
+import os
+import struct
+import time
+import zlib
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MAGIC = b"PWSN"
+HEADER = struct.Struct("<4sHHdII")
+SNAPSHOT_INTERVAL = 10.0  # 定时快照的间隔（秒），进程崩溃时最多丢失这么久的状态
+MAX_SNAPSHOT_AGE = 300  # 超过这么久（秒）的快照不再恢复，房间里的玩家早已离开
+RESUME_GRACE = 30  # 恢复后等待玩家重新连接的时间（秒），超时仍未连接的玩家离开房间
+CAPTURE_BATCH = 64  # 采集时每处理这么多个房间让出一次事件循环
+
+
+class SnapshotError(Exception):
+    """快照文件损坏或版本不兼容"""
+
+
+async def capture(rooms: Dict, sessions, user_rooms: Dict[str, str],
+                  users: Optional[Dict[str, Dict]] = None) -> Dict:
+    """采集需要恢复的状态；users 只在持久化存储不保存用户（memory）时需要"""
+    room_states = []
+    for i, room in enumerate(list(rooms.values())):
+        if i and i % CAPTURE_BATCH == 0:
+            await asyncio.sleep(0)
+        room_states.append(room.snapshot())
+    state = {
+        "rooms": room_states,
+        "sessions": [(token, session["username"], session["created_at"])
+                     for token, session in sessions.tokens.items()],
+        "user_rooms": dict(user_rooms)
+    }
+    if users is not None:
+        state["users"] = users
+    return state
+
+
+def encode(state: Dict, created_at: float) -> bytes:
+    return pack(marshal.dumps(state), created_at)
+
+
+def pack(raw: bytes, created_at: float) -> bytes:
+    """压缩 marshal 编码后的状态并加上文件头，只处理 bytes，可以在线程池中执行"""
+    payload = zlib.compress(raw, 1)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, marshal.version, created_at,
+                       len(payload), zlib.crc32(payload)) + payload
+
+
+def decode(data: bytes):
+    """返回 (写入时间, 状态)"""
+    if len(data) < HEADER.size:
+        raise SnapshotError("文件不完整")
+    magic, version, marshal_version, created_at, length, crc = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError("不是快照文件")
+    if version != FORMAT_VERSION or marshal_version != marshal.version:
+        raise SnapshotError(f"不兼容的快照版本: {version}/{marshal_version}")
+    payload = data[HEADER.size:]
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        raise SnapshotError("数据校验失败")
+    return created_at, marshal.loads(zlib.decompress(payload))
+
+
+def write_file(path: str, data: bytes):
+    """先写临时文件再原子替换，写到一半崩溃不会破坏上一份快照"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_file(path: str, max_age: float = MAX_SNAPSHOT_AGE) -> Optional[Dict]:
+    """读取快照；文件不存在、损坏、版本不兼容或过旧时返回 None"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        created_at, state = decode(data)
+    except (SnapshotError, ValueError, EOFError, zlib.error) as e:
+        logger.warning(f"{path}: 无法读取快照（{e}），不恢复")
+        return None
+    age = time.time() - created_at
+    if age > max_age:
+        logger.warning(f"{path}: 快照已过去 {age:.0f} 秒，不恢复")
+        return None
+    return state
+
+
+class SnapshotWriter:
+    """定时把 capture 的结果写入快照文件"""
+
+    def __init__(self, path: str, capture: Callable[[], Awaitable[Dict]],
+                 interval: float = SNAPSHOT_INTERVAL):
+        self.path = path
+        self.capture = capture
+        self.interval = interval
+        self.saves = 0
+        self.bytes_written = 0
+        self.last_save = 0.0
+        self.capture_seconds = 0.0  # 上一次在事件循环中采集和编码状态的耗时
+        self.write_seconds = 0.0  # 上一次压缩和写盘的耗时（线程池）
+        self._lock = asyncio.Lock()
+
+    async def save(self) -> bool:
+        """写入一份快照，失败时记录日志并返回 False"""
+        async with self._lock:
+            start = time.perf_counter()
+            state = await self.capture()
+            # 在事件循环中编码，交给线程池的只有不可变的 bytes
+            raw = marshal.dumps(state)
+            captured = time.perf_counter()
+            now = time.time()
+            try:
+                data = await asyncio.to_thread(pack, raw, now)
+                await asyncio.to_thread(write_file, self.path, data)
+            except Exception as e:
+                logger.error(f"Snapshot write error ({self.path}): {e}")
+                return False
+            self.capture_seconds = captured - start
+            self.write_seconds = time.perf_counter() - captured
+            self.saves += 1
+            self.bytes_written = len(data)
+            self.last_save = now
+            return True
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save()
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "saves": self.saves,
+            "bytes": self.bytes_written,
+            "last_save": self.last_save,
+            "capture_ms": round(self.capture_seconds * 1000, 3),
+            "write_ms": round(self.write_seconds * 1000, 3)
+        }
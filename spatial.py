@@ -0,0 +1,79 @@
+from typing import Dict, List
+
+
+class UniformGrid:
+    """地图上的均匀网格索引
+
+    每帧重建一次，只存放对象在源列表中的下标。查询时只遍历
+    查询圆覆盖的格子，并按下标升序返回，保证结果顺序与逐个
+    遍历源列表时一致。
+    """
+
+    def __init__(self, width: float, height: float, cell_size: float = 64):
+        self.cell_size = cell_size
+        self.cols = int(width // cell_size) + 1
+        self.rows = int(height // cell_size) + 1
+        self.cells: Dict[int, List[int]] = {}
+
+    def rebuild(self, items: List[dict]):
+        self.rebuild_points([item["x"] for item in items], [item["y"] for item in items])
+
+    def rebuild_points(self, xs: List[float], ys: List[float]):
+        """按坐标列表重建，下标与列表下标一致"""
+        cs = self.cell_size
+        cols = self.cols
+        max_cx = cols - 1
+        max_cy = self.rows - 1
+        cells = {}
+        for i, (x, y) in enumerate(zip(xs, ys)):
+            cx = int(x // cs)
+            cy = int(y // cs)
+            # 越界对象归入边缘格子
+            if not (0 <= cx <= max_cx and 0 <= cy <= max_cy):
+                cx = min(max(cx, 0), max_cx)
+                cy = min(max(cy, 0), max_cy)
+            key = cy * cols + cx
+            bucket = cells.get(key)
+            if bucket is None:
+                cells[key] = [i]
+            else:
+                bucket.append(i)
+        self.cells = cells
+
+    def key(self, x: float, y: float) -> int:
+        """(x, y) 所在格子的键，越界时取边缘格子，与 rebuild 一致"""
+        cx = min(max(int(x // self.cell_size), 0), self.cols - 1)
+        cy = min(max(int(y // self.cell_size), 0), self.rows - 1)
+        return cy * self.cols + cx
+
+    def keys(self, x: float, y: float, radius: float) -> List[int]:
+        """(x, y) 半径 radius 覆盖的所有格子的键"""
+        cs = self.cell_size
+        x0 = max(int((x - radius) // cs), 0)
+        x1 = min(int((x + radius) // cs), self.cols - 1)
+        y0 = max(int((y - radius) // cs), 0)
+        y1 = min(int((y + radius) // cs), self.rows - 1)
+        cols = self.cols
+        return [cy * cols + cx for cy in range(y0, y1 + 1) for cx in range(x0, x1 + 1)]
+
+    def query(self, x: float, y: float, radius: float) -> List[int]:
+        """返回可能落在 (x, y) 半径 radius 内的对象下标（升序）"""
+        if not self.cells:
+            return []
+
+        cs = self.cell_size
+        x0 = max(int((x - radius) // cs), 0)
+        x1 = min(int((x + radius) // cs), self.cols - 1)
+        y0 = max(int((y - radius) // cs), 0)
+        y1 = min(int((y + radius) // cs), self.rows - 1)
+
+        found = []
+        cells = self.cells
+        for cy in range(y0, y1 + 1):
+            base = cy * self.cols
+            for cx in range(x0, x1 + 1):
+                bucket = cells.get(base + cx)
+                if bucket:
+                    found.extend(bucket)
+        found.sort()
+        return found
@@ -0,0 +1,92 @@
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Optional, Set
+
+from outbox import Outbox
+
+SPECTATOR_RATE = 10  # 观战画面的帧率
+SPECTATOR_DELAY = 0.0  # 观战画面比实际延后的秒数，防止观战者给场上的玩家报点
+MAX_SPECTATORS = 500  # 每个房间最多的观战连接数
+
+
+class SpectatorStream:
+    """单个房间的观战广播
+
+    观战者不占用玩家名额，也不在 Room.connections 中。模拟帧完全不知道观战者的存在：
+    广播任务按 rate 自己读取房间当前的完整状态（与 json 协议共用每帧一次的序列化结果），
+    加上消息类型后放入延迟队列，到期的最新一帧原样放入每个观战者的发送队列，
+    所有观战者共享同一个字符串。房间没有变化（空闲、休眠）时不发送。
+    最后一个观战者离开后广播任务结束。
+    """
+
+    def __init__(self, room, rate: float = SPECTATOR_RATE, delay: float = SPECTATOR_DELAY,
+                 max_spectators: int = MAX_SPECTATORS):
+        self.room = room
+        self.interval = 1.0 / rate
+        self.delay = delay
+        self.max_spectators = max_spectators
+        self.outboxes: Set[Outbox] = set()
+        self.frames = deque(maxlen=int(delay * rate) + 2)  # [(采集时间, 消息)]，等待延迟到期
+        self.latest: Optional[str] = None  # 最近一次广播的消息，新的观战者先收到它
+        self.frames_sent = 0
+        self._captured_tick = -1
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self.outboxes)
+
+    def full(self) -> bool:
+        return len(self.outboxes) >= self.max_spectators
+
+    def add(self, outbox: Outbox):
+        self.outboxes.add(outbox)
+        if self.latest is not None:
+            outbox.push_state(self.latest)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def remove(self, outbox: Outbox):
+        self.outboxes.discard(outbox)
+
+    def _capture(self, now: float):
+        room = self.room
+        if room.tick == self._captured_tick:
+            return
+        self._captured_tick = room.tick
+        # state_json() 以 "{" 开头，直接拼接出带类型的消息，不再序列化一次
+        self.frames.append((now, '{"type":"spectate",' + room.state_json()[1:]))
+
+    def _due(self, now: float) -> Optional[str]:
+        message = None
+        while self.frames and self.frames[0][0] <= now - self.delay:
+            message = self.frames.popleft()[1]
+        return message
+
+    async def _run(self):
+        while self.outboxes:
+            now = time.monotonic()
+            if self.room.players:
+                self._capture(now)
+            message = self._due(now)
+            if message is not None:
+                self.latest = message
+                self.frames_sent += 1
+                for outbox in list(self.outboxes):
+                    outbox.push_state(message)
+            await asyncio.sleep(self.interval)
+
+    async def close(self, code: int = 4200, reason: str = "Room closed"):
+        """房间删除时断开所有观战者"""
+        outboxes, self.outboxes = list(self.outboxes), set()
+        for outbox in outboxes:
+            await outbox.close(code=code, reason=reason)
+        if self._task is not None:
+            self._task.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            "spectators": len(self.outboxes),
+            "frames_sent": self.frames_sent,
+            "dropped": sum(outbox.dropped for outbox in self.outboxes)
+        }
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STAT_FIELDS = ("games_played", "wins", "kills", "deaths", "total_damage")
+FLUSH_INTERVAL = 1.0  # 统计写回间隔（秒），崩溃时最多丢失这么久的统计
+
+
+def empty_stats() -> Dict[str, int]:
+    return {field: 0 for field in STAT_FIELDS}
+
+
+class Storage:
+    """持久化接口，本身不保存任何数据（纯内存模式）"""
+
+    def load_users(self) -> Dict:
+        return {}
+
+    def load_sessions(self) -> Dict:
+        return {}
+
+    def get_session(self, token: str) -> Optional[Dict]:
+        return None
+
+    def load_stats(self) -> Dict[str, Dict[str, int]]:
+        return {}
+
+    def get_user(self, username: str) -> Optional[Dict]:
+        return None
+
+    def add_user(self, username: str, user: Dict):
+        pass
+
+    def update_password(self, username: str, password_hash: str):
+        pass
+
+    def add_session(self, token: str, session: Dict):
+        pass
+
+    def delete_sessions(self, tokens):
+        pass
+
+    def apply_stats(self, deltas: Dict[str, Dict[str, int]]):
+        pass
+
+    def clear(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage(Storage):
+    """SQLite（WAL 模式）持久化
+
+    所有方法都是同步的，由调用方放到线程池中执行，
+    避免磁盘 IO 阻塞事件循环。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                username TEXT PRIMARY KEY,
+                password_hash TEXT NOT NULL,
+                email TEXT,
+                created_at REAL,
+                games_played INTEGER NOT NULL DEFAULT 0,
+                wins INTEGER NOT NULL DEFAULT 0,
+                kills INTEGER NOT NULL DEFAULT 0,
+                deaths INTEGER NOT NULL DEFAULT 0,
+                total_damage INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS sessions (
+                token TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    def load_users(self) -> Dict:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT username, password_hash, email, created_at, "
+                + ", ".join(STAT_FIELDS) + " FROM users"
+            ).fetchall()
+        users = {}
+        for row in rows:
+            username, password_hash, email, created_at = row[:4]
+            users[username] = {
+                "password_hash": password_hash,
+                "email": email,
+                "stats": dict(zip(STAT_FIELDS, row[4:])),
+                "created_at": created_at
+            }
+        return users
+
+    def load_sessions(self) -> Dict:
+        with self.lock:
+            rows = self.conn.execute("SELECT token, username, created_at FROM sessions").fetchall()
+        return {token: {"username": username, "created_at": created_at}
+                for token, username, created_at in rows}
+
+    def get_session(self, token: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute("SELECT username, created_at FROM sessions WHERE token = ?",
+                                    (token,)).fetchone()
+        return {"username": row[0], "created_at": row[1]} if row else None
+
+    def load_stats(self) -> Dict[str, Dict[str, int]]:
+        with self.lock:
+            rows = self.conn.execute("SELECT username, " + ", ".join(STAT_FIELDS) + " FROM users").fetchall()
+        return {row[0]: dict(zip(STAT_FIELDS, row[1:])) for row in rows}
+
+    def get_user(self, username: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT password_hash, email, created_at, " + ", ".join(STAT_FIELDS)
+                + " FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            "password_hash": row[0],
+            "email": row[1],
+            "stats": dict(zip(STAT_FIELDS, row[3:])),
+            "created_at": row[2]
+        }
+
+    def add_user(self, username: str, user: Dict):
+        stats = user["stats"]
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO users (username, password_hash, email, created_at, "
+                + ", ".join(STAT_FIELDS) + ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (username, user["password_hash"], user["email"], user["created_at"],
+                 *(stats[field] for field in STAT_FIELDS))
+            )
+
+    def update_password(self, username: str, password_hash: str):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE users SET password_hash = ? WHERE username = ?",
+                              (password_hash, username))
+
+    def add_session(self, token: str, session: Dict):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sessions (token, username, created_at) VALUES (?, ?, ?)",
+                (token, session["username"], session["created_at"])
+            )
+
+    def delete_sessions(self, tokens):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM sessions WHERE token = ?", [(t,) for t in tokens])
+
+    def apply_stats(self, deltas: Dict[str, Dict[str, int]]):
+        sql = ("UPDATE users SET " + ", ".join(f"{f} = {f} + ?" for f in STAT_FIELDS)
+               + " WHERE username = ?")
+        with self.lock, self.conn:
+            self.conn.executemany(sql, [
+                (*(delta.get(field, 0) for field in STAT_FIELDS), username)
+                for username, delta in deltas.items()
+            ])
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM users")
+            self.conn.execute("DELETE FROM sessions")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def open_storage(backend: str, path: str) -> Storage:
+    if backend == "sqlite":
+        return SQLiteStorage(path)
+    return Storage()
+
+
+class StatsWriteBehind:
+    """统计增量的写回缓冲
+
+    游戏循环只把增量合并进内存中的字典，后台任务每隔
+    flush_interval 秒在线程池中批量写入一次，模拟帧不会等待磁盘。
+    """
+
+    def __init__(self, storage: Storage, flush_interval: float = FLUSH_INTERVAL):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.pending: Dict[str, Dict[str, int]] = {}
+        self.flushes = 0
+        self.last_flush = time.time()
+        self._lock = asyncio.Lock()
+
+    def add(self, username: str, deltas: Dict[str, int]):
+        pending = self.pending.get(username)
+        if pending is None:
+            pending = self.pending[username] = {}
+        for field, amount in deltas.items():
+            pending[field] = pending.get(field, 0) + amount
+
+    def discard(self):
+        self.pending = {}
+
+    async def flush(self):
+        async with self._lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            try:
+                await asyncio.to_thread(self.storage.apply_stats, batch)
+            except Exception as e:
+                logger.error(f"Stats flush error: {e}")
+                # 写入失败时把增量放回缓冲，下次重试
+                for username, deltas in batch.items():
+                    self.add(username, deltas)
+                return
+            self.flushes += 1
+            self.last_flush = time.time()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
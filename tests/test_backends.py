@@ -0,0 +1,53 @@
+"""dict 与 numpy 两个模拟后端的差分测试，以及子弹穿透的回归测试"""
+import pytest
+
+from benchmark import run_scenario
+from game_engine import MAP_HEIGHT, BULLET_SPEED, new_room
+
+
+@pytest.mark.parametrize("tick_rate, hitch_every", [(50, 0), (20, 0), (50, 7)])
+def test_numpy_matches_dict(tick_rate, hitch_every):
+    """同一输入下两个后端逐帧的命中事件和完整状态完全相同"""
+    pytest.importorskip("numpy")
+    dict_room = new_room("diff", "diff", "p0", backend="dict", tick_rate=tick_rate)
+    numpy_room = new_room("diff", "diff", "p0", backend="numpy", tick_rate=tick_rate)
+    frames = zip(run_scenario(dict_room, 1000, seed=1, tick_rate=tick_rate, hitch_every=hitch_every),
+                 run_scenario(numpy_room, 1000, seed=1, tick_rate=tick_rate, hitch_every=hitch_every))
+    total_hits = 0
+    for tick, (expected, actual) in enumerate(frames):
+        assert actual == expected, f"第 {tick} 帧结果不一致"
+        total_hits += len(expected[0])
+    assert total_hits > 0
+
+
+def shoot_past_target(backend: str, target_x: float, hitch: float):
+    """向静止的目标射出一颗子弹，第二帧推进 hitch 秒，返回命中事件"""
+    room = new_room("t", "t", "shooter", max_players=2, backend=backend, seed=1)
+    room.add_player("shooter", None)
+    room.add_player("target", None)
+    y = MAP_HEIGHT / 2
+    room.players["shooter"].update(x=300, y=y)
+    room.players["target"].update(x=target_x, y=y, hp=10 ** 9)
+    room.add_bullet({"owner": "shooter", "x": 480, "y": y, "dx": BULLET_SPEED, "dy": 0,
+                     "max_dist": 1000, "created_at": 1000.0, "start_x": 480, "start_y": y})
+    hits = room.step(1000.02)
+    return hits + room.step(1000.02 + hitch)
+
+
+@pytest.mark.parametrize("backend", ["dict", "numpy"])
+def test_hitch_does_not_tunnel(backend):
+    """50 Hz 房间卡顿一帧时子弹一次飞行 100 像素，终点越过目标也要判定命中"""
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+    # 子弹从 500 飞到 600，终点距目标 45 像素，超出命中半径
+    hits = shoot_past_target(backend, target_x=555, hitch=0.1)
+    assert [(hit["owner"], hit["target"]) for hit in hits] == [("shooter", "target")]
+
+
+@pytest.mark.parametrize("backend", ["dict", "numpy"])
+def test_regular_step_uses_end_point(backend):
+    """正常推进的 50 Hz 帧仍只按终点判定，结果与原来一致"""
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+    # 子弹从 500 飞到 520，没有到达 555 附近
+    assert shoot_past_target(backend, target_x=555, hitch=0.02) == []
@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from leaderboard import SORT_KEYS, LeaderboardIndex, leaderboard_entry
+
+
+def random_stats(rng: random.Random):
+    games = rng.randint(0, 30)
+    return {"kills": rng.randint(0, 20), "deaths": rng.randint(0, 20),
+            "wins": rng.randint(0, games), "games_played": games}
+
+
+def full_sort(stats, sort):
+    """重新排序全部用户的参考实现：分数从高到低，分数相同时按用户名"""
+    return [leaderboard_entry(username, stats[username])
+            for username in sorted(stats, key=lambda u: (-SORT_KEYS[sort](stats[u]), u))]
+
+
+@pytest.mark.parametrize("sort", list(SORT_KEYS))
+def test_index_matches_full_sort(sort):
+    rng = random.Random(7)
+    index = LeaderboardIndex()
+    stats = {}
+    for step in range(2000):
+        username = f"u{rng.randrange(200)}"
+        if step % 17 == 0 and username in stats:
+            index.remove(username)
+            del stats[username]
+            continue
+        stats[username] = random_stats(rng)
+        index.update(username, stats[username])
+
+    expected = full_sort(stats, sort)
+    assert len(index) == len(stats)
+    assert index.page(sort, 0, len(stats)) == expected
+    assert index.page(sort, 10, 25) == expected[10:35]
+    for rank, entry in enumerate(expected, 1):
+        assert index.rank(entry["username"], sort) == rank
+
+
+def test_ties_are_ordered_by_username():
+    index = LeaderboardIndex()
+    for username in ("carol", "alice", "bob"):
+        index.update(username, {"kills": 5, "deaths": 1, "wins": 0, "games_played": 0})
+    assert [entry["username"] for entry in index.page()] == ["alice", "bob", "carol"]
+    assert index.rank("carol") == 3
+
+
+def test_update_moves_user():
+    index = LeaderboardIndex()
+    index.update("alice", {"kills": 1, "deaths": 0, "wins": 0, "games_played": 0})
+    index.update("bob", {"kills": 2, "deaths": 0, "wins": 0, "games_played": 0})
+    assert index.rank("alice") == 2
+    index.update("alice", {"kills": 3, "deaths": 0, "wins": 0, "games_played": 0})
+    assert index.rank("alice") == 1
+    assert [entry["username"] for entry in index.page()] == ["alice", "bob"]
+
+
+def test_remove_and_clear():
+    index = LeaderboardIndex()
+    index.update("alice", {"kills": 1, "deaths": 0, "wins": 0, "games_played": 0})
+    index.remove("alice")
+    index.remove("alice")  # 不在榜上时忽略
+    assert index.rank("alice") is None
+    assert index.page() == []
+    index.update("bob", {"kills": 1, "deaths": 0, "wins": 0, "games_played": 0})
+    index.clear()
+    assert len(index) == 0 and index.page("kd_ratio") == []
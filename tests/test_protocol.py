@@ -0,0 +1,121 @@
+"""二进制协议和 delta 协议的编解码往返测试"""
+import json
+import struct
+
+import pytest
+
+from benchmark import run_scenario
+from game_engine import new_room
+from protocol import decode_input, decode_state, encode_input, encode_state
+
+
+def f32(value: float) -> float:
+    """二进制协议以单精度浮点传输"""
+    return struct.unpack("<f", struct.pack("<f", value))[0]
+
+
+@pytest.mark.parametrize("msg", [
+    {"type": "move", "dx": 4.25, "dy": -6.0},
+    {"type": "shoot", "dx": 12.5, "dy": -15.625, "max_dist": 800.0},
+    {"type": "shoot", "dx": 0.1, "dy": 0.2, "max_dist": 300.0, "tick": 123456},
+    {"type": "respawn"},
+    {"type": "ack", "tick": 42},
+])
+def test_input_round_trip(msg):
+    expected = {key: f32(value) if isinstance(value, float) else value for key, value in msg.items()}
+    assert decode_input(encode_input(msg)) == expected
+
+
+@pytest.mark.parametrize("data", [b"", b"\x09", b"\x01\x00", encode_input({"type": "ack", "tick": 1})[:-1]])
+def test_malformed_input_is_rejected(data):
+    assert decode_input(data) is None
+
+
+def test_non_finite_input_is_rejected():
+    assert decode_input(struct.pack("<Bff", 1, float("nan"), 0.0)) is None
+
+
+def test_state_round_trip():
+    room = new_room("r", "房间", "p0", max_players=8, seed=1)
+    for _, _ in run_scenario(room, 200, seed=3):
+        pass
+    state = room.get_state()
+    decoded = decode_state(encode_state(room))
+
+    assert decoded["tick"] == state["tick"]
+    assert decoded["room_info"] == {"name": "房间", "player_count": len(room.players), "max_players": 8}
+    assert set(decoded["players"]) == set(state["players"])
+    for name, player in decoded["players"].items():
+        source = room.players[name]
+        assert player["x"] == f32(source["x"]) and player["y"] == f32(source["y"])
+        assert player["hp"] == max(0, int(source["hp"]))
+        assert player["status"] == state["players"][name]["status"]
+    assert [(b["x"], b["y"], b["owner"]) for b in decoded["bullets"]] == \
+        [(f32(b["x"]), f32(b["y"]), b["owner"]) for b in state["bullets"]]
+
+
+def test_long_names_are_truncated_on_a_character_boundary():
+    name = "像素" * 100  # 600 字节
+    room = new_room("r", name, name, max_players=2, seed=1)
+    room.add_player(name, None)
+    decoded = decode_state(encode_state(room))
+    assert name.startswith(decoded["room_info"]["name"])
+    assert len(decoded["room_info"]["name"].encode()) <= 255
+    (player_name,) = decoded["players"]
+    assert name.startswith(player_name)
+
+
+class DeltaClient:
+    """按 api.md 描述解码 delta 协议的客户端（与 js/websocket.js 的 DeltaDecoder 一致）"""
+
+    def __init__(self):
+        self.history = {}  # {tick: (clock, players, bullets)}
+
+    def apply(self, msg):
+        if msg["type"] == "keyframe":
+            players = msg["players"]
+            bullets = {bullet["id"]: bullet for bullet in msg["bullets"]}
+        else:
+            base = self.history.get(msg["base"])
+            if base is None:
+                return None
+            _, base_players, base_bullets = base
+            players = dict(base_players)
+            for name, diff in msg.get("players", {}).items():
+                players[name] = {**base_players.get(name, {}), **diff}
+            for name in msg.get("left", []):
+                del players[name]
+            bullets = dict(base_bullets)
+            bullets.update((bullet["id"], bullet) for bullet in msg.get("bullets", []))
+            for bullet_id in msg.get("removed", []):
+                del bullets[bullet_id]
+        self.history[msg["tick"]] = (msg["clock"], players, bullets)
+        return msg["clock"], players, bullets
+
+
+@pytest.mark.parametrize("hitch_every", [0, 5])
+def test_delta_round_trip(hitch_every):
+    """客户端解码出的玩家与服务器一致，子弹按 clock 外推的位置与服务器一致（包括卡顿的帧）"""
+    room = new_room("r", "r", "p0", max_players=8, seed=1)
+    client = DeltaClient()
+    acked = []
+    deltas = 0
+    for tick, _ in enumerate(run_scenario(room, 600, seed=2, hitch_every=hitch_every)):
+        room.delta.capture(room)
+        msg = json.loads(room.delta.encode_for("p0"))
+        deltas += msg["type"] == "delta"
+        clock, players, bullets = client.apply(msg)
+
+        assert players == room.public_players()
+        assert set(bullets) == {bullet["id"] for bullet in room.public_bullets()}
+        for bullet in room.public_bullets():
+            spawn = bullets[bullet["id"]]
+            elapsed = clock - spawn["clock"]
+            assert spawn["x"] + spawn["dx"] * elapsed == pytest.approx(bullet["x"], abs=0.1)
+            assert spawn["y"] + spawn["dy"] * elapsed == pytest.approx(bullet["y"], abs=0.1)
+
+        # 确认晚到两帧，偶尔长时间不确认，让基准超出历史窗口
+        acked.append(msg["tick"])
+        if len(acked) > 2 and tick % 200 < 150:
+            room.delta.ack("p0", acked[-3])
+    assert deltas > 0
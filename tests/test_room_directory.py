@@ -0,0 +1,106 @@
+import pytest
+
+from room_directory import RoomDirectory
+
+
+def summary(i: int, player_count: int = 0, password: bool = False):
+    return {"id": f"room{i}", "name": f"r{i}", "creator": "alice", "player_count": player_count,
+            "max_players": 4, "has_password": password, "created_at": 1000.0 + i}
+
+
+@pytest.fixture
+def directory():
+    directory = RoomDirectory()
+    for i in range(23):
+        directory.update_summary(summary(i, player_count=4 if i % 3 == 0 else 1, password=i % 5 == 0))
+    return directory
+
+
+def all_pages(directory, limit, **filters):
+    rooms, cursor = [], None
+    while True:
+        page = directory.query(cursor, limit, **filters)
+        assert len(page["rooms"]) <= limit
+        rooms.extend(room["id"] for room in page["rooms"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return rooms
+
+
+@pytest.mark.parametrize("limit", [1, 5, 23, 50])
+def test_pages_cover_every_room_newest_first(directory, limit):
+    assert all_pages(directory, limit) == [f"room{i}" for i in reversed(range(23))]
+
+
+@pytest.mark.parametrize("filters, keep", [
+    ({"has_password": True}, lambda i: i % 5 == 0),
+    ({"has_password": False}, lambda i: i % 5 != 0),
+    ({"not_full": True}, lambda i: i % 3 != 0),
+    ({"has_password": False, "not_full": True}, lambda i: i % 5 != 0 and i % 3 != 0),
+])
+def test_filtered_pages(directory, filters, keep):
+    expected = [f"room{i}" for i in reversed(range(23)) if keep(i)]
+    assert all_pages(directory, 4, **filters) == expected
+
+
+def test_cursor_survives_changes_before_it(directory):
+    first = directory.query(None, 5)
+    # 新建的房间排在最前面，删除已经看过的房间，都不影响下一页
+    directory.update_summary(summary(100))
+    directory.remove("room22")
+    second = directory.query(first["next_cursor"], 5)
+    assert [room["id"] for room in second["rooms"]] == [f"room{i}" for i in range(17, 12, -1)]
+
+
+def test_invalid_cursor_starts_from_the_beginning(directory):
+    assert directory.query("garbage", 2)["rooms"] == directory.query(None, 2)["rooms"]
+
+
+def test_cached_result_is_invalidated_on_change(directory):
+    before = directory.query(None, 50, not_full=True)
+    directory.update_summary(summary(1, player_count=4))
+    after = directory.query(None, 50, not_full=True)
+    assert after["version"] == before["version"] + 1
+    assert "room1" in [room["id"] for room in before["rooms"]]
+    assert "room1" not in [room["id"] for room in after["rooms"]]
+
+
+def test_unchanged_summary_keeps_version(directory):
+    version = directory.version
+    directory.update_summary(summary(4, player_count=1))
+    assert directory.version == version
+
+
+def test_etag_depends_on_query_and_version(directory):
+    page1 = directory.query(None, 5)
+    etags = {
+        directory.etag(None, 5),
+        directory.etag(page1["next_cursor"], 5),
+        directory.etag(None, 10),
+        directory.etag(None, 5, has_password=True),
+        directory.etag(None, 5, has_password=False),
+        directory.etag(None, 5, not_full=True),
+    }
+    assert len(etags) == 6
+    assert directory.etag(None, 5) == directory.etag("", 5)
+    etag = directory.etag(None, 5)
+    directory.remove("room0")
+    assert directory.etag(None, 5) != etag
+
+
+def test_drain_changes(directory):
+    directory.drain_changes()
+    assert directory.drain_changes() is None
+    directory.update_summary(summary(1, player_count=2))
+    directory.update_summary(summary(30))
+    directory.remove("room30")
+    directory.remove("room2")
+    changes = directory.drain_changes()
+    assert [room["id"] for room in changes["updated"]] == ["room1"]
+    assert sorted(changes["removed"]) == ["room2", "room30"]
+    assert changes["version"] == directory.version
+
+
+def test_sync_replaces_the_listing(directory):
+    directory.sync([summary(1), summary(50)])
+    assert [room["id"] for room in directory.snapshot()] == ["room50", "room1"]
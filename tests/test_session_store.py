@@ -0,0 +1,66 @@
+from session_store import SessionStore, TOUCH_INTERVAL
+
+
+def test_session_lookup_and_ttl():
+    store = SessionStore(ttl=100)
+    store.add("a", "alice", created_at=1000)
+    assert "a" in store and len(store) == 1
+    assert store.get_username("a", now=1099) == "alice"
+    assert store.get_username("a", now=1100) is None
+    assert store.get_username("missing", now=1000) is None
+
+
+def test_expire_pops_only_due_sessions():
+    store = SessionStore(ttl=100)
+    store.add("a", "alice", created_at=1000)
+    store.add("b", "bob", created_at=1050)
+    store.add("c", "carol", created_at=1010)
+    assert store.expire(now=1009) == []
+    assert sorted(store.expire(now=1110)) == ["a", "c"]
+    assert list(store.tokens) == ["b"]
+    assert store.expire(now=1150) == ["b"]
+    assert len(store) == 0
+
+
+def test_expire_skips_removed_and_replaced_tokens():
+    store = SessionStore(ttl=100)
+    store.add("a", "alice", created_at=1000)
+    store.add("b", "bob", created_at=1000)
+    store.remove("a")
+    # 同一个 token 重新登记后按新的创建时间过期，堆里旧的条目被跳过
+    store.add("b", "bob", created_at=1080)
+    assert store.expire(now=1100) == []
+    assert store.get_username("b", now=1100) == "bob"
+    assert store.expire(now=1180) == ["b"]
+
+
+def test_online_users_window():
+    store = SessionStore(online_window=300)
+    store.touch("alice", now=1000)
+    store.touch("bob", now=1100)
+    store.touch("carol", now=1200)
+    assert store.online_users(now=1250) == ["alice", "bob", "carol"]
+    # 再次活动的用户移到末尾，不会随最早的活动被淘汰
+    store.touch("alice", now=1290)
+    assert store.online_users(now=1350) == ["bob", "carol", "alice"]
+    assert store.online_users(now=1450) == ["carol", "alice"]
+    assert store.online_users(now=1600) == []
+
+
+def test_touch_is_rate_limited():
+    store = SessionStore(online_window=300)
+    store.touch("alice", now=1000)
+    store.touch("alice", now=1000 + TOUCH_INTERVAL / 2)
+    assert store._last_seen["alice"] == 1000
+    store.touch("alice", now=1000 + TOUCH_INTERVAL)
+    assert store._last_seen["alice"] == 1000 + TOUCH_INTERVAL
+
+
+def test_clear():
+    store = SessionStore()
+    store.add("a", "alice", created_at=1000)
+    store.touch("alice", now=1000)
+    store.clear()
+    assert len(store) == 0
+    assert store.expire(now=10 ** 9) == []
+    assert store.online_users(now=1000) == []